@@ -0,0 +1,71 @@
+"""
+Startup-time budget of the tomos cli.
+
+Runs common command lines with "python -X importtime", and reports the time spent
+importing modules (and the wall time of the whole process). Exits with an error if the
+import time of any of them exceeds its budget.
+
+Usage:
+    python -m benchmarks.cli_startup [repetitions]
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+SOURCE = Path(__file__).parent.parent / "demo" / "ayed2_examples" / "types_simple.ayed"
+
+# name -> (cli arguments, import time budget in ms)
+COMMAND_LINES = {
+    "parse only": (["--no-run", "--no-final-state"], 175),
+    "run": ([], 200),
+    "run, save state": (["--save-state={tmp}/state.st"], 200),
+    "show ast": (["--no-run", "--showast", "--no-final-state"], 225),
+}
+
+
+def import_time_ms(stderr):
+    # Sum of the cumulative times of modules imported at top level (not by other modules)
+    total = 0
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit() and not name[1:].startswith(" "):
+            total += int(cumulative)
+    return total / 1000
+
+
+def run(args, tmp):
+    args = [arg.format(tmp=tmp) for arg in args]
+    command = [sys.executable, "-X", "importtime", "-m", "tomos.ui.cli", str(SOURCE), *args]
+    env = dict(os.environ, TOMOS_CACHE_DIR=tmp)
+    start = time.perf_counter()
+    result = subprocess.run(command, env=env, capture_output=True, text=True, check=True)
+    return import_time_ms(result.stderr), (time.perf_counter() - start) * 1000
+
+
+def main():
+    repetitions = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    over_budget = []
+    print(f"Median of {repetitions} runs (caches warmed up first):")
+    print(f"    {'command line':18} {'imports':>10} {'budget':>8} {'wall':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, (args, budget) in COMMAND_LINES.items():
+            run(args, tmp)
+            imports, wall = zip(*[run(args, tmp) for _ in range(repetitions)])
+            imports, wall = statistics.median(imports), statistics.median(wall)
+            print(f"    {name:18} {imports:7.1f} ms {budget:5d} ms {wall:7.1f} ms")
+            if imports > budget:
+                over_budget.append(name)
+    if over_budget:
+        print(f"Import time over budget: {', '.join(over_budget)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Steps per second of each execution engine, running a while-heavy loop without hooks.
+
+Usage:
+    python -m benchmarks.engines [iterations]
+"""
+
+import sys
+import time
+from unittest import mock
+
+from tomos.ayed2.parser import parser
+from tomos.ayed2.ast.types import type_registry
+from tomos.ayed2.evaluation.interpreter import ENGINES, Interpreter
+from tomos.ayed2.evaluation.limits import LIMITER
+
+PROGRAM = """
+var i: int
+var total: int
+var a: array [10] of int
+i := 0
+total := 0
+while i < {} do
+    a[i % 10] := i * 2
+    total := total + a[i % 10]
+    i := i + 1
+od
+"""
+
+
+def steps_per_second(engine, iterations):
+    type_registry.reset()
+    interpreter = Interpreter(parser.parse(PROGRAM.format(iterations)), engine=engine)
+    start = time.perf_counter()
+    interpreter.run()
+    return interpreter.execution_counter / (time.perf_counter() - start)
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    print(f"Steps per second ({iterations} loop iterations, best of 3):")
+    with mock.patch.dict(LIMITER._limits._settings, {"EXECUTION_STEPS_LIMIT": None}):
+        results = {
+            engine: max(steps_per_second(engine, iterations) for _ in range(3))
+            for engine in ENGINES
+        }
+    for engine, speed in results.items():
+        print(f"    {engine:10} {speed:10,.0f}   x{speed / results['visitor']:.1f}")
+
+
+if __name__ == "__main__":
+    main()
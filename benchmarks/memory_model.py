@@ -0,0 +1,72 @@
+"""
+Memory used by the memory model, measured with tracemalloc.
+
+Declares an array of tuples on a fresh state, and reports bytes per cell (basic cells
+and the clusters that group them count as the cells they hold):
+  - of the declared variable,
+  - of a snapshot of the state (what RememberState keeps for every step),
+and the time a snapshot takes. Also, the bytes of each trace record (a Frame with its
+StateDiff).
+
+Usage:
+    python -m benchmarks.memory_model [number_of_elements]
+"""
+
+import sys
+import timeit
+import tracemalloc
+
+from tomos.ayed2.parser import parser
+from tomos.ayed2.ast.types import type_registry
+from tomos.ayed2.evaluation.state import State
+from tomos.ui.interpreter_hooks import Frame, StateDiff
+
+DECLARATIONS = """
+type point = tuple
+    x: int
+    y: real
+    visited: bool
+    next: pointer of int
+end tuple
+var points: array [{}] of point
+"""
+FRAMES = 10_000
+
+
+def allocated_bytes(build):
+    # Bytes still allocated after calling build (its result is kept alive meanwhile)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return after - before, result
+
+
+def main():
+    elements = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    type_registry.reset()
+    program = parser.parse(DECLARATIONS.format(elements))
+    declaration = next(iter(program.body))
+    state = State()
+
+    def declare():
+        state.declare_static_variable("points", declaration.var_type)
+
+    declared, _ = allocated_bytes(declare)
+    cells = state.stack_cell_count
+    snapshot, _ = allocated_bytes(state.snapshot)
+    seconds = min(timeit.repeat(state.snapshot, number=20, repeat=5)) / 20
+    frames, _ = allocated_bytes(
+        lambda: [Frame(n, None, None, {}, StateDiff([], [], []), None) for n in range(FRAMES)]
+    )
+
+    print(f"array of {elements} tuples, {cells} cells:")
+    print(f"    declared variable   {declared / cells:7.1f} bytes per cell")
+    print(f"    state snapshot      {snapshot / cells:7.1f} bytes per cell")
+    print(f"    snapshot time       {seconds / cells * 1e6:7.2f} us per cell")
+    print(f"    trace record        {frames / FRAMES:7.1f} bytes per Frame & StateDiff")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Benchmark of the time it takes a fresh process to get a parser.
+
+Each case runs on a new python process (as the cli does), and the wall time of the
+whole process is measured:
+  - importing tomos.ayed2.parser, without building the parser (it's built lazily),
+  - building the parser without cache (analyzing the grammar, as every process used to),
+  - building it with an empty cache dir (analyzing the grammar, and saving the tables),
+  - building it with the cache already saved (loading the tables),
+  - parsing a program, and getting it from the cache of parsed programs instead.
+
+Usage:
+    python -m benchmarks.parser_startup [repetitions]
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+SOURCE = Path(__file__).parent.parent / "demo" / "ayed2_examples" / "types_tuples.ayed"
+PARSE = "from tomos.ayed2.parser.ast_cache import parse_program\n"
+PARSE += "parse_program(open({!r}).read(), {})"
+
+# name -> (code, whether it runs once first, to warm the cache up)
+CASES = {
+    "python startup only": ("pass", False),
+    "import, lazy parser": ("import tomos.ayed2.parser", False),
+    "build, no cache": (
+        "from tomos.ayed2.parser import build_parser; build_parser(cache=False)",
+        False,
+    ),
+    "build, cold cache": ("from tomos.ayed2.parser import parser", False),
+    "build, warm cache": ("from tomos.ayed2.parser import parser", True),
+    "parse, warm tables": (PARSE.format(str(SOURCE), "cache=False"), True),
+    "parse, cached program": (PARSE.format(str(SOURCE), "cache=True"), True),
+}
+
+
+def run(code, cache_dir):
+    env = dict(os.environ, TOMOS_CACHE_DIR=cache_dir)
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", code], env=env, check=True)
+    return time.perf_counter() - start
+
+
+def measure(code, warm_up, repetitions):
+    timings = []
+    for _ in range(repetitions):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            if warm_up:
+                run(code, cache_dir)
+            timings.append(run(code, cache_dir))
+    return timings
+
+
+def main():
+    repetitions = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    print(f"Wall time of a fresh process (min / median of {repetitions}):")
+    for name, (code, warm_up) in CASES.items():
+        timings = measure(code, warm_up, repetitions)
+        best, median = min(timings) * 1000, statistics.median(timings) * 1000
+        print(f"    {name:22} {best:7.1f} ms / {median:7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
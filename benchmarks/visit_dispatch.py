@@ -0,0 +1,71 @@
+"""
+Micro-benchmark of the per-visit overhead of NodeVisitor dispatching.
+
+Compares the cached dispatch table against resolving the handler on every
+visit (CamelCase -> snake_case regex + getattr), which is how NodeVisitor
+used to work.
+
+Usage:
+    python -m benchmarks.visit_dispatch [number_of_visits]
+"""
+
+import sys
+import timeit
+
+from tomos.ayed2.parser.token import Token  # first, to avoid circular imports
+from tomos.ayed2.ast.expressions import IntegerLiteral
+from tomos.ayed2.ast.operators import BinaryOp
+from tomos.ayed2.evaluation.expressions import ExpressionEvaluator
+from tomos.visit import NodeVisitor
+
+
+class UncachedExpressionEvaluator(ExpressionEvaluator):
+    def get_handler(self, _type):
+        name = NodeVisitor.get_visit_name_from_type(self, _type)
+        return getattr(self, name, self.generic_visit)
+
+
+def build_expression(depth):
+    # ((1 + 1) + 1) + ... with "depth" additions. 2 * depth + 1 nodes.
+    expr = IntegerLiteral(Token("INT", "1"))
+    for _ in range(depth):
+        expr = BinaryOp(expr, Token("TERM_SYMBOL", "+"), IntegerLiteral(Token("INT", "1")))
+    return expr
+
+
+def per_visit_ns(evaluator, expr, nodes, number):
+    seconds = min(timeit.repeat(lambda: evaluator.eval(expr, None), number=number, repeat=5))
+    return seconds / (number * nodes) * 1e9
+
+
+def handler_lookup_ns(evaluator, number):
+    _type = BinaryOp
+    seconds = min(timeit.repeat(lambda: evaluator.get_handler(_type), number=number, repeat=5))
+    return seconds / number * 1e9
+
+
+def report(title, before, after):
+    print(title)
+    print(f"    uncached: {before:8.1f} ns")
+    print(f"    cached:   {after:8.1f} ns")
+    print(f"    speedup:  {before / after:8.2f}x")
+
+
+def main():
+    visits = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    depth = 50
+    nodes = 2 * depth + 1
+    expr = build_expression(depth)
+
+    before = handler_lookup_ns(UncachedExpressionEvaluator(), visits)
+    after = handler_lookup_ns(ExpressionEvaluator(), visits)
+    report("Handler resolution (per visit):", before, after)
+
+    number = max(1, visits // nodes)
+    before = per_visit_ns(UncachedExpressionEvaluator(), expr, nodes, number)
+    after = per_visit_ns(ExpressionEvaluator(), expr, nodes, number)
+    report("Full expression evaluation (per visited node):", before, after)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+import os
+import tempfile
+import time
+from pathlib import Path
+from unittest import TestCase, mock
+
+from tomos.ayed2.parser.ast_cache import ASTCache, code_fingerprint, parse_program
+from tomos.ayed2.ast.types import Enum, type_registry
+from tomos.ayed2.evaluation.interpreter import Interpreter
+
+from .test_integration import (
+    ExpectedTraceback,
+    integrations_folder,
+    list_test_files,
+    split_code_and_expectation,
+    state_as_python_dict,
+)
+
+
+class TestASTCache(TestCase):
+
+    def setUp(self):
+        type_registry.reset()
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        self.cache_dir = Path(cache_dir.name) / "ast"
+        patcher = mock.patch.dict("os.environ", {"TOMOS_CACHE_DIR": cache_dir.name})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        type_registry.reset()
+        super().tearDown()
+
+    def entries(self):
+        return sorted(self.cache_dir.glob("*.ast"))
+
+    def parse_twice(self, code):
+        parse_program(code)
+        type_registry.reset()
+        with mock.patch("tomos.ayed2.parser.ast_cache.parse_logging_getenv") as parse:
+            program = parse_program(code)
+        parse.assert_not_called()
+        return program
+
+    def test_cached_programs_run_the_same(self):
+        for file_path in list_test_files(integrations_folder):
+            code, expected = split_code_and_expectation(file_path)
+            if isinstance(expected, ExpectedTraceback):
+                continue
+            with self.subTest(file=file_path.name):
+                type_registry.reset()
+                expected_state = Interpreter(parse_program(code, cache=False)).run()
+                type_registry.reset()
+                final_state = Interpreter(self.parse_twice(code)).run()
+                # compared as text: enum constants of different parsings are different objects
+                self.assertEqual(
+                    repr(state_as_python_dict(final_state)),
+                    repr(state_as_python_dict(expected_state)),
+                )
+
+    def test_declared_types_are_registered(self):
+        code = "type color = enumerate Red Green end enumerate\nvar c: color\nc := Green\n"
+        program = self.parse_twice(code)
+        color = type_registry.get_type_factory("color")
+        self.assertIsInstance(color, Enum)
+        self.assertIs(next(iter(program.body)).var_type, color)
+        self.assertIs(type_registry.get_enum_constant("Green").enum, color)
+
+    def test_long_programs(self):
+        code = "var x: int\nx := 0\n" + "x := x + 1\n" * 3000
+        program = self.parse_twice(code)
+        sentences = list(program.body)
+        self.assertEqual(len(sentences), 3002)
+        self.assertTrue(all(a.next_instruction is b for a, b in zip(sentences, sentences[1:])))
+
+    def test_getenv_inputs_are_part_of_the_key(self):
+        code = 'var n: int\nn := getenv("TOMOS_TEST_N":int)\n'
+        results = []
+        for value in ["3", "4", "3"]:
+            type_registry.reset()
+            with mock.patch.dict("os.environ", {"TOMOS_TEST_N": value}):
+                final_state = Interpreter(parse_program(code)).run()
+            results.append(final_state.stack["n"].value)
+        self.assertEqual(results, [3, 4, 3])
+
+    def test_nothing_cached_with_user_types_already_registered(self):
+        parse_program("type t = tuple a: int end tuple\n")
+        self.assertEqual(len(self.entries()), 1)
+        parse_program("var x: t\n")
+        self.assertEqual(len(self.entries()), 1)
+
+    def test_no_cache(self):
+        parse_program("var x: int\n", cache=False)
+        self.assertEqual(self.entries(), [])
+
+    def test_fingerprint_covers_base_classes(self):
+        fingerprint = code_fingerprint()
+        for module in [
+            "ayed2/ast/program.py",
+            "ayed2/parser/ast_cache.py",
+            "base_classes/dataclasses.py",
+        ]:
+            self.assertIn(f"{module}:", fingerprint)
+
+    def test_corrupted_entries_are_discarded(self):
+        parse_program("var x: int\n")
+        self.entries()[0].write_bytes(b"garbage")
+        type_registry.reset()
+        self.assertEqual(len(list(parse_program("var x: int\n").body)), 1)
+        self.assertNotEqual(self.entries()[0].read_bytes(), b"garbage")
+
+    def test_least_recently_used_are_evicted(self):
+        codes = [f"var x{i}: int\n" for i in range(3)]
+        for code in codes:
+            parse_program(code)
+        sizes = [path.stat().st_size for path in self.entries()]
+        ast_cache = ASTCache(self.cache_dir, max_bytes=sum(sizes) - 1)
+        first, second, third = [ast_cache.path_for(code) for code in codes]
+        now = time.time()
+        for age, path in [(300, first), (200, second), (100, third)]:
+            os.utime(path, (now - age, now - age))
+        ast_cache.load(codes[0])  # first is used again
+        ast_cache.evict()
+        self.assertEqual(self.entries(), sorted([first, third]))
@@ -0,0 +1,167 @@
+import pickle
+from unittest import TestCase, mock
+
+from tomos.ayed2.ast.base import ASTNode
+from tomos.ayed2.ast.types import type_registry
+from tomos.ayed2.parser import parser
+from tomos.ayed2.evaluation.bytecode import (
+    BytecodeCompiler,
+    BytecodeVM,
+    VariablePath,
+    JUMP,
+    JUMP_IF_FALSE,
+    LOAD_NAME,
+    SENTENCE,
+    STORE_NAME,
+    compile_program,
+)
+from tomos.ayed2.evaluation.state import State, UnknownValue
+from tomos.exceptions import TomosRuntimeError
+
+
+LOOP = """
+var acc: int
+acc := 0
+for i := 1 to 3 do
+    acc := acc + i
+od
+"""
+
+WHILE = """
+var n: int
+n := 3
+while n > 0 do
+    n := n - 1
+od
+skip
+"""
+
+ARRAYS = """
+type point = tuple
+    x: int
+end tuple
+var a: array [3] of point
+var i: int
+i := 2
+a[i - 1].x := 4
+a[i].x := a[i - 1].x * 2
+"""
+
+
+class TestBytecodeCompiler(TestCase):
+
+    def tearDown(self) -> None:
+        type_registry.reset()
+        super().tearDown()
+
+    def test_jumps_are_integer_positions(self):
+        code = compile_program(parser.parse(WHILE))
+        jumps = [ins for ins in code.instructions if ins[0] in (JUMP, JUMP_IF_FALSE)]
+        self.assertTrue(jumps)
+        for ins in jumps:
+            target = ins[-1]
+            self.assertIsInstance(target, int)
+            self.assertEqual(code.instructions[target][0], SENTENCE)
+
+    def test_plain_variables_share_slot(self):
+        code = compile_program(parser.parse(WHILE))
+        slots = {ins[2] for ins in code.instructions if ins[0] == LOAD_NAME}
+        slots |= {ins[1] for ins in code.instructions if ins[0] == STORE_NAME}
+        self.assertEqual(len(slots), 1)
+        self.assertEqual(code.variables[slots.pop()].name, "n")
+
+    def test_every_sentence_has_entry_point(self):
+        program = parser.parse(LOOP)
+        code = compile_program(program)
+        self.assertEqual(len(code.entry_points), len(code.sentences))
+        self.assertIn("FOR_CHECK", code.disassemble())
+
+    def test_pickled_bytecode_needs_the_program_attached(self):
+        program = parser.parse(LOOP)
+        code = pickle.loads(pickle.dumps(compile_program(program)))
+        self.assertEqual(code.sentences, [])
+        code.attach_program(program)
+        self.assertEqual(code.entry_points, compile_program(program).entry_points)
+        with self.assertRaises(TomosRuntimeError):
+            code.attach_program(parser.parse(WHILE))
+
+    def test_attaching_a_program_does_not_compile_it(self):
+        program = parser.parse(LOOP)
+        compiled = compile_program(program)
+        code = pickle.loads(pickle.dumps(compiled))
+        with mock.patch.object(BytecodeCompiler, "compile") as compile_mock:
+            code.attach_program(program)
+        compile_mock.assert_not_called()
+        self.assertEqual(code.sentences, compiled.sentences)
+        self.assertEqual(code.expressions, compiled.expressions)
+        self.assertEqual(code.entry_points, compiled.entry_points)
+
+    def test_attaching_a_program_with_same_instructions_but_other_constants(self):
+        code = pickle.loads(pickle.dumps(compile_program(parser.parse(LOOP))))
+        other = parser.parse(LOOP.replace("to 3", "to 4"))
+        self.assertEqual(compile_program(other).instructions, code.instructions)
+        with self.assertRaises(TomosRuntimeError):
+            code.attach_program(other)
+
+    def test_no_ast_nodes_besides_sentences_and_recorded_expressions(self):
+        code = compile_program(parser.parse(ARRAYS))
+        self.assertFalse([c for c in code.constants if isinstance(c, ASTNode)])
+        self.assertTrue(all(isinstance(var, VariablePath) for var in code.variables))
+        arguments = [step.argument for var in code.variables for step in var.traverse_path]
+        # indexes are registers, fields are names
+        self.assertEqual(arguments, [[1], "x", [1], "x", [1], "x"])
+        self.assertIs(type(arguments[1]), str)
+
+
+class TestBytecodeVM(TestCase):
+
+    def tearDown(self) -> None:
+        type_registry.reset()
+        super().tearDown()
+
+    def run_program(self, program, code):
+        vm = BytecodeVM(code)
+        state = State()
+        state.set_expressions_evaluator(vm.expression_evaluator)
+        sentence = next(iter(program.body))
+        steps = 0
+        while sentence is not None:
+            state, sentence = vm.eval(sentence, state)
+            steps += 1
+        return state, steps
+
+    def test_stops_at_sentence_boundaries(self):
+        program = parser.parse(LOOP)
+        state, steps = self.run_program(program, compile_program(program))
+        # 1 declaration, 1 assignment, 4 evaluations of the for, 3 of its body
+        self.assertEqual(steps, 9)
+        self.assertEqual(state.get_variable_value(program.body.var_declarations[0].variable), 6)
+
+    def test_plain_variables_are_not_looked_up_by_name_on_each_access(self):
+        program = parser.parse(WHILE.replace("n := 3", "n := 50"))
+        traversed = []
+        cell_after_traversal = State.cell_after_traversal
+
+        def traversal(state, var, trail=None):
+            traversed.append(var.name)
+            return cell_after_traversal(state, var, trail)
+
+        with mock.patch.object(State, "cell_after_traversal", traversal):
+            state, _ = self.run_program(program, compile_program(program))
+        self.assertEqual(state.stack["n"].value, 0)
+        self.assertEqual(traversed, [])
+
+    def test_runs_unpickled_bytecode(self):
+        program = parser.parse(WHILE)
+        code = pickle.loads(pickle.dumps(compile_program(program)))
+        code.attach_program(program)
+        state, steps = self.run_program(program, code)
+        n = program.body.var_declarations[0].variable
+        self.assertEqual(state.get_variable_value(n), 0)
+
+    def test_runs_unpickled_bytecode_with_indexing(self):
+        program = parser.parse(ARRAYS)
+        code = pickle.loads(pickle.dumps(compile_program(program)))
+        code.attach_program(program)
+        state, _ = self.run_program(program, code)
+        self.assertEqual(state.stack["a"].value, [{"x": UnknownValue}, {"x": 4}, {"x": 8}])
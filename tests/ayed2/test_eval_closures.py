@@ -0,0 +1,170 @@
+from unittest import TestCase
+
+from tomos.ayed2.ast.types import ArrayAxis, ArrayOf, IntType, RealType
+from tomos.ayed2.evaluation.closures import ClosureSentenceEvaluator, ExpressionCompiler
+from tomos.ayed2.evaluation.persistent_state import PersistentState
+from tomos.exceptions import MemoryInfrigementError, TomosTypeError, UndeclaredVariableError
+
+from .factories.state import StateFactory
+from .factories.expressions import (
+    BooleanLiteralFactory,
+    BinaryOpFactory,
+    IntegerLiteralFactory,
+    UnaryOpFactory,
+    VariableFactory,
+)
+from .factories.sentences import AssignmentFactory, IfFactory, WhileFactory
+
+
+def run_compiled(expr, state=None):
+    if state is None:
+        state = StateFactory()
+    return ExpressionCompiler().eval(expr, state)
+
+
+class TestCompiledExpressions(TestCase):
+
+    def test_literal(self):
+        expr = IntegerLiteralFactory(token__value="5")
+        self.assertEqual(run_compiled(expr), 5)
+
+    def test_unary(self):
+        expr = UnaryOpFactory(op_token__value="-", expr=IntegerLiteralFactory(token__value="5"))
+        self.assertEqual(run_compiled(expr), -5)
+
+    def test_binary(self):
+        a = IntegerLiteralFactory(token__value="7")
+        b = IntegerLiteralFactory(token__value="2")
+        for op, expected in [("+", 9), ("-", 5), ("*", 14), ("/", 3.5), ("%", 1), ("<", False)]:
+            expr = BinaryOpFactory(op_token__value=op, left_expr=a, right_expr=b)
+            self.assertEqual(run_compiled(expr), expected)
+
+    def test_lazy_boolean_operators_do_not_eval_right_side(self):
+        true = BooleanLiteralFactory(token__value="true")
+        false = BooleanLiteralFactory(token__value="false")
+        undeclared = VariableFactory()  # would raise if evaluated
+        expr = BinaryOpFactory(op_token__value="||", left_expr=true, right_expr=undeclared)
+        self.assertEqual(run_compiled(expr), True)
+        expr = BinaryOpFactory(op_token__value="&&", left_expr=false, right_expr=undeclared)
+        self.assertEqual(run_compiled(expr), False)
+
+    def test_variable_is_read_at_runtime(self):
+        var = VariableFactory()
+        state = StateFactory()
+        state.declare_static_variable(var.name, IntType)
+        compiler = ExpressionCompiler()
+        compiled = compiler.compile(var)
+        state.set_variable_value(var, 3)
+        self.assertEqual(compiled(state), 3)
+        state.set_variable_value(var, 4)
+        self.assertEqual(compiled(state), 4)
+
+    def test_expressions_are_compiled_once(self):
+        expr = IntegerLiteralFactory(token__value="5")
+        compiler = ExpressionCompiler()
+        self.assertIs(compiler.compile(expr), compiler.compile(expr))
+
+
+def Var(name, index=None):
+    var = VariableFactory(name_token__value=name)
+    if index is not None:
+        var.traverse_append(var.ARRAY_INDEXING, [IntegerLiteralFactory(token__value=index)])
+    return var
+
+
+class TestCompiledVariableAccess(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.compiler = ExpressionCompiler()
+
+    def state_with(self, state_class=StateFactory, **variables):
+        state = state_class()
+        state.set_expressions_evaluator(self.compiler)
+        for name, var_type in variables.items():
+            state.declare_static_variable(name, var_type)
+        return state
+
+    def test_cells_are_resolved_again_when_variables_are_redeclared(self):
+        state = self.state_with(x=IntType())
+        access = self.compiler.compile_access(Var("x"))
+        access.write(state, 3)
+        self.assertEqual(access.read(state), 3)
+        state.undeclare_static_variable("x")
+        state.declare_static_variable("x", RealType())
+        access.write(state, 2.5)
+        self.assertEqual(access.read(state), 2.5)
+        self.assertEqual(state.get_variable_value(Var("x")), 2.5)
+        state.undeclare_static_variable("x")
+        with self.assertRaises(UndeclaredVariableError):
+            access.read(state)
+
+    def test_array_elements(self):
+        state = self.state_with(a=ArrayOf(IntType(), [ArrayAxis(1, 4)]))
+        self.compiler.compile_access(Var("a", "3")).write(state, 7)
+        self.assertEqual(state.get_variable_value(Var("a", "3")), 7)
+        self.assertEqual(self.compiler.compile_access(Var("a", "3")).read(state), 7)
+
+    def test_errors_are_the_ones_of_the_state(self):
+        state = self.state_with(a=ArrayOf(IntType(), [ArrayAxis(0, 3)]), x=IntType())
+        for var, exception in [
+            (Var("a", "3"), TomosTypeError),  # out of bounds
+            (Var("a"), MemoryInfrigementError),  # not a cell with a value
+            (Var("y"), UndeclaredVariableError),
+        ]:
+            with self.subTest(var=str(var)):
+                with self.assertRaises(exception):
+                    state.get_variable_value(var)
+                with self.assertRaises(exception):
+                    self.compiler.compile_access(var).read(state)
+        with self.assertRaises(TomosTypeError):
+            self.compiler.compile_access(Var("x")).write(state, 1.5)
+        state.declare_static_variable("i", IntType(), read_only=True)
+        with self.assertRaises(MemoryInfrigementError):
+            self.compiler.compile_access(Var("i")).write(state, 1)
+
+    def test_writes_are_logged(self):
+        state = self.state_with(a=ArrayOf(IntType(), [ArrayAxis(0, 3)]))
+        state.enable_write_log()
+        self.compiler.compile_access(Var("a", "1")).write(state, 5)
+        self.assertEqual(state.touched_paths(), {"a": [(1,)]})
+
+    def test_copy_on_write_states_keep_their_snapshots(self):
+        state = self.state_with(PersistentState, x=IntType())
+        access = self.compiler.compile_access(Var("x"))
+        access.write(state, 1)
+        snapshot = state.snapshot()
+        access.write(state, 2)
+        self.assertEqual((access.read(snapshot), access.read(state)), (1, 2))
+
+
+class TestClosureSentenceEvaluator(TestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.evaluator = ClosureSentenceEvaluator()
+
+    def test_assignment(self):
+        sentence = AssignmentFactory(expr=IntegerLiteralFactory(token__value="9"))
+        state = StateFactory()
+        state.declare_static_variable(sentence.dest_variable.name, IntType)
+        new_state, next_sent = self.evaluator.eval(sentence, state)
+        self.assertEqual(new_state.get_variable_value(sentence.dest_variable), 9)
+        self.assertIsNone(next_sent)
+
+    def test_if_then_else(self):
+        s_if = IfFactory(guard=BooleanLiteralFactory(token__value="true"))
+        _, next_sent = self.evaluator.eval(s_if, StateFactory())
+        self.assertEqual(next_sent, s_if.then_sentences[0])
+        s_if = IfFactory(guard=BooleanLiteralFactory(token__value="false"))
+        _, next_sent = self.evaluator.eval(s_if, StateFactory())
+        self.assertEqual(next_sent, s_if.else_sentences[0])
+
+    def test_while_records_guard_value(self):
+        s_while = WhileFactory(guard=BooleanLiteralFactory(token__value="false"))
+        any_other_sentence = AssignmentFactory()
+        s_while.next_instruction = any_other_sentence
+        _, next_sent = self.evaluator.eval(s_while, StateFactory())
+        self.assertEqual(next_sent, any_other_sentence)
+        recorded = self.evaluator.flush_intermediate_evaluated_expressions()
+        self.assertEqual(recorded, {s_while.guard: False})
@@ -1,14 +1,31 @@
+from pathlib import Path
 from unittest import TestCase
 
-from tomos.ayed2.ast.types import IntType, BoolType, RealType, CharType, PointerOf, Synonym
+from tomos.ayed2.ast.types import (
+    ArrayAxis,
+    ArrayOf,
+    BoolType,
+    CharType,
+    IntType,
+    PointerOf,
+    RealType,
+    Synonym,
+)
+from tomos.ayed2.evaluation.expressions import ExpressionEvaluator
+from tomos.ayed2.evaluation.limits import LIMITER
+from tomos.ayed2.evaluation.memory import MemoryCell
+from tomos.ayed2.evaluation.persistency import Persist
 from tomos.ayed2.evaluation.state import State, UnknownValue, MemoryAddress
 from tomos.exceptions import (
     AlreadyDeclaredVariableError,
     MemoryInfrigementError,
+    MemoryLimitExceededError,
     TomosTypeError,
     UndeclaredVariableError,
 )
-from .factories.expressions import VariableFactory
+from .factories.expressions import IntegerLiteralFactory, VariableFactory
+
+FIXTURES = Path(__file__).parent / "fixtures"
 
 
 def Var(name):
@@ -113,6 +130,144 @@ class TestEvalStateAllocFree(TestCase):
             state.free(Var("y"))
 
 
+class TestEvalStateCellCounting(TestCase):
+
+    def test_counts_follow_declarations(self):
+        state = State()
+        state.declare_static_variable("x", IntType())
+        state.declare_static_variable("a", ArrayOf(IntType(), [ArrayAxis(0, 5)]))
+        self.assertEqual(state.stack_cell_count, 6)
+        state.undeclare_static_variable("x")
+        self.assertEqual(state.stack_cell_count, 5)
+        self.assertEqual(state.heap_cell_count, 0)
+
+    def test_counts_follow_alloc_and_free(self):
+        state = State()
+        state.declare_static_variable("p", PointerOf(ArrayOf(IntType(), [ArrayAxis(0, 3)])))
+        state.alloc(Var("p"))
+        self.assertEqual(state.heap_cell_count, 3)
+        state.free(Var("p"))
+        self.assertEqual(state.heap_cell_count, 0)
+        self.assertEqual(state.stack_cell_count, 1)
+
+    def test_heap_limit_is_checked_against_count(self):
+        settings = LIMITER._limits._settings
+        previous = settings["MAXIMUM_HEAP_CELLS"]
+        settings["MAXIMUM_HEAP_CELLS"] = 2
+        self.addCleanup(settings.__setitem__, "MAXIMUM_HEAP_CELLS", previous)
+        state = State()
+        for name in "pqr":
+            state.declare_static_variable(name, PointerOf(IntType()))
+        state.alloc(Var("p"))
+        state.alloc(Var("q"))
+        state.free(Var("q"))
+        state.alloc(Var("q"))
+        with self.assertRaises(MemoryLimitExceededError):
+            state.alloc(Var("r"))
+
+
+class TestEvalStateWriteLog(TestCase):
+
+    def test_disabled_by_default(self):
+        state = State()
+        state.declare_static_variable("x", IntType())
+        self.assertIsNone(state.write_log)
+
+    def test_logs_touched_top_level_cells(self):
+        state = State()
+        state.declare_static_variable("x", IntType())
+        state.declare_static_variable("p", PointerOf(IntType()))
+        state.enable_write_log()
+        state.set_variable_value(Var("x"), 1)
+        state.alloc(Var("p"))
+        address = state.get_variable_value(Var("p"))
+        self.assertEqual(state.touched_cells(), ["x", "p", address])
+        state.clear_write_log()
+        deref = Var("p")
+        deref.traverse_append(deref.DEREFERENCE)
+        state.set_variable_value(deref, 3)  # only the heap cell is touched
+        self.assertEqual(state.touched_cells(), [address])
+        state.clear_write_log()
+        state.free(Var("p"))
+        state.undeclare_static_variable("x")
+        self.assertEqual(state.touched_cells(), ["p", address, "x"])
+        self.assertEqual(state.touched_paths(), {})
+
+    def test_logs_paths_of_written_sub_cells(self):
+        state = State()
+        state.set_expressions_evaluator(ExpressionEvaluator())
+        state.declare_static_variable("a", ArrayOf(IntType(), [ArrayAxis(0, 5)]))
+        state.declare_static_variable("p", PointerOf(ArrayOf(IntType(), [ArrayAxis(0, 3)])))
+        state.alloc(Var("p"))
+        address = state.get_variable_value(Var("p"))
+        state.enable_write_log()
+        for idx in ["3", "1", "3"]:
+            indexed = Var("a")
+            index_expr = IntegerLiteralFactory(token__value=idx)
+            indexed.traverse_append(indexed.ARRAY_INDEXING, [index_expr])
+            state.set_variable_value(indexed, 7)
+        deref = Var("p")
+        deref.traverse_append(deref.DEREFERENCE)
+        deref.traverse_append(deref.ARRAY_INDEXING, [IntegerLiteralFactory(token__value="2")])
+        state.set_variable_value(deref, 8)
+        self.assertEqual(state.touched_cells(), ["a", address])
+        self.assertEqual(state.touched_paths(), {"a": [(3,), (1,)], address: [(2,)]})
+        # once touched as a whole, paths are not relevant anymore
+        state.free(Var("p"))
+        self.assertEqual(state.touched_paths(), {"a": [(3,), (1,)]})
+
+
+class TestEvalStateSnapshots(TestCase):
+
+    def test_cells_are_slotted(self):
+        state = State()
+        state.declare_static_variable("a", ArrayOf(IntType(), [ArrayAxis(0, 2)]))
+        cells = [state.stack["a"], *state.stack["a"].sub_cells]
+        for obj in cells + [cell.address for cell in cells]:
+            self.assertFalse(hasattr(obj, "__dict__"), obj)
+
+    def test_snapshot_is_independent(self):
+        state = State()
+        state.declare_static_variable("a", ArrayOf(IntType(), [ArrayAxis(0, 2)]))
+        state.declare_static_variable("p", PointerOf(IntType()))
+        state.alloc(Var("p"))
+        snapshot = state.snapshot()
+        state.stack["a"].sub_cells[1].value = 5
+        self.assertEqual(snapshot.stack["a"].value, [UnknownValue, UnknownValue])
+        self.assertIsNot(snapshot.stack["a"].sub_cells[1], state.stack["a"].sub_cells[1])
+        # addresses never change, so they are shared
+        self.assertIs(snapshot.stack["p"].value, state.stack["p"].value)
+        # neither do types
+        self.assertIs(snapshot.stack["a"].var_type, state.stack["a"].var_type)
+        self.assertIs(
+            snapshot.stack["a"].sub_cells[0].var_type, state.stack["a"].sub_cells[0].var_type
+        )
+        self.assertEqual(list(snapshot.heap), list(state.heap))
+
+    def test_cells_pickled_with_dict_are_loaded(self):
+        # as pickled by older versions, when persisting states
+        address = MemoryAddress.__new__(MemoryAddress)
+        address.__setstate__({"partition": MemoryAddress.STACK, "address": 4})
+        cell = MemoryCell.__new__(MemoryCell)
+        cell.__setstate__(
+            {"address": address, "var_type": IntType(), "read_only": False, "value": 3}
+        )
+        self.assertEqual(cell.value, 3)
+        self.assertEqual(cell.address, MemoryAddress(MemoryAddress.STACK, 4))
+        self.assertIsNone(cell.owner)
+
+    def test_state_persisted_before_cells_were_counted_is_loaded(self):
+        # saved from: arr: array [3] of int; t: pair (a: int, b: array [2] of int);
+        # p: pointer of pair. With arr[1] := 7, t.a := 1, t.b[0] := 2, alloc(p), p->a := 3
+        state = Persist.load_from_file(FIXTURES / "state_before_cell_counts.st")
+        self.assertEqual(state.stack_cell_count, 7)
+        self.assertEqual(state.heap_cell_count, 3)
+        self.assertEqual(state.stack["arr"].value, [UnknownValue, 7, UnknownValue])
+        self.assertEqual(state.stack["t"].value, {"a": 1, "b": [2, UnknownValue]})
+        [pointed] = state.heap.values()
+        self.assertEqual(pointed.value["a"], 3)
+
+
 class TestEvalStateForSynonyms(TestCase):
 
     def test_declare_var_synonym_of_int(self):
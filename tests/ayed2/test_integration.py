@@ -2,6 +2,7 @@ import ast
 import pathlib
 from unittest import TestCase
 
+from tomos.ayed2.ast.types import type_registry
 from tomos.ayed2.ast.types.enum import EnumConstant
 from tomos.ayed2.parser import parser
 from tomos.ayed2.evaluation.interpreter import Interpreter
@@ -52,9 +53,9 @@ def split_code_and_expectation(file_path):
     return code, expect
 
 
-def execute_code(code):
+def execute_code(code, engine="visitor"):
     tree = parser.parse(code)
-    interpreter = Interpreter(tree)
+    interpreter = Interpreter(tree, engine=engine)
     final_state = interpreter.run()
     return final_state
 
@@ -80,9 +81,9 @@ class IntegrationMeta(type):
                 code, expected = split_code_and_expectation(ff)
                 if isinstance(expected, ExpectedTraceback):
                     with self.assertRaises(expected.klass, msg=expected.msg):
-                        execute_code(code)
+                        execute_code(code, self.engine)
                 else:
-                    actual = state_as_python_dict(execute_code(code))
+                    actual = state_as_python_dict(execute_code(code, self.engine))
                     self.assertStackEqual(actual.get("stack", {}), expected.get("stack", {}))
                     self.assertHeapEqual(actual.get("heap", {}), expected.get("heap", {}))
             return test
@@ -94,10 +95,14 @@ class IntegrationMeta(type):
 
 
 class TestIntegrationsRunner(TestCase, metaclass=IntegrationMeta):
+    engine = "visitor"
 
     def setUp(self):
         self.addresses_translation = {}
 
+    def tearDown(self):
+        type_registry.reset()
+
     def assertStackEqual(self, actual, expected):
         self.assertSetEqual(set(actual.keys()), set(expected.keys()))
         for k, v in expected.items():
@@ -160,3 +165,11 @@ class TestIntegrationsRunner(TestCase, metaclass=IntegrationMeta):
         for k, v in expected.items():
             actual_val = translated_actual[k]
             self.assertMemoryEqual(actual_val, v, "heap", k)
+
+
+class TestIntegrationsRunnerClosures(TestIntegrationsRunner):
+    engine = "closures"
+
+
+class TestIntegrationsRunnerBytecode(TestIntegrationsRunner):
+    engine = "bytecode"
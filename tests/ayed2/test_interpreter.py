@@ -0,0 +1,175 @@
+import tempfile
+import time
+from pathlib import Path
+from threading import Thread
+from unittest import TestCase
+
+from tomos.ayed2.ast.types import TypeRegistry, type_registry
+from tomos.ayed2.parser import parser
+from tomos.ayed2.evaluation.interpreter import ENGINES, Interpreter
+from tomos.ayed2.evaluation.persistency import Persist
+
+
+CODE = """
+var n: int
+n := 2
+while n > 0 do
+    n := n - 1
+od
+"""
+
+
+class RecordingHook:
+    def __init__(self, needs_expression_values=True):
+        self.needs_expression_values = needs_expression_values
+        self.calls = []
+
+    def __call__(self, last_sentence, state, expression_values):
+        self.calls.append(dict(expression_values))
+
+
+class TestInterpreterHooks(TestCase):
+
+    def tearDown(self) -> None:
+        type_registry.reset()
+        super().tearDown()
+
+    def test_without_hooks_expressions_are_not_captured(self):
+        for engine in ENGINES:
+            interpreter = Interpreter(parser.parse(CODE), engine=engine)
+            interpreter.run()
+            self.assertFalse(interpreter.sent_evaluator.capture_expressions)
+            self.assertEqual(interpreter.sent_evaluator.intermediate_evaluated_expressions, {})
+            self.assertEqual(interpreter.execution_counter, 7)
+            type_registry.reset()
+
+    def test_hooks_receive_expression_values(self):
+        for engine in ENGINES:
+            hook = RecordingHook()
+            Interpreter(parser.parse(CODE), post_hooks=[hook], engine=engine).run()
+            self.assertEqual(len(hook.calls), 7)
+            self.assertEqual([len(values) for values in hook.calls], [0] + [1] * 6)
+            type_registry.reset()
+
+    def test_hooks_can_opt_out_of_expression_values(self):
+        for engine in ENGINES:
+            hook = RecordingHook(needs_expression_values=False)
+            Interpreter(parser.parse(CODE), post_hooks=[hook], engine=engine).run()
+            self.assertEqual(len(hook.calls), 7)
+            self.assertTrue(all(values == {} for values in hook.calls))
+            type_registry.reset()
+
+
+LOOPS = """
+var acc: int
+var a: array [3] of int
+acc := 0
+for i := 1 to 3 do
+    for j := 1 to i do
+        acc := acc + j
+    od
+od
+a[0] := acc
+"""
+
+
+class TestReentrantProgram(TestCase):
+
+    def tearDown(self) -> None:
+        type_registry.reset()
+        super().tearDown()
+
+    def test_same_program_runs_twice(self):
+        program = parser.parse(LOOPS)
+        for engine in ENGINES:
+            for _ in range(2):
+                state = Interpreter(program, engine=engine).run()
+                self.assertEqual(state.stack["acc"].value, 10)
+                self.assertNotIn("i", state.stack)
+
+    def test_interleaved_runs_of_same_program(self):
+        program = parser.parse(LOOPS)
+        results = []
+
+        class Yield:
+            # forces switching threads on every step
+            def __call__(self, last_sentence, state, expression_values):
+                time.sleep(0)
+
+        def run(engine):
+            interpreter = Interpreter(program, post_hooks=[Yield()], engine=engine)
+            results.append(interpreter.run().stack["acc"].value)
+
+        threads = [Thread(target=run, args=(engine,)) for engine in list(ENGINES) * 3]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [10] * len(threads))
+
+
+ENUMS = """
+type color = enumerate
+    Red
+    Green
+end enumerate
+var c: color
+c := Green
+"""
+
+
+class TestProgramsWithOwnTypeRegistry(TestCase):
+
+    def test_same_types_declared_by_several_programs(self):
+        for engine in ENGINES:
+            registry = TypeRegistry()
+            program = parser.parse(ENUMS, type_registry=registry)
+            state = Interpreter(program, engine=engine, type_registry=registry).run()
+            self.assertEqual(state.stack["c"].value.name, "Green")
+        self.assertNotIn("color", dict(type_registry.list_types()))
+
+    def test_programs_parsed_and_run_in_threads(self):
+        results = []
+
+        def parse_and_run():
+            registry = TypeRegistry()
+            program = parser.parse(ENUMS, type_registry=registry)
+            state = Interpreter(program, engine="closures", type_registry=registry).run()
+            results.append(state.stack["c"].value.name)
+
+        threads = [Thread(target=parse_and_run) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ["Green"] * 4)
+
+
+SAVED = """
+var a: array [3] of int
+var i: int
+i := 1
+a[i] := 5
+"""
+
+
+class TestSavedStates(TestCase):
+    # As --save-state and --load-state do
+
+    def tearDown(self) -> None:
+        type_registry.reset()
+        super().tearDown()
+
+    def test_save_and_load_state(self):
+        for engine in ENGINES:
+            with self.subTest(engine=engine), tempfile.TemporaryDirectory() as tmp:
+                path = Path(tmp) / "state.st"
+                state = Interpreter(parser.parse(SAVED), engine=engine).run()
+                Persist.persist(state, path)
+                type_registry.reset()
+                loaded = Persist.load_from_file(path)
+                self.assertEqual(loaded.stack["a"].value[1], 5)
+                program = parser.parse("a[i + 1] := a[i] + 1\n")
+                final_state = Interpreter(program, engine=engine).run(initial_state=loaded)
+                self.assertEqual(final_state.stack["a"].value[2], 6)
+                type_registry.reset()
@@ -1,7 +1,9 @@
+import tempfile
+from pathlib import Path
 from unittest import TestCase
 from unittest.mock import patch
 
-from tomos.ayed2.parser import parser
+from tomos.ayed2.parser import build_parser, parser
 from tomos.ayed2.parser.reserved_words import KEYWORDS
 from tomos.ayed2.ast.expressions import (
     Expr,
@@ -13,7 +15,7 @@ from tomos.ayed2.ast.expressions import (
     CharLiteral,
 )
 from tomos.ayed2.ast.operators import UnaryOp
-from tomos.ayed2.ast.program import Program, VarDeclaration
+from tomos.ayed2.ast.program import Program, VarDeclaration, verify_program
 from tomos.ayed2.ast.sentences import Sentence, Assignment, If
 from tomos.ayed2.ast.types import (
     IntType,
@@ -28,7 +30,8 @@ from tomos.ayed2.ast.types import (
     Enum,
     Tuple,
 )
-from tomos.exceptions import TomosTypeError
+from tomos.exceptions import TomosSyntaxError, TomosTypeError
+from lark import Lark
 
 from .factories.expressions import IntegerLiteralFactory
 
@@ -542,3 +545,56 @@ class TestParseTuple(TestCase):
         assign_sent = sentences[2]
         self.assertIsInstance(assign_sent, Assignment)
         self.assertIsInstance(assign_sent.expr, CharLiteral)
+
+
+class TestParserCache(TestCase):
+    def setUp(self):
+        type_registry.reset()
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        self.cache_dir = Path(cache_dir.name)
+        patcher = patch.dict("os.environ", {"TOMOS_CACHE_DIR": cache_dir.name})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_tables_are_saved_and_loaded(self):
+        source = "var x: int; x := 1 + 2 * 3;"
+        built = build_parser()
+        self.assertEqual(len(list(self.cache_dir.iterdir())), 1)
+        with patch("lark.lark.Lark._load", autospec=True, side_effect=Lark._load) as load:
+            loaded = build_parser()
+        load.assert_called_once()
+        sentences = [repr(sentence) for sentence in built.parse(source).body]
+        self.assertEqual([repr(sentence) for sentence in loaded.parse(source).body], sentences)
+
+    def test_unusable_cache_dir(self):
+        (self.cache_dir / "tomos").write_text("not a dir")
+        with patch.dict("os.environ", {"TOMOS_CACHE_DIR": str(self.cache_dir / "tomos")}):
+            built = build_parser()
+        self.assertIsInstance(built.parse("var x: int;"), Program)
+
+
+class TestVerifyAST(TestCase):
+    def tearDown(self):
+        type_registry.reset()
+
+    def test_nodes_are_not_validated_when_built(self):
+        declaration = VarDeclaration(variable="x", var_type=3)
+        self.assertEqual(declaration.var_type, 3)
+        self.assertEqual(VarDeclaration.__slots__, ("variable", "var_type"))
+
+    def test_verification_pass(self):
+        program = parser.parse("type t = int\nvar x: t\nskip\nx := 1\n", verify=True)
+        verify_program(program)
+        next(iter(program.body)).var_type = 3
+        with self.assertRaisesRegex(TomosSyntaxError, "VarDeclaration.var_type must be Ayed2Type"):
+            verify_program(program)
+
+    def test_verification_enabled_by_environment(self):
+        code = "var x: int\n"
+        with patch("tomos.ayed2.ast.program.verify_program") as verify:
+            parser.parse(code)
+            verify.assert_not_called()
+            with patch.dict("os.environ", {"TOMOS_VERIFY_AST": "1"}):
+                program = parser.parse(code)
+            verify.assert_called_once_with(program)
@@ -0,0 +1,214 @@
+from unittest import TestCase
+
+from tomos.ayed2.parser import parser
+from tomos.ayed2.ast.types import ArrayAxis, ArrayOf, IntType, PointerOf, type_registry
+from tomos.ayed2.evaluation.expressions import ExpressionEvaluator
+from tomos.ayed2.evaluation.interpreter import Interpreter
+from tomos.ayed2.evaluation.memory import cell_at_path
+from tomos.ayed2.evaluation.persistent_state import PersistentMap, PersistentState
+from tomos.ayed2.evaluation.state import State
+from tomos.ui.interpreter_hooks.remember_state import RememberState, StateDiff
+
+from .factories.expressions import IntegerLiteralFactory, VariableFactory
+from .test_integration import (
+    ExpectedTraceback,
+    integrations_folder,
+    list_test_files,
+    split_code_and_expectation,
+    state_as_python_dict,
+)
+
+
+class CollidingKey:
+    def __init__(self, name):
+        self.name = name
+
+    def __hash__(self):
+        return 42
+
+    def __eq__(self, other):
+        return isinstance(other, CollidingKey) and self.name == other.name
+
+
+class TestPersistentMap(TestCase):
+
+    def test_behaves_like_a_dict(self):
+        pmap, reference = PersistentMap(), {}
+        for i in range(200):
+            pmap[i] = reference[i] = i * 2
+        for i in range(0, 200, 3):
+            del pmap[i]
+            del reference[i]
+        pmap[1] = reference[1] = "updated"
+        self.assertEqual(len(pmap), len(reference))
+        self.assertEqual(pmap.items(), list(reference.items()))  # same order too
+        self.assertNotIn(0, pmap)
+        with self.assertRaises(KeyError):
+            pmap[0]
+        with self.assertRaises(KeyError):
+            del pmap[0]
+
+    def test_copies_are_independent(self):
+        pmap = PersistentMap({"a": 1, "b": 2})
+        other = pmap.copy()
+        other["a"] = 10
+        del other["b"]
+        other["c"] = 3
+        self.assertEqual(dict(pmap.items()), {"a": 1, "b": 2})
+        self.assertEqual(dict(other.items()), {"a": 10, "c": 3})
+
+    def test_order_is_kept_across_copies(self):
+        pmap = PersistentMap({"a": 1, "b": 2})
+        other = pmap.copy()
+        other["a"] = 10
+        self.assertIs(other._keys, pmap._keys)  # updates don't change the order
+        other["c"] = 3
+        del pmap["a"]
+        pmap["a"] = 1
+        self.assertEqual(list(pmap), ["b", "a"])
+        self.assertEqual(list(other), ["a", "b", "c"])
+
+    def test_hash_collisions(self):
+        pmap = PersistentMap()
+        keys = [CollidingKey(n) for n in "abc"]
+        for i, key in enumerate(keys):
+            pmap[key] = i
+        snapshot = pmap.copy()
+        del pmap[keys[1]]
+        self.assertEqual([pmap[keys[0]], pmap[keys[2]]], [0, 2])
+        self.assertNotIn(keys[1], pmap)
+        self.assertEqual(snapshot[keys[1]], 1)
+
+
+def Var(name):
+    return VariableFactory(name_token__value=name)
+
+
+class TestPersistentState(TestCase):
+
+    def test_snapshot_is_not_affected_by_writes(self):
+        state = PersistentState()
+        state.declare_static_variable("x", IntType())
+        state.set_variable_value(Var("x"), 1)
+        snapshot = state.snapshot()
+        state.set_variable_value(Var("x"), 2)
+        state.declare_static_variable("y", IntType())
+        self.assertEqual(snapshot.get_variable_value(Var("x")), 1)
+        self.assertNotIn("y", snapshot.stack)
+        self.assertEqual(state.get_variable_value(Var("x")), 2)
+
+    def test_only_touched_cells_are_copied(self):
+        state = PersistentState()
+        state.declare_static_variable("x", IntType())
+        state.declare_static_variable("y", IntType())
+        snapshot = state.snapshot()
+        state.set_variable_value(Var("x"), 1)
+        self.assertIsNot(state.stack["x"], snapshot.stack["x"])
+        self.assertIs(state.stack["y"], snapshot.stack["y"])
+        # once owned, it's not copied again
+        owned = state.stack["x"]
+        state.set_variable_value(Var("x"), 2)
+        self.assertIs(state.stack["x"], owned)
+
+    def test_heap_after_snapshot(self):
+        state = PersistentState()
+        state.declare_static_variable("p", PointerOf(IntType()))
+        state.alloc(Var("p"))
+        first = state.snapshot()
+        state.free(Var("p"))
+        self.assertEqual(len(first.heap), 1)
+        self.assertEqual(len(state.heap), 0)
+        self.assertNotEqual(first.stack["p"].value, state.stack["p"].value)
+
+    def test_array_element_path_is_copied(self):
+        state = PersistentState()
+        state.declare_static_variable("a", ArrayOf(IntType(), [ArrayAxis(0, 3)]))
+        state.set_expressions_evaluator(ExpressionEvaluator())
+        indexed = Var("a")
+        indexed.traverse_append(indexed.ARRAY_INDEXING, [IntegerLiteralFactory(token__value="1")])
+        state.set_variable_value(indexed, 7)
+        snapshot = state.snapshot()
+        state.set_variable_value(indexed, 8)
+        self.assertEqual(snapshot.stack["a"].value[1], 7)
+        self.assertEqual(state.stack["a"].value[1], 8)
+        self.assertIs(state.stack["a"].sub_cells[0], snapshot.stack["a"].sub_cells[0])
+
+
+class SnapshotEveryStep:
+    # Keeps each snapshot together with its contents at the time it was taken
+    def __init__(self):
+        self.snapshots = []
+
+    def __call__(self, last_sentence, state, expression_values):
+        snapshot = state.snapshot()
+        self.snapshots.append((snapshot, state_as_python_dict(snapshot)))
+
+
+class TestSnapshotsOfIntegrationPrograms(TestCase):
+
+    def tearDown(self) -> None:
+        type_registry.reset()
+        super().tearDown()
+
+    def test_snapshots_do_not_change(self):
+        for file in list_test_files(integrations_folder):
+            code, expected = split_code_and_expectation(file)
+            if isinstance(expected, ExpectedTraceback):
+                continue
+            with self.subTest(program=file.stem):
+                hook = SnapshotEveryStep()
+                program = parser.parse(code)
+                final = Interpreter(program, post_hooks=[hook], state_class=PersistentState).run()
+                type_registry.reset()
+                reference = Interpreter(parser.parse(code)).run()
+                type_registry.reset()
+                # compared as text: enum constants of different parsings are not equal
+                self.assertEqual(
+                    str(state_as_python_dict(final)), str(state_as_python_dict(reference))
+                )
+                for snapshot, contents in hook.snapshots:
+                    self.assertEqual(state_as_python_dict(snapshot), contents)
+
+    def test_diffs_from_write_log_match_full_diffs(self):
+        for file in list_test_files(integrations_folder):
+            code, expected = split_code_and_expectation(file)
+            if isinstance(expected, ExpectedTraceback):
+                continue
+            for state_class in [State, PersistentState]:
+                with self.subTest(program=file.stem, state_class=state_class.__name__):
+                    timeline = RememberState()
+                    program = parser.parse(code)
+                    Interpreter(program, post_hooks=[timeline], state_class=state_class).run()
+                    type_registry.reset()
+                    frames = timeline.timeline
+                    for previous, frame in zip(frames, frames[1:]):
+                        full = StateDiff.create_diff(previous.state, frame.state)
+                        self.assertCountEqual(frame.diff.new_cells, full.new_cells)
+                        if state_class is PersistentState:
+                            self.assertCountEqual(frame.diff.changed_cells, full.changed_cells)
+                        else:
+                            # deepcopied snapshots make enum constants look changed on a full diff
+                            self.assertLessEqual(
+                                set(frame.diff.changed_cells), set(full.changed_cells)
+                            )
+                        self.assertCountEqual(frame.diff.deleted_cells, full.deleted_cells)
+                        for key, paths in frame.diff.changed_paths.items():
+                            before = previous.state.stack.get(key) or previous.state.heap[key]
+                            after = frame.get_cell(key)
+                            changed = [
+                                path
+                                for path in leaf_paths(after)
+                                if str(cell_at_path(before, path).value)
+                                != str(cell_at_path(after, path).value)
+                            ]
+                            self.assertCountEqual(paths, changed)
+
+
+def leaf_paths(cell, path=()):
+    sub_cells = getattr(cell, "sub_cells", None)
+    if sub_cells is None:
+        yield path
+        return
+    keys = sub_cells.keys() if isinstance(sub_cells, dict) else range(len(sub_cells))
+    for key in keys:
+        yield from leaf_paths(sub_cells[key], path + (key,))
@@ -10,7 +10,10 @@ from tomos.ayed2.ast.types import (
     RealType,
     Synonym,
     Enum,
+    TypeRegistry,
+    get_type_registry,
     type_registry,
+    use_type_registry,
 )
 from tomos.ayed2.evaluation.expressions import ExpressionEvaluator
 from tomos.exceptions import TomosTypeError, SynonymError
@@ -89,6 +92,14 @@ class TestArraySizes(TestArray):
         self.assertEqual(at.axes[2].to_value, 12)
         self.assertEqual(at.number_of_elements(), 5 * (15 - 10) * (12 - 8))
 
+    def test_with_evaluated_axes_does_not_modify_type(self):
+        at = _ArrayType("[5, 10..15]")
+        evaluated = at.with_evaluated_axes(ExpressionEvaluator(), StateFactory())
+        self.assertIsNot(evaluated, at)
+        self.assertEqual(evaluated.number_of_elements(), 5 * 5)
+        self.assertFalse(any(axis.is_evaluated for axis in at.axes))
+        self.assertIs(evaluated.with_evaluated_axes(None, None), evaluated)
+
 
 class TestArrayIndexing(TestArray):
 
@@ -187,3 +198,17 @@ class TestTypeRegistry(TestCase):
         type_registry.register_type("some_colors", e1)
         with self.assertRaises(TomosTypeError):
             type_registry.register_type("more_colors", e2)
+
+    def test_global_registry_is_used_by_default(self):
+        self.assertIs(get_type_registry(), type_registry)
+
+    def test_use_type_registry(self):
+        other = TypeRegistry()
+        with use_type_registry(other) as in_use:
+            self.assertIs(in_use, other)
+            self.assertIs(get_type_registry(), other)
+            get_type_registry().register_type("number", Synonym(underlying_type=IntType()))
+            with use_type_registry(None) as still_in_use:
+                self.assertIs(still_in_use, other)
+        self.assertIs(get_type_registry(), type_registry)
+        self.assertNotIn("number", dict(type_registry.list_types()))
@@ -0,0 +1,45 @@
+from unittest import TestCase
+
+from tomos.visit import NodeVisitor, VisitError
+
+
+class FirstNode:
+    pass
+
+
+class SecondNode:
+    pass
+
+
+class SampleVisitor(NodeVisitor):
+    def visit_first_node(self, node, **kw):
+        return "first"
+
+
+class RenamingVisitor(SampleVisitor):
+    def get_visit_name_from_type(self, _type):
+        return "visit_first_node"
+
+
+class TestNodeVisitorDispatch(TestCase):
+
+    def test_dispatch_by_node_type(self):
+        self.assertEqual(SampleVisitor().visit(FirstNode()), "first")
+
+    def test_unknown_node_uses_generic_visit(self):
+        with self.assertRaises(VisitError):
+            SampleVisitor().visit(SecondNode())
+
+    def test_handlers_are_cached_per_instance(self):
+        visitor = SampleVisitor()
+        handler = visitor.get_handler(FirstNode)
+        self.assertIs(visitor.get_handler(FirstNode), handler)
+        self.assertEqual(handler.__self__, visitor)
+
+    def test_visit_names_are_cached_per_class(self):
+        SampleVisitor().visit(FirstNode())
+        self.assertEqual(SampleVisitor.__dict__["_visit_names"][FirstNode], "visit_first_node")
+
+    def test_subclasses_can_override_visit_names(self):
+        SampleVisitor().visit(FirstNode())  # fills the cache of the parent class
+        self.assertEqual(RenamingVisitor().visit(SecondNode()), "first")
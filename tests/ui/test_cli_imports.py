@@ -0,0 +1,78 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+SOURCE = Path(__file__).parent.parent.parent / "demo" / "ayed2_examples" / "types_simple.ayed"
+
+# Runs the cli on a new process, and prints the modules it imported
+SCRIPT = """
+import json, sys
+sys.argv = ["tomos", *json.loads(sys.argv[1])]
+from tomos.ui import cli
+try:
+    cli.main()
+finally:
+    print(json.dumps(sorted(sys.modules)), file=sys.stderr)
+"""
+
+# Only needed by some options. A plain run must not pay for them.
+OPTIONAL_MODULES = [
+    "pygments",
+    "prettytable",
+    "moviepy",
+    "PIL",
+    "skitso",
+    "tomos.ui.movie",
+    "tomos.ui.interpreter_hooks.show_ast",
+    "tomos.ui.interpreter_hooks.show_code",
+    "tomos.ui.interpreter_hooks.show_state",
+    "tomos.ui.interpreter_hooks.keyframes",
+    "tomos.ui.interpreter_hooks.trace_file",
+    "tomos.ayed2.evaluation.persistency",
+    "tomos.ayed2.parser.metadata",
+]
+
+
+class TestCliImports(TestCase):
+
+    def imported_modules(self, *args):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            env = dict(os.environ, TOMOS_CACHE_DIR=cache_dir)
+            result = subprocess.run(
+                [sys.executable, "-c", SCRIPT, json.dumps([str(SOURCE), *args])],
+                env=env,
+                capture_output=True,
+                text=True,
+            )
+        return set(json.loads(result.stderr.splitlines()[-1]))
+
+    def assertNotImported(self, modules, imported):
+        self.assertEqual(sorted(set(modules) & imported), [])
+
+    def test_plain_run(self):
+        imported = self.imported_modules("--no-final-state")
+        self.assertIn("tomos.ayed2.evaluation.interpreter", imported)
+        self.assertNotImported(OPTIONAL_MODULES, imported)
+
+    def test_parse_only(self):
+        imported = self.imported_modules("--no-run", "--no-final-state")
+        self.assertNotImported(OPTIONAL_MODULES, imported)
+        self.assertNotIn("tomos.ayed2.evaluation.interpreter", imported)
+
+    def test_show_ast(self):
+        imported = self.imported_modules("--no-run", "--showast", "--no-final-state")
+        self.assertIn("tomos.ui.interpreter_hooks.show_ast", imported)
+        others = [m for m in OPTIONAL_MODULES if m != "tomos.ui.interpreter_hooks.show_ast"]
+        self.assertNotImported(others, imported)
+
+    def test_load_state(self):
+        # the state is unpickled before anything else is imported
+        with tempfile.TemporaryDirectory() as tmp:
+            state_path = Path(tmp) / "state.st"
+            self.imported_modules("--no-final-state", f"--save-state={state_path}")
+            imported = self.imported_modules("--no-final-state", f"--load-state={state_path}")
+        self.assertIn("tomos.ayed2.evaluation.persistency", imported)
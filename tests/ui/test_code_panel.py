@@ -0,0 +1,63 @@
+import shutil
+from unittest import TestCase, skipUnless
+
+from PIL import ImageChops, ImageColor
+from pygments.formatters import ImageFormatter
+
+from tomos.ui.movie import configs
+from tomos.ui.movie.panel.code import CodeBox
+
+
+CODE = """var i: int
+var total: int
+total := 0
+for i := 0 to 3 do
+    total := total + i
+od
+skip
+"""
+
+
+@skipUnless(shutil.which("fc-list"), "pygments needs fontconfig to find fonts")
+class TestCodeBoxPanels(TestCase):
+
+    def test_panels_match_highlighting_each_time(self):
+        box = CodeBox(CODE)
+        pairs = [(None, None), (None, 3), (3, 4), (4, 5), (5, 4), (6, 7), (5, 5), (7, None)]
+        for prev_line_nr, next_line_nr in pairs:
+            with self.subTest(prev=prev_line_nr, next=next_line_nr):
+                box.prev_line_nr, box.next_line_nr = prev_line_nr, next_line_nr
+                expected = box.highlight(CODE).convert("RGB")
+                actual = box.get_panel()
+                self.assertEqual(actual.size, expected.size)
+                self.assertIsNone(ImageChops.difference(actual, expected).getbbox())
+
+    def test_line_geometry_matches_the_formatter(self):
+        # computed from public options and font metrics. Checked against pygments internals
+        # here, so a change on how pygments lays out lines is caught.
+        box = CodeBox(CODE)
+        box.build_base_images()
+        formatter = ImageFormatter(**box.formatter_kwargs())
+        box.highlight(CODE, formatter)
+        self.assertEqual(box.lines_count, formatter.maxlineno)
+        expected_lines_y = [formatter._get_line_y(i) for i in range(box.lines_count)]
+        self.assertEqual(box.lines_y, expected_lines_y)
+        self.assertEqual(box.mark_height, formatter._get_line_height() + 1)
+
+    def test_same_prev_and_next_line_is_marked_as_next(self):
+        box = CodeBox(CODE)
+        box.prev_line_nr = box.next_line_nr = 4
+        panel = box.get_panel()
+        x, y = panel.width - 2, box.lines_y[3] + 1
+        self.assertEqual(panel.getpixel((x, y)), ImageColor.getrgb(configs.CODEBOX_NEXT_LINE_BGCOLOR))
+
+    def test_panels_are_cached(self):
+        box = CodeBox(CODE)
+        box.update_next_line_nr(3)
+        box.update_next_line_nr(4)
+        panel = box.get_panel()
+        box.update_next_line_nr(5)
+        box.update_next_line_nr(4)
+        self.assertIsNot(box.get_panel(), panel)
+        box.prev_line_nr, box.next_line_nr = 3, 4
+        self.assertIs(box.get_panel(), panel)
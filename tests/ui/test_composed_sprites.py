@@ -0,0 +1,51 @@
+from unittest import TestCase
+
+import tomos.ayed2.parser  # noqa: F401. Needs to be imported before building array types
+from tomos.ayed2.ast.types import ArrayAxis, ArrayOf, IntType
+from tomos.ui.movie.panel.memory import MemoryBlock
+from tomos.ui.movie.panel.vars import reset_sprites_globals
+
+
+def value_texts(array_sprite):
+    return [sub_var.value_sprite.text for sub_var in array_sprite.subsprites.values()]
+
+
+class TestComposedSprites(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.block = MemoryBlock(uses_heap=False, pointers_heap_to_heap=False)
+        self.block.add_var("a", ArrayOf(IntType(), [ArrayAxis(0, 4)]), [0, 1, 2, 3])
+        self.array = self.block.vars_by_name["a"]
+        self.block.dirty_regions.pop()
+        for sub_var in self.array.subsprites.values():
+            sub_var.value_sprite.is_highlighted = False
+
+    def tearDown(self):
+        reset_sprites_globals()
+        super().tearDown()
+
+    def highlighted(self):
+        return [sub_var.value_sprite.is_highlighted for sub_var in self.array.subsprites.values()]
+
+    def test_element_update_touches_a_single_sub_sprite(self):
+        untouched = self.array.subsprites[0].value_sprite
+        self.block.set_value("a", 9, path=(2,))
+        self.assertEqual(value_texts(self.array), ["0", "1", "9", "3"])
+        self.assertEqual(self.highlighted(), [False, False, True, False])
+        self.assertIs(self.array.subsprites[0].value_sprite, untouched)
+        _, boxes = self.block.dirty_regions.pop()
+        element_box = (self.array.subsprites[2].rect.position, self.array.subsprites[2].end)
+        for x0, y0, x1, y1 in boxes:
+            self.assertLess(x0, element_box[0].x)
+            self.assertGreater(y1, element_box[1].y)
+            self.assertLess(y1 - y0, self.array.rect.height / 2)
+
+    def test_whole_value_updates_changed_elements_only(self):
+        self.block.set_value("a", [0, 5, 2, 6])
+        self.assertEqual(value_texts(self.array), ["0", "5", "2", "6"])
+        self.assertEqual(self.highlighted(), [False, True, False, True])
+
+    def test_refresh_sets_every_element(self):
+        self.array.refresh([0, 1, 2, 3])
+        self.assertEqual(self.highlighted(), [True] * 4)
@@ -0,0 +1,102 @@
+import shutil
+from unittest import TestCase, mock, skipUnless
+
+from PIL import ImageChops
+
+from tomos.ayed2.parser import parser
+from tomos.ayed2.ast.types import IntType, type_registry
+from tomos.ayed2.evaluation.interpreter import Interpreter
+from tomos.ui.interpreter_hooks import KeyframeTimeline
+from tomos.ui.movie import configs
+from tomos.ui.movie.dirty_regions import intersects, pixel_box
+from tomos.ui.movie.panel.memory import MemoryBlock
+from tomos.ui.movie.panel.vars import reset_sprites_globals
+from tomos.ui.movie.scene import TomosScene
+
+
+CODE = """
+type node = tuple
+    value: int
+    next: pointer of node
+end tuple
+var head: pointer of node
+var last: pointer of node
+var a: array [3] of int
+head := null
+for i := 0 to 2 do
+    last := head
+    alloc(head)
+    head->value := i * 1000
+    head->next := last
+    a[i] := i * 2
+od
+free(head)
+a[0] := 7
+"""
+
+
+class ListSink:
+    forkable = True
+
+    def __init__(self):
+        self.frames = []
+
+    def write(self, image, tick_id):
+        self.frames.append(image.copy())
+
+
+class TestDirtyRegions(TestCase):
+
+    def tearDown(self):
+        reset_sprites_globals()
+        super().tearDown()
+
+    def test_changed_vars_are_marked(self):
+        block = MemoryBlock(uses_heap=False, pointers_heap_to_heap=False)
+        block.add_var("x", IntType(), 1)
+        block.add_var("y", IntType(), 2)
+        everything, boxes = block.dirty_regions.pop()
+        self.assertTrue(everything)
+        self.assertEqual(len(boxes), 2)
+
+        block.set_value("y", 123456)
+        everything, boxes = block.dirty_regions.pop()
+        self.assertFalse(everything)
+        y_box = pixel_box(block.vars_by_name["y"])
+        self.assertTrue(all(intersects(box, y_box) for box in boxes))
+        x_value_box = pixel_box(block.vars_by_name["x"].value_sprite)
+        self.assertFalse(any(intersects(box, x_value_box) for box in boxes))
+
+        block.delete_var("x", in_heap=False)
+        self.assertEqual(len(block.dirty_regions.pop()[1]), 1)
+
+
+@skipUnless(shutil.which("fc-list"), "pygments needs fontconfig to find fonts")
+class TestIncrementalRendering(TestCase):
+
+    def tearDown(self):
+        type_registry.reset()
+        reset_sprites_globals()
+        super().tearDown()
+
+    def render(self, dirty_region_rendering, loop_compression=None):
+        type_registry.reset()
+        reset_sprites_globals()
+        timeline = KeyframeTimeline()
+        Interpreter(parser.parse(CODE), post_hooks=[timeline]).run()
+        sink = ListSink()
+        scene = TomosScene(CODE, timeline, sinks=[sink])
+        settings = {"DIRTY_REGION_RENDERING": dirty_region_rendering}
+        with mock.patch.dict(configs._settings, settings):
+            scene.render(explicit_frames_only=False, loop_compression=loop_compression)
+        return sink.frames
+
+    def test_same_frames_as_drawing_everything(self):
+        for loop_compression in [None, 1]:
+            with self.subTest(loop_compression=loop_compression):
+                expected = self.render(False, loop_compression)
+                frames = self.render(True, loop_compression)
+                self.assertEqual(len(frames), len(expected))
+                for i, (frame, expected_frame) in enumerate(zip(frames, expected)):
+                    diff = ImageChops.difference(frame, expected_frame).getbbox()
+                    self.assertIsNone(diff, f"frame {i} differs")
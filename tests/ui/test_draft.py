@@ -0,0 +1,72 @@
+import shutil
+from unittest import TestCase, mock, skipUnless
+
+from tomos.ayed2.parser import parser
+from tomos.ayed2.ast.types import type_registry
+from tomos.ayed2.evaluation.interpreter import Interpreter
+from tomos.ui.interpreter_hooks import KeyframeTimeline
+from tomos.ui.movie import configs
+from tomos.ui.movie.builder import encoder_options
+from tomos.ui.movie.draft import apply_draft_profile
+from tomos.ui.movie.panel.vars import reset_sprites_globals
+from tomos.ui.movie.scene import TomosScene
+
+
+class ListSink:
+    forkable = True
+
+    def __init__(self):
+        self.frames = []
+
+    def write(self, image, tick_id):
+        self.frames.append(image.copy())
+
+
+class TestDraftProfile(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.dict(configs._settings)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_sizes_are_scaled(self):
+        configs._settings["CANVAS_SIZE"] = [1381, 920]
+        configs._settings["DRAFT"] = {"SIZE_FACTOR": 0.5, "ENCODER_PRESET": "ultrafast"}
+        padding, scale = configs.PADDING, configs.SCALE
+        apply_draft_profile()
+        self.assertEqual(configs.CANVAS_SIZE, [690, 460])  # even sizes
+        self.assertEqual(configs.PADDING, round(padding / 2))
+        self.assertEqual(configs.SCALE, scale / 2)
+        self.assertGreaterEqual(configs.THICKNESS, 1)
+        self.assertEqual(encoder_options()["preset"], "ultrafast")
+        self.assertNotIn("SIZE_FACTOR", configs._settings)
+
+    def test_default_profile(self):
+        apply_draft_profile()
+        self.assertEqual(encoder_options(), {"bitrate": "1000k", "preset": "ultrafast"})
+
+
+@skipUnless(shutil.which("fc-list"), "pygments needs fontconfig to find fonts")
+class TestDraftRendering(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.dict(configs._settings)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        type_registry.reset()
+        reset_sprites_globals()
+        super().tearDown()
+
+    def test_frames_have_draft_size(self):
+        code = "var a: array [3] of int\na[1] := 5\n"
+        timeline = KeyframeTimeline()
+        Interpreter(parser.parse(code), post_hooks=[timeline]).run()
+        apply_draft_profile()
+        sink = ListSink()
+        TomosScene(code, timeline, sinks=[sink]).render(explicit_frames_only=False)
+        self.assertEqual(len(sink.frames), 3)
+        self.assertEqual(list(sink.frames[0].size), configs.CANVAS_SIZE)
@@ -0,0 +1,66 @@
+import json
+import re
+from unittest import TestCase
+
+from tomos.ayed2.parser import parser
+from tomos.ayed2.ast.types import type_registry
+from tomos.ayed2.evaluation.interpreter import Interpreter
+from tomos.ui.interpreter_hooks import KeyframeTimeline, RememberState
+from tomos.ui.movie.html_player import build_trace, render_html
+
+
+CODE = """
+type node = tuple
+    value: int
+    next: pointer of node
+end tuple
+var head: pointer of node
+var m: array [2, 3] of int
+alloc(head)
+head->value := 7
+head->next := null
+m[1, 2] := 5
+free(head)
+"""
+
+
+class TestHtmlPlayer(TestCase):
+
+    def tearDown(self):
+        type_registry.reset()
+        super().tearDown()
+
+    def trace(self, timeline):
+        Interpreter(parser.parse(CODE), post_hooks=[timeline]).run()
+        return build_trace(CODE, timeline, title="list.ayed")
+
+    def test_steps_are_diffs(self):
+        steps = self.trace(KeyframeTimeline())["steps"]
+        lines = [step[0] for step in steps]
+        self.assertEqual(lines, [6, 7, 8, 9, 10, 11, 12])
+        _, new, changed, deleted = steps[2]  # alloc(head)
+        self.assertEqual(new, [["h", "H00000", "Tuple:node", {"value": None, "next": None}]])
+        self.assertEqual(changed, [["s", "head", [], {"@": "H00000"}]])
+        self.assertEqual(deleted, [])
+        # only the written fields & elements
+        self.assertEqual(steps[3][2], [["h", "H00000", ["value"], 7]])
+        self.assertEqual(steps[4][2], [["h", "H00000", ["next"], {"@": None}]])
+        self.assertEqual(steps[5][2], [["s", "m", [1, 2], 5]])
+        self.assertEqual(steps[6][3], [["h", "H00000"]])
+        # arrays are nested, as declared
+        _, new, _, _ = steps[1]
+        self.assertEqual(new, [["s", "m", "ArrayOf(IntType, [0..2, 0..3])", [[None] * 3] * 2]])
+
+    def test_same_trace_from_any_timeline(self):
+        expected = self.trace(RememberState())
+        type_registry.reset()
+        self.assertEqual(self.trace(KeyframeTimeline()), expected)
+
+    def test_html_is_self_contained(self):
+        trace = self.trace(KeyframeTimeline())
+        trace["title"] = "</script><script>alert(1)</script>"
+        html = render_html(trace)
+        self.assertNotRegex(html, r"\b(src|href)=")
+        self.assertEqual(html.count("</script>"), 2)
+        data = re.search(r'<script type="application/json" id="trace">(.*?)</script>', html)
+        self.assertEqual(json.loads(data.group(1)), trace)
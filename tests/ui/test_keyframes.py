@@ -0,0 +1,118 @@
+from unittest import TestCase
+
+from tomos.ayed2.parser import parser
+from tomos.ayed2.ast.types import type_registry
+from tomos.ayed2.evaluation.interpreter import Interpreter
+from tomos.ui.interpreter_hooks import KeyframeTimeline, RememberState
+from tomos.ui.interpreter_hooks.remember_state import Frame
+
+
+CODE = """
+type node = tuple
+    value: int
+    next: pointer of node
+end tuple
+var head: pointer of node
+var a: array [3] of int
+head := null
+for i := 0 to 2 do
+    alloc(head)
+    head->value := i
+    a[i] := i * 2
+od
+if a[1] == 2 then
+    free(head)
+fi
+"""
+
+
+class TestKeyframeTimeline(TestCase):
+
+    def tearDown(self):
+        type_registry.reset()
+        super().tearDown()
+
+    def record(self, keyframe_interval):
+        type_registry.reset()
+        program = parser.parse(CODE)
+        remember = RememberState()
+        keyframes = KeyframeTimeline(keyframe_interval=keyframe_interval)
+        Interpreter(program, post_hooks=[remember, keyframes]).run()
+        return remember, keyframes
+
+    def assertSameFrame(self, actual, expected):
+        self.assertEqual(actual.line_number, expected.line_number)
+        self.assertIs(actual.just_executed, expected.just_executed)
+        self.assertEqual(actual.diff, expected.diff)
+        self.assertEqual(actual.expression_values, expected.expression_values)
+        for block in ["stack", "heap"]:
+            actual_block = getattr(actual.state, block)
+            expected_block = getattr(expected.state, block)
+            self.assertEqual(list(actual_block), list(expected_block))
+            for key, cell in expected_block.items():
+                self.assertEqual(str(actual_block[key].value), str(cell.value))
+        if expected.next is None:
+            self.assertIsNone(actual.next)
+        else:
+            self.assertIsInstance(actual.next, Frame)
+            self.assertEqual(actual.next.line_number, expected.next.line_number)
+
+    def test_frames_match_full_snapshots(self):
+        for keyframe_interval in [1, 3, 100]:
+            with self.subTest(keyframe_interval=keyframe_interval):
+                remember, keyframes = self.record(keyframe_interval)
+                self.assertEqual(len(keyframes), len(remember.timeline))
+                for expected, actual in zip(remember.timeline, keyframes.iter_frames()):
+                    self.assertSameFrame(actual, expected)
+
+    def test_random_access(self):
+        remember, keyframes = self.record(keyframe_interval=4)
+        n_frames = len(remember.timeline)
+        self.assertEqual(len(keyframes.keyframes), (n_frames + 3) // 4)
+        for n in [n_frames - 1, 0, 5, 4, 6, 2, n_frames - 2, 1]:
+            self.assertSameFrame(keyframes.frame_at(n), remember.timeline[n])
+        with self.assertRaises(IndexError):
+            keyframes.frame_at(n_frames)
+
+    def test_rebuilt_frames_are_independent(self):
+        remember, keyframes = self.record(keyframe_interval=100)
+        first = keyframes.frame_at(0)
+        first_keys = list(first.state.stack)
+        keyframes.frame_at(len(keyframes) - 1)
+        self.assertEqual(list(first.state.stack), first_keys)
+
+    def test_partial_writes_only_store_changed_sub_cells(self):
+        remember, keyframes = self.record(keyframe_interval=100)
+        patched = [delta for delta in keyframes.deltas if "a" in delta.patches]
+        self.assertEqual(len(patched), 3)
+        for i, delta in enumerate(patched):
+            self.assertNotIn("a", delta.cells)
+            [(path, sub_cell)] = delta.patches["a"].items()
+            self.assertEqual((path, sub_cell.value), ((i,), i * 2))
+
+    def test_recorded_cells_share_their_types(self):
+        remember, keyframes = self.record(keyframe_interval=100)
+        heap_cells = [
+            cell
+            for delta in keyframes.deltas
+            for key, cell in delta.cells.items()
+            if key in delta.diff.new_cells and not isinstance(key, str)
+        ]
+        self.assertEqual(len(heap_cells), 3)
+        self.assertEqual(len({id(cell.var_type) for cell in heap_cells}), 1)
+
+    def test_iter_diffs_matches_frames(self):
+        remember, keyframes = self.record(keyframe_interval=3)
+        for (line_number, diff, cells), frame in zip(keyframes.iter_diffs(), remember.timeline):
+            self.assertEqual((line_number, diff), (frame.line_number, frame.diff))
+            self.assertEqual(
+                {key: str(cell.value) for key, cell in cells.items()},
+                {key: str(frame.get_cell(key).value) for key in cells},
+            )
+
+    def test_timeline_queries(self):
+        remember, keyframes = self.record(keyframe_interval=3)
+        self.assertIsNone(keyframes.loaded_initial_snapshot())
+        for query in ["list_declaration_snapshots", "list_sentence_snapshots"]:
+            expected = [f.just_executed for f in getattr(remember, query)()]
+            self.assertEqual([f.just_executed for f in getattr(keyframes, query)()], expected)
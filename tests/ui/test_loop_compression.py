@@ -0,0 +1,79 @@
+from unittest import TestCase
+
+from tomos.ayed2.parser import parser
+from tomos.ayed2.ast.sentences import For, While
+from tomos.ayed2.ast.types import type_registry
+from tomos.ayed2.evaluation.interpreter import Interpreter
+from tomos.ui.interpreter_hooks import KeyframeTimeline
+from tomos.ui.movie.loop_compression import SkippedIterations, compress_loops, find_loop_runs
+
+
+CODE = """
+var n: int
+var total: int
+n := 0
+total := 0
+while n < 6 do
+    for i := 1 to n do
+        total := total + i
+    od
+    n := n + 1
+od
+for j := 1 to 2 do
+    skip
+od
+"""
+
+
+class TestLoopCompression(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        timeline = KeyframeTimeline()
+        Interpreter(parser.parse(CODE), post_hooks=[timeline]).run()
+        self.shots = timeline.list_sentence_snapshots()
+
+    def tearDown(self):
+        type_registry.reset()
+        super().tearDown()
+
+    def runs_summary(self):
+        return [
+            (type(loop).__name__, loop.line_number, len(headers) - 1)
+            for loop, headers in find_loop_runs(self.shots)
+        ]
+
+    def test_find_loop_runs(self):
+        # the while loop, then one run of the inner for loop per while iteration
+        expected = [("While", 6, 6)]
+        expected += [("For", 7, n) for n in range(6)]
+        expected += [("For", 12, 2)]
+        self.assertEqual(self.runs_summary(), expected)
+        for loop, headers in find_loop_runs(self.shots):
+            for idx in headers:
+                self.assertIs(self.shots[idx].just_executed, loop)
+                self.assertIsInstance(loop, (For, While))
+
+    def test_middle_iterations_are_collapsed(self):
+        ticks = compress_loops(self.shots, [True] * len(self.shots), keep=1)
+        summaries = [tick for tick in ticks if isinstance(tick, SkippedIterations)]
+        # 4 iterations of the while loop are collapsed (inner loops included). On the
+        # shown ones, the inner loop has 0 and 5 iterations: the latter gets collapsed.
+        # The last for loop has nothing to collapse.
+        self.assertEqual([(s.loop.line_number, s.count) for s in summaries], [(6, 4), (7, 3)])
+        runs = find_loop_runs(self.shots)
+        while_headers = runs[0][1]
+        collapsed = ticks[while_headers[1] : while_headers[5]]
+        self.assertEqual(collapsed[:-1], [False] * (len(collapsed) - 1))
+        self.assertIsInstance(collapsed[-1], SkippedIterations)
+        # everything out of collapsed iterations keeps its frame
+        self.assertTrue(all(ticks[: while_headers[1]]))
+
+    def test_nothing_collapsed_when_keeping_enough_iterations(self):
+        ticks = [True] * len(self.shots)
+        self.assertEqual(compress_loops(self.shots, ticks, keep=3), ticks)
+
+    def test_skipped_ticks_stay_skipped(self):
+        ticks = [False] * len(self.shots)
+        compressed = compress_loops(self.shots, ticks, keep=1)
+        self.assertEqual(sum(1 for tick in compressed if tick), 2)  # only summaries
@@ -0,0 +1,145 @@
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+from tomos.ayed2.parser import parser
+from tomos.ayed2.ast.program import iter_program_sentences
+from tomos.ayed2.ast.types import type_registry
+from tomos.ayed2.evaluation.interpreter import Interpreter
+from tomos.ui.interpreter_hooks import KeyframeTimeline
+from tomos.ui.movie import configs
+from tomos.ui.movie.panel.vars import (
+    HIGHLIGHTING_SWITCH,
+    ColorAssigner,
+    PointerVarSprite,
+    reset_sprites_globals,
+)
+from tomos.ui.movie.scene import TomosScene, plan_chunks
+
+
+CHECKPOINT_LINES = [6, 9]
+CODE = """
+var a: array [3] of int
+var x: int
+x := 1
+for i := 0 to 2 do
+    a[i] := i * 2
+    x := x + 1
+od
+x := 0
+"""
+
+
+class FakePanel:
+    def __init__(self, scene):
+        self.scene = scene
+
+    def process_snapshot(self, snapshot):
+        self.scene.processed.append(snapshot.line_number)
+        if HIGHLIGHTING_SWITCH.is_on:
+            self.scene.highlighted.append(snapshot.line_number)
+
+    def mark_next_line(self, line_number):
+        self.scene.next_line = line_number
+
+
+class RecordingScene(TomosScene):
+    # Instead of drawing, each tick writes what would be seen on the frame
+
+    def build_panels(self):
+        self.processed, self.highlighted, self.next_line = [], [], None
+        panel = FakePanel(self)
+        return panel, panel
+
+    def discard_highlights(self):
+        self.highlighted = []
+
+    def tick(self, caption=""):
+        content = f"{self.processed} {self.highlighted} {self.next_line} {caption}"
+        (self.folder_path / f"{self.next_tick_id:08}.txt").write_text(content)
+        self.highlighted = []
+        self.next_tick_id += 1
+
+    def summary_tick(self, skipped):
+        self.tick(caption=str(skipped))
+
+
+class TestParallelRendering(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.folder = tempfile.TemporaryDirectory()
+        program = parser.parse(CODE)
+        for sentence in iter_program_sentences(program):
+            if sentence.line_number in CHECKPOINT_LINES:
+                sentence.set_parsing_metadata("checkpoint", True)
+        self.timeline = KeyframeTimeline()
+        Interpreter(program, post_hooks=[self.timeline]).run()
+
+    def tearDown(self):
+        self.folder.cleanup()
+        type_registry.reset()
+        super().tearDown()
+
+    def render(self, name, explicit_frames_only, workers, loop_compression=None):
+        path = Path(self.folder.name) / name
+        scene = RecordingScene(CODE, self.timeline, path)
+        if workers == 1:
+            n_frames = scene.render(explicit_frames_only, loop_compression=loop_compression)
+        else:
+            n_frames = scene.render_in_parallel(explicit_frames_only, workers, loop_compression)
+        frames = sorted((path / "frames").glob("*.txt"))
+        return n_frames, [(f.name, f.read_text()) for f in frames]
+
+    def test_same_frames_as_serial_rendering(self):
+        for explicit_frames_only in [False, True]:
+            name = f"serial_{explicit_frames_only}"
+            expected = self.render(name, explicit_frames_only, workers=1)
+            for workers in [2, 3]:
+                with self.subTest(explicit_frames_only=explicit_frames_only, workers=workers):
+                    name = f"parallel_{explicit_frames_only}_{workers}"
+                    self.assertEqual(self.render(name, explicit_frames_only, workers), expected)
+
+    def test_loop_compression(self):
+        n_frames, frames = self.render("serial", False, workers=1, loop_compression=0)
+        # the for loop has 3 iterations, all collapsed into a single frame
+        self.assertEqual(n_frames, 1 + 2 + 4)
+        self.assertIn("3 iterations of loop at line 5 skipped", frames[2][1])
+        self.assertEqual(
+            self.render("parallel", False, workers=2, loop_compression=0), (n_frames, frames)
+        )
+
+
+class TestPlanChunks(TestCase):
+
+    def test_chunks_cover_all_shots(self):
+        ticks = [True, False, True, True, False, True, True, False]
+        for n_chunks in range(1, 10):
+            chunks = plan_chunks(ticks, n_chunks)
+            self.assertLessEqual(len(chunks), n_chunks)
+            self.assertEqual(chunks[0][0], 0)
+            self.assertEqual(chunks[-1][1], len(ticks))
+            for (_, last), (first, _) in zip(chunks, chunks[1:]):
+                self.assertEqual(last, first)
+
+    def test_frames_are_balanced(self):
+        chunks = plan_chunks([True] * 10, 4)
+        self.assertEqual([last - first for first, last in chunks], [3, 2, 3, 2])
+
+    def test_nothing_to_draw(self):
+        self.assertEqual(plan_chunks([], 4), [(0, 0)])
+        self.assertEqual(plan_chunks([False, False], 4), [(0, 2)])
+
+
+class TestResetSpritesGlobals(TestCase):
+
+    def test_reset(self):
+        unnamed_colors = list(configs.UNNAMED_COLORS)
+        ColorAssigner.cache["SomeType"] = configs.UNNAMED_COLORS.pop(0)
+        HIGHLIGHTING_SWITCH.turn_off()
+        PointerVarSprite.heap_arrow_manager.heap_arrows.append(object())
+        reset_sprites_globals()
+        self.assertNotIn("SomeType", ColorAssigner.cache)
+        self.assertEqual(configs.UNNAMED_COLORS, unnamed_colors)
+        self.assertTrue(HIGHLIGHTING_SWITCH.is_on)
+        self.assertEqual(PointerVarSprite.heap_arrow_manager.heap_arrows, [])
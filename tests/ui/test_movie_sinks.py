@@ -0,0 +1,149 @@
+import shutil
+import tempfile
+from pathlib import Path
+from unittest import TestCase, mock, skipUnless
+
+from moviepy.video.io.VideoFileClip import VideoFileClip
+from PIL import Image
+
+from tomos.ayed2.parser import parser
+from tomos.ayed2.ast.types import type_registry
+from tomos.ayed2.evaluation.interpreter import Interpreter
+from tomos.ui.interpreter_hooks import KeyframeTimeline
+from tomos.ui.movie import builder, configs
+from tomos.ui.movie.builder import build_movie_from_file, generate_mp4
+from tomos.ui.movie.scene import TomosScene
+from tomos.ui.movie.sinks import DedupSink, PngFolderSink, VideoSink
+
+
+class ListSink:
+    forkable = True
+
+    def __init__(self):
+        self.frames = []
+
+    def write(self, image, tick_id):
+        self.frames.append((tick_id, image.copy()))
+
+    def repeat(self, tick_id):
+        self.frames.append((tick_id, None))
+
+
+def build_images(n, size=(64, 48)):
+    return [Image.new("RGB", size, (i * 40, 0, 255 - i * 40)) for i in range(n)]
+
+
+class TestSinks(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = Path(self.folder.name)
+
+    def tearDown(self):
+        self.folder.cleanup()
+        super().tearDown()
+
+    def test_png_folder_sink(self):
+        sink = PngFolderSink(self.path / "frames")
+        for tick_id, image in enumerate(build_images(3), 1):
+            sink.write(image, tick_id)
+        sink.close()
+        names = sorted(f.name for f in (self.path / "frames").iterdir())
+        self.assertEqual(names, ["00000001.png", "00000002.png", "00000003.png"])
+
+    def test_video_sink_encodes_piped_frames(self):
+        movie_path = self.path / "movie.mp4"
+        sink = VideoSink(movie_path, (64, 48), fps=2)
+        for tick_id, image in enumerate(build_images(4), 1):
+            sink.write(image, tick_id)
+        sink.close()
+        clip = VideoFileClip(str(movie_path))
+        try:
+            self.assertEqual(tuple(clip.size), (64, 48))
+            self.assertEqual(len(list(clip.iter_frames())), 4)
+        finally:
+            clip.close()
+
+    def test_dedup_sink_repeats_identical_consecutive_frames(self):
+        sink = ListSink()
+        dedup = DedupSink([sink])
+        a, b = build_images(2)
+        for tick_id, image in enumerate([a, a.copy(), b, a, a], 1):
+            dedup.write(image, tick_id)
+        # not consecutive (as when rendering in chunks), so not a duplicate
+        dedup.write(a, 7)
+        self.assertEqual(dedup.duplicates, 2)
+        self.assertEqual(
+            [(tick_id, image is None) for tick_id, image in sink.frames],
+            [(1, False), (2, True), (3, False), (4, False), (5, True), (7, False)],
+        )
+
+    def test_generate_mp4_encodes_gaps_as_durations(self):
+        sink = PngFolderSink(self.path / "frames")
+        for tick_id, image in zip([1, 2, 5], build_images(3)):
+            sink.write(image, tick_id)
+        movie_path = self.path / "movie.mp4"
+        saved_frames = generate_mp4(self.path, movie_path, end_tick_id=7)
+        self.assertEqual(saved_frames, 3)
+        concat_list = (self.path / "frames" / f"frames.{configs.FPS}fps.ffconcat").read_text()
+        durations = [
+            float(line.split()[1]) for line in concat_list.splitlines() if "duration" in line
+        ]
+        self.assertEqual(durations, [1 / configs.FPS, 3 / configs.FPS, 2 / configs.FPS])
+        clip = VideoFileClip(str(movie_path))
+        try:
+            self.assertAlmostEqual(clip.duration, 6 / configs.FPS, delta=0.5 / configs.FPS)
+        finally:
+            clip.close()
+
+    @skipUnless(shutil.which("fc-list"), "pygments needs fontconfig to find fonts")
+    def test_default_movie_saves_repeated_frames_once(self):
+        source_path = self.path / "repeats.ayed"
+        source_path.write_text("var x: int\nvar y: int\nx := 1\nx := 1\n")
+        timeline = KeyframeTimeline()
+        Interpreter(parser.parse(source_path.read_text()), post_hooks=[timeline]).run()
+        type_registry.reset()
+        with mock.patch.object(builder, "FRAMES_PARENT_PATH", self.path / "output"):
+            saved_frames = build_movie_from_file(
+                source_path, self.path / "movie.mp4", timeline, keep_frames=True
+            )
+        frames_folder = self.path / "output" / "repeats.ayed" / "frames"
+        self.assertEqual(saved_frames, 1)
+        saved_images = list(frames_folder.glob("*.png"))
+        concat_list = (frames_folder / f"frames.{configs.FPS}fps.ffconcat").read_text()
+        durations = [line for line in concat_list.splitlines() if "duration" in line]
+        self.assertEqual(len(durations), len(saved_images))
+        self.assertIn(f"duration {2 / configs.FPS:.6f}", durations)
+        self.assertTrue((self.path / "movie.mp4").exists())
+
+    @skipUnless(shutil.which("fc-list"), "pygments needs fontconfig to find fonts")
+    def test_movie_without_dedup_is_streamed(self):
+        source_path = self.path / "repeats.ayed"
+        source_path.write_text("var x: int\nx := 1\nx := 1\n")
+        timeline = KeyframeTimeline()
+        Interpreter(parser.parse(source_path.read_text()), post_hooks=[timeline]).run()
+        type_registry.reset()
+        with mock.patch.object(builder, "FRAMES_PARENT_PATH", self.path / "output"):
+            saved_frames = build_movie_from_file(
+                source_path, self.path / "movie.mp4", timeline, dedup=False
+            )
+        self.assertEqual(saved_frames, 0)
+        self.assertFalse((self.path / "output").exists())  # no frames saved as files
+        clip = VideoFileClip(str(self.path / "movie.mp4"))
+        try:
+            self.assertEqual(len(list(clip.iter_frames())), len(timeline) + 1)
+        finally:
+            clip.close()
+
+    def test_scene_hands_frames_to_sinks(self):
+        timeline = KeyframeTimeline()
+        Interpreter(parser.parse("var x: int\nx := 1\n"), post_hooks=[timeline]).run()
+        type_registry.reset()
+        sink = ListSink()
+        scene = TomosScene("", timeline, sinks=[sink])
+        self.assertIsNone(scene.folder_path)
+        scene.tick()
+        scene.tick()
+        self.assertEqual([tick_id for tick_id, _ in sink.frames], [1, 2])
+        self.assertEqual(list(sink.frames[0][1].size), configs.CANVAS_SIZE)
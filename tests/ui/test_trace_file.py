@@ -0,0 +1,85 @@
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+from tomos.ayed2.parser import parser
+from tomos.ayed2.ast.types import type_registry
+from tomos.ayed2.evaluation.interpreter import Interpreter
+from tomos.ayed2.evaluation.persistent_state import PersistentState
+from tomos.ui.interpreter_hooks import RememberState, TraceReader, TraceWriter
+
+
+CODE = """
+type node = tuple
+    value: int
+    next: pointer of node
+end tuple
+var head: pointer of node
+var a: array [3] of int
+head := null
+for i := 0 to 2 do
+    alloc(head)
+    head->value := i
+    a[i] := i * 2
+od
+if a[1] == 2 then
+    free(head)
+fi
+"""
+
+
+class TestTraceFile(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = Path(self.folder.name) / "trace.bin"
+        self.program = parser.parse(CODE)
+
+    def tearDown(self):
+        self.folder.cleanup()
+        type_registry.reset()
+        super().tearDown()
+
+    def record(self):
+        remember = RememberState()
+        with TraceWriter(self.path, self.program) as writer:
+            Interpreter(
+                self.program, post_hooks=[remember, writer], state_class=PersistentState
+            ).run()
+        return remember, writer
+
+    def test_frames_read_match_recorded_ones(self):
+        remember, writer = self.record()
+        reader = TraceReader(self.path, self.program)
+        frames = list(reader.iter_frames())
+        self.assertEqual(len(frames), len(remember.timeline))
+        self.assertEqual(writer.frame_count, len(frames))
+        for expected, actual in zip(remember.timeline, frames):
+            self.assertEqual(actual.line_number, expected.line_number)
+            self.assertIs(actual.just_executed, expected.just_executed)
+            self.assertEqual(actual.diff, expected.diff)
+            self.assertEqual(actual.expression_values, expected.expression_values)
+            for key in actual.diff.new_cells + actual.diff.changed_cells:
+                self.assertEqual(
+                    str(actual.get_cell(key).value), str(expected.get_cell(key).value)
+                )
+            self.assertEqual(
+                getattr(actual.next, "line_number", None),
+                getattr(expected.next, "line_number", None),
+            )
+
+    def test_timeline_queries(self):
+        remember, _ = self.record()
+        reader = TraceReader(self.path, self.program)
+        self.assertIsNone(reader.loaded_initial_snapshot())
+        for query in ["list_declaration_snapshots", "list_sentence_snapshots"]:
+            expected = [f.just_executed for f in getattr(remember, query)()]
+            self.assertEqual([f.just_executed for f in getattr(reader, query)()], expected)
+
+    def test_interrupted_trace_is_readable(self):
+        remember, _ = self.record()
+        data = self.path.read_bytes()
+        self.path.write_bytes(data[:-3])
+        frames = list(TraceReader(self.path, self.program).iter_frames())
+        self.assertEqual(len(frames), len(remember.timeline) - 1)
@@ -69,6 +69,7 @@ class TraverseStep:
     DEREFERENCE = "*"
     ARRAY_INDEXING = "[%s]"
     ACCESSED_FIELD = ".%s"
+    __slots__ = ("kind", "argument")
 
     def __init__(self, kind, argument=None):
         assert kind in [
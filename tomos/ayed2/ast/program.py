@@ -1,8 +1,8 @@
 from tomos.ayed2.ast.base import ASTNode
-from tomos.ayed2.ast.sentences import Variable
+from tomos.ayed2.ast.sentences import Skip, Variable
 from tomos.ayed2.ast.types import Ayed2Type
 from tomos.ayed2.parser.token import Token
-from tomos.base_classes.dataclasses import dataclass
+from tomos.base_classes.dataclasses import dataclass, verify_fields
 
 
 class ProgramExpression(ASTNode):
@@ -19,6 +19,32 @@ class Program(ProgramExpression):
         return f"Program({self.body})"
 
 
+def iter_program_sentences(program):
+    # Lists the sentences of a program (nested ones included) in a stable order, so
+    # they can be referenced by index.
+    from tomos.ayed2.ast.sentences import For, If, While  # avoid circular import
+
+    def walk(sentences):
+        for sentence in sentences:
+            yield sentence
+            if isinstance(sentence, If):
+                yield from walk(sentence.then_sentences)
+                yield from walk(sentence.else_sentences)
+            elif isinstance(sentence, (While, For)):
+                yield from walk(sentence.sentences)
+
+    return walk(iter(program.body))
+
+
+def verify_program(program):
+    # Nodes aren't validated when built. This checks the fields of all of them at once.
+    for declaration in program.typedef_section:
+        verify_fields(declaration)
+    for sentence in iter_program_sentences(program):
+        if isinstance(sentence, (VarDeclaration, Skip)):
+            verify_fields(sentence)
+
+
 class Body(ProgramExpression):
     def __init__(self, var_declarations, sentences):
         assert all(isinstance(v, VarDeclaration) for v in var_declarations)
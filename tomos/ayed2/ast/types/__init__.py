@@ -11,7 +11,7 @@ from .basic import (
 )
 from .array import ArrayOf, ArrayAxis
 from .enum import Enum
-from .registry import type_registry
+from .registry import TypeRegistry, get_type_registry, type_registry, use_type_registry
 from .synonym import Synonym
 from .t_tuple import Tuple
 
@@ -28,7 +28,10 @@ __all__ = [
     "ArrayOf",
     "ArrayAxis",
     "Enum",
+    "TypeRegistry",
+    "get_type_registry",
     "type_registry",
+    "use_type_registry",
     "Synonym",
     "Tuple",
 ]
@@ -24,6 +24,15 @@ class ArrayOf(Ayed2Type):
         for axis in self.axes:
             axis.eval_expressions(expr_evaluator, state)
 
+    def with_evaluated_axes(self, expr_evaluator, state):
+        # Same as eval_axes_expressions, but at execution time: types are shared by every
+        # execution of a program, so instead of modifying this one, returns an array type
+        # whose axes are all evaluated (or self, if that's already the case).
+        if all(axis.is_evaluated for axis in self.axes):
+            return self
+        axes = tuple(axis.evaluated(expr_evaluator, state) for axis in self.axes)
+        return ArrayOf(of=self.of, axes=axes)
+
     def number_of_elements(self):
         return math.prod(self.shape())
 
@@ -100,6 +109,11 @@ class ArrayAxis:
                 return
             self.value = expr_evaluator.eval(self.expr, state)
 
+        def evaluated(self, expr_evaluator, state):
+            if hasattr(self, "value"):
+                return self.value
+            return expr_evaluator.eval(self.expr, state)
+
     def __init__(self, from_expr_or_val, to_expr):
         self._from = self.Limit(from_expr_or_val)
         self._to = self.Limit(to_expr)
@@ -111,6 +125,15 @@ class ArrayAxis:
         self._from.eval(expr_evaluator, state)
         self._to.eval(expr_evaluator, state)
 
+    @property
+    def is_evaluated(self):
+        return hasattr(self._from, "value") and hasattr(self._to, "value")
+
+    def evaluated(self, expr_evaluator, state):
+        return ArrayAxis(
+            self._from.evaluated(expr_evaluator, state), self._to.evaluated(expr_evaluator, state)
+        )
+
     def index_in_range(self, index):
         return self.from_value <= index and index < self.to_value
 
@@ -1,3 +1,6 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
 from tomos.ayed2.evaluation.limits import LIMITER
 from tomos.exceptions import TomosTypeError
 from .basic import IntType, RealType, BoolType, CharType, UserDefinedType
@@ -84,6 +87,9 @@ class TypeRegistry:
     def list_types(self):
         return list(self.type_map.items())
 
+    def list_user_types(self):
+        return [(name, t) for name, t in self.type_map.items() if isinstance(t, UserDefinedType)]
+
     def get_enum_constant(self, name):
         return self._enum_constants.get_constant(name)
 
@@ -104,4 +110,23 @@ class TypeRegistry:
         self._enum_constants.update(new_enum_constants)
 
 
-type_registry = TypeRegistry()  # Global type registry
+type_registry = TypeRegistry()  # Global type registry. Used unless another one is in use.
+_current_registry = ContextVar("type_registry", default=type_registry)
+
+
+def get_type_registry():
+    # The registry in use by the running parse/execution (in this thread or task).
+    return _current_registry.get()
+
+
+@contextmanager
+def use_type_registry(registry):
+    # Makes "registry" the one in use inside the with-block. If None, keeps the current one.
+    if registry is None:
+        yield get_type_registry()
+        return
+    token = _current_registry.set(registry)
+    try:
+        yield registry
+    finally:
+        _current_registry.reset(token)
@@ -0,0 +1,559 @@
+import hashlib
+import operator
+
+from tomos.ayed2.ast.expressions import TraverseStep
+from tomos.ayed2.ast.program import iter_program_sentences
+from tomos.ayed2.ast.types import ArrayOf, IntType
+from tomos.ayed2.evaluation.closures import VALUE_TYPES, ExpressionCompiler, VariableAccess
+from tomos.ayed2.evaluation.expressions import ExpressionEvaluator
+from tomos.exceptions import ExpressionEvaluationError, TomosRuntimeError
+from tomos.visit import NodeVisitor
+
+
+# Opcodes. Each instruction is a tuple (opcode, *operands).
+# Operands are integers: registers, jump targets, or indexes on the tables of the
+# Bytecode object (constants, variables, expressions, sentences).
+SENTENCE = 0  # sentence_idx                 Boundary. Execution stops here.
+HALT = 1  #                                  End of program.
+JUMP = 2  # target
+JUMP_IF_FALSE = 3  # reg, target
+JUMP_IF_TRUE = 4  # reg, target
+LOAD_CONST = 5  # dst, const_idx
+LOAD_VAR = 6  # dst, var_slot (of a variable with traversal steps)
+UNARY = 7  # dst, operator_idx, src
+BINARY = 8  # dst, operator_idx, left, right
+STORE = 9  # var_slot (of a variable with traversal steps), src
+RECORD = 10  # expression_idx, reg
+DECLARE = 11  # var_slot, const_idx (of the type)
+FOR_DECLARE = 12  # var_slot
+FOR_NEXT = 13  # dst, var_slot, direction_up
+FOR_CHECK = 14  # value_reg, end_reg, var_slot, direction_up, exit_target
+ALLOC = 15  # var_slot
+FREE = 16  # var_slot
+RAISE = 17  # const_idx (of the message)
+LOAD_NAME = 18  # dst, var_slot (of a plain variable)
+STORE_NAME = 19  # var_slot (of a plain variable), src
+
+OPCODE_NAMES = [
+    "SENTENCE",
+    "HALT",
+    "JUMP",
+    "JUMP_IF_FALSE",
+    "JUMP_IF_TRUE",
+    "LOAD_CONST",
+    "LOAD_VAR",
+    "UNARY",
+    "BINARY",
+    "STORE",
+    "RECORD",
+    "DECLARE",
+    "FOR_DECLARE",
+    "FOR_NEXT",
+    "FOR_CHECK",
+    "ALLOC",
+    "FREE",
+    "RAISE",
+    "LOAD_NAME",
+    "STORE_NAME",
+]
+
+# Operators are referenced by index, so instructions are made of integers only.
+UNARY_OPERATORS = [("-", operator.neg), ("+", operator.pos), ("!", operator.not_)]
+BINARY_OPERATORS = [
+    ("+", operator.add),
+    ("-", operator.sub),
+    ("*", operator.mul),
+    ("/", operator.truediv),
+    ("%", operator.mod),
+    ("==", operator.eq),
+    ("!=", operator.ne),
+    ("<", operator.lt),
+    ("<=", operator.le),
+    (">", operator.gt),
+    (">=", operator.ge),
+]
+UNARY_INDEX = {symbol: i for i, (symbol, _) in enumerate(UNARY_OPERATORS)}
+BINARY_INDEX = {symbol: i for i, (symbol, _) in enumerate(BINARY_OPERATORS)}
+
+
+class VariablePath:
+    """
+    A variable, lowered: its name and the steps to traverse from it. Indexes of
+    ARRAY_INDEXING steps are registers, holding the already evaluated index expressions.
+    States take it as they take Variable nodes.
+    """
+
+    DEREFERENCE = TraverseStep.DEREFERENCE
+    ARRAY_INDEXING = TraverseStep.ARRAY_INDEXING
+    ACCESSED_FIELD = TraverseStep.ACCESSED_FIELD
+    __slots__ = ("name", "traverse_path", "text")
+
+    def __init__(self, name, traverse_path, text):
+        self.name = name
+        self.traverse_path = traverse_path
+        self.text = text  # for error messages
+
+    def __str__(self):
+        return self.text
+
+    def __repr__(self):
+        return f"VariablePath({self.text})"
+
+
+class Bytecode:
+    """
+    Flat representation of a program. Jumps are integer positions on the list of
+    instructions, variables are slot indexes on the variables table, and constants are
+    plain values (or types, for declarations).
+    Instructions, constants and variables don't reference the AST. Sentences and
+    recorded expressions (the AST nodes hooks see) are on their own tables, which are
+    rebuilt from the program by attach_program.
+    """
+
+    def __init__(self):
+        self.instructions = []
+        self.constants = []
+        self.variables = []  # VariablePath, referenced by slot index
+        self.register_count = 0
+        self.fingerprint = None  # of the compiled program (see program_fingerprint)
+        self.entry_positions = []  # sentence_idx -> position of its first SENTENCE instruction
+        self.recorded = []  # (sentence_idx, attribute) of each recorded expression
+        self.sentences = []  # referenced by SENTENCE instructions
+        self.expressions = []  # referenced by RECORD instructions
+        self.entry_points = {}  # id(sentence) -> position of its first SENTENCE instruction
+
+    def __getstate__(self):
+        # Sentences and expressions are the entry points to the whole AST. Not shipped
+        # when pickling. Use attach_program to restore them.
+        state = self.__dict__.copy()
+        state["sentences"] = []
+        state["expressions"] = []
+        state["entry_points"] = {}
+        return state
+
+    def attach_program(self, program):
+        if program_fingerprint(program) != self.fingerprint:
+            raise TomosRuntimeError("Bytecode was not compiled from the given program.")
+        self.sentences = list(iter_program_sentences(program))
+        self.expressions = [getattr(self.sentences[idx], attr) for idx, attr in self.recorded]
+        self.index_entry_points()
+
+    def index_entry_points(self):
+        positions = zip(self.sentences, self.entry_positions)
+        self.entry_points = {id(sentence): position for sentence, position in positions}
+
+    def disassemble(self):
+        lines = []
+        for pc, (opcode, *operands) in enumerate(self.instructions):
+            line = f"{pc:5} {OPCODE_NAMES[opcode]:<14} {', '.join(map(str, operands))}"
+            if opcode == SENTENCE and self.sentences:
+                line += f"    # {self.sentences[operands[0]]}"
+            lines.append(line)
+        return "\n".join(lines)
+
+
+NESTED_SENTENCES = ("then_sentences", "else_sentences", "sentences")
+
+
+def program_fingerprint(program):
+    # Identifies a program without lowering it: each sentence (expressions included),
+    # its line, and how many sentences it nests.
+    digest = hashlib.sha256()
+    for sentence in iter_program_sentences(program):
+        nested = [len(getattr(sentence, attr, ())) for attr in NESTED_SENTENCES]
+        digest.update(f"{sentence.line_number}:{sentence!r}:{nested}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class BytecodeCompiler(NodeVisitor):
+    """
+    Lowers a parsed Program into Bytecode.
+    """
+
+    def compile(self, program):
+        self.code = Bytecode()
+        self.code.fingerprint = program_fingerprint(program)
+        self._constant_idx = {}
+        self._name_slots = {}
+        self._sentence_idx = {}
+        for idx, sentence in enumerate(iter_program_sentences(program)):
+            self.code.sentences.append(sentence)
+            self._sentence_idx[id(sentence)] = idx
+        self.code.entry_positions = [None] * len(self.code.sentences)
+        self.emit_sentences(list(program.body))
+        self.emit(HALT)
+        self.code.index_entry_points()
+        return self.code
+
+    # Tables
+    def emit(self, opcode, *operands):
+        self.code.instructions.append((opcode, *operands))
+        return len(self.code.instructions) - 1
+
+    def patch_jump(self, position, target):
+        # Jump targets are always the last operand
+        opcode, *operands = self.code.instructions[position]
+        operands[-1] = target
+        self.code.instructions[position] = (opcode, *operands)
+
+    @property
+    def current_position(self):
+        return len(self.code.instructions)
+
+    def constant(self, value):
+        try:
+            key = (type(value), value)
+            hash(key)
+        except TypeError:
+            key = ("id", id(value))
+        if key not in self._constant_idx:
+            self._constant_idx[key] = len(self.code.constants)
+            self.code.constants.append(value)
+        return self._constant_idx[key]
+
+    def variable_slot(self, var, first_register=0):
+        # Plain variables share a slot per name. Variables with traversal steps (indexing,
+        # dereferencing, field accessing) need their own slot. Their index expressions
+        # are evaluated here, onto registers from first_register on.
+        if not var.traverse_path:
+            if var.name not in self._name_slots:
+                self._name_slots[var.name] = len(self.code.variables)
+                self.code.variables.append(VariablePath(var.name, [], str(var)))
+            return self._name_slots[var.name]
+        steps = []
+        register = first_register
+        for step in var.traverse_path:
+            if step.kind == TraverseStep.ARRAY_INDEXING:
+                registers = []
+                for index_expr in step.argument:
+                    self.emit_expr(index_expr, register)
+                    registers.append(register)
+                    register += 1
+                steps.append(TraverseStep(step.kind, registers))
+            elif step.kind == TraverseStep.ACCESSED_FIELD:
+                steps.append(TraverseStep(step.kind, str(step.argument)))
+            else:
+                steps.append(TraverseStep(step.kind))
+        self.code.variables.append(VariablePath(var.name, steps, str(var)))
+        return len(self.code.variables) - 1
+
+    def use_register(self, reg):
+        self.code.register_count = max(self.code.register_count, reg + 1)
+        return reg
+
+    # Sentences
+    def emit_sentences(self, sentences):
+        for sentence in sentences:
+            self.emit_marker(sentence)
+            self.visit(sentence)
+
+    def emit_marker(self, sentence):
+        idx = self._sentence_idx[id(sentence)]
+        position = self.emit(SENTENCE, idx)
+        if self.code.entry_positions[idx] is None:
+            self.code.entry_positions[idx] = position
+        return position
+
+    def emit_recorded_expr(self, sentence, attr, dst):
+        # Recorded expressions are referenced by their sentence and attribute, so they
+        # can be found again on the program attached to unpickled bytecode.
+        expr = getattr(sentence, attr)
+        self.emit_expr(expr, dst)
+        self.code.expressions.append(expr)
+        self.code.recorded.append((self._sentence_idx[id(sentence)], attr))
+        self.emit(RECORD, len(self.code.expressions) - 1, dst)
+
+    def visit_skip(self, sentence, **kw):
+        pass
+
+    def visit_var_declaration(self, sentence, **kw):
+        slot = self.variable_slot(sentence.variable)
+        self.emit(DECLARE, slot, self.constant(sentence.var_type))
+
+    def visit_assignment(self, assignment, **kw):
+        self.emit_recorded_expr(assignment, "expr", 0)
+        dest = assignment.dest_variable
+        opcode = STORE if dest.traverse_path else STORE_NAME
+        self.emit(opcode, self.variable_slot(dest, first_register=1), 0)
+
+    def visit_builtin_call(self, sentence, **kw):
+        if sentence.name == "alloc":
+            self.emit(ALLOC, self.variable_slot(sentence.args[0]))
+        elif sentence.name == "free":
+            self.emit(FREE, self.variable_slot(sentence.args[0]))
+        else:
+            self.emit(RAISE, self.constant(f"Unknown builtin call {sentence.name}"))
+
+    def visit_if(self, if_sent, **kw):
+        self.emit_recorded_expr(if_sent, "guard", 0)
+        to_else = self.emit(JUMP_IF_FALSE, 0, None)
+        self.emit_sentences(if_sent.then_sentences)
+        to_end = self.emit(JUMP, None)
+        self.patch_jump(to_else, self.current_position)
+        self.emit_sentences(if_sent.else_sentences)
+        self.patch_jump(to_end, self.current_position)
+
+    def visit_while(self, sentence, **kw):
+        guard_position = self.code.entry_positions[self._sentence_idx[id(sentence)]]
+        self.emit_recorded_expr(sentence, "guard", 0)
+        to_exit = self.emit(JUMP_IF_FALSE, 0, None)
+        self.emit_sentences(sentence.sentences)
+        self.emit(JUMP, guard_position)
+        self.patch_jump(to_exit, self.current_position)
+
+    def visit_for(self, for_sent, **kw):
+        # Entering the loop and iterating are different paths. Both start with a SENTENCE
+        # instruction, so hooks see each evaluation of the for as a step.
+        #   [SENTENCE] declare var, eval start -> r0, jump to check
+        #   [SENTENCE] r0 = var +/- 1                  <- target of the back-edge
+        #   check: eval end -> r1, exit if no iterations left
+        #   body..., jump back
+        slot = self.variable_slot(for_sent.loop_variable)
+        up = int(for_sent.direction_up)
+        self.emit(FOR_DECLARE, slot)
+        self.emit_recorded_expr(for_sent, "start", 0)
+        to_check = self.emit(JUMP, None)
+        next_iteration = self.emit_marker(for_sent)
+        self.emit(FOR_NEXT, 0, slot, up)
+        self.patch_jump(to_check, self.current_position)
+        self.emit_recorded_expr(for_sent, "end", self.use_register(1))
+        to_exit = self.emit(FOR_CHECK, 0, 1, slot, up, None)
+        self.emit_sentences(for_sent.sentences)
+        self.emit(JUMP, next_iteration)
+        self.patch_jump(to_exit, self.current_position)
+
+    # Expressions. Each expression leaves its value on register dst, and may use any
+    # register above dst as temporary storage.
+    def emit_expr(self, expr, dst):
+        self.use_register(dst)
+        self.visit(expr, dst=dst)
+
+    def emit_literal(self, expr, dst, **kw):
+        value = ExpressionEvaluator().eval(expr, state=None)
+        self.emit(LOAD_CONST, dst, self.constant(value))
+
+    visit_enum_literal = emit_literal
+    visit_boolean_literal = emit_literal
+    visit_null_literal = emit_literal
+    visit_char_literal = emit_literal
+    visit_integer_literal = emit_literal
+    visit_real_literal = emit_literal
+
+    def visit_variable(self, var, dst, **kw):
+        opcode = LOAD_VAR if var.traverse_path else LOAD_NAME
+        self.emit(opcode, dst, self.variable_slot(var, first_register=dst + 1))
+
+    def visit_unary_op(self, expr, dst, **kw):
+        if expr.op not in UNARY_INDEX:
+            raise ExpressionEvaluationError(f"Invalid unary operator {expr.op}")
+        self.emit_expr(expr.expr, dst)
+        self.emit(UNARY, dst, UNARY_INDEX[expr.op], dst)
+
+    def visit_binary_op(self, expr, dst, **kw):
+        if expr.op in ("||", "&&"):
+            # short-circuit evaluation
+            jump = JUMP_IF_TRUE if expr.op == "||" else JUMP_IF_FALSE
+            self.emit_expr(expr.left, dst)
+            to_end = self.emit(jump, dst, None)
+            self.emit_expr(expr.right, dst)
+            self.patch_jump(to_end, self.current_position)
+            return
+        if expr.op not in BINARY_INDEX:
+            raise ExpressionEvaluationError(f"Invalid binary operator {expr.op}")
+        self.emit_expr(expr.left, dst)
+        self.emit_expr(expr.right, dst + 1)
+        self.emit(BINARY, dst, BINARY_INDEX[expr.op], dst, dst + 1)
+
+    def visit(self, node, *args, **kwargs):
+        # Children are lowered explicitly (registers need to be assigned), so
+        # there's no need for NodeVisitor to visit them first.
+        return self.get_handler(type(node))(node, *args, **kwargs)
+
+
+def compile_program(program):
+    return BytecodeCompiler().compile(program)
+
+
+class BytecodeVM:
+    """
+    Executes Bytecode. Same interface than SentenceEvaluator: each call to eval runs
+    the instructions of a sentence, until the next sentence boundary is reached.
+    """
+
+    capture_expressions = True
+
+    def __init__(self, bytecode):
+        self.code = bytecode
+        self.registers = [None] * bytecode.register_count
+        self.expression_evaluator = RegisterReader(self.registers)
+        # Cells of plain variables, by slot. Kept while the layout of the state is the same
+        # (see State.layout_version). Variables with traversal steps are compiled accesses.
+        self.frame = [None] * len(bytecode.variables)
+        self.frame_version = None
+        self.accesses = [
+            VariableAccess(var, self.expression_evaluator) if var.traverse_path else None
+            for var in bytecode.variables
+        ]
+        self.intermediate_evaluated_expressions = {}
+        self.resume_sentence = None
+        self.resume_position = None
+
+    def flush_intermediate_evaluated_expressions(self):
+        result = self.intermediate_evaluated_expressions
+        self.intermediate_evaluated_expressions = {}
+        return result
+
+    def eval(self, sentence, state):
+        # Returns (new_state, next_sentence)
+        if sentence is self.resume_sentence:
+            pc = self.resume_position
+        else:
+            pc = self.code.entry_points[id(sentence)]
+        next_sentence, self.resume_position = self.run(pc + 1, state)
+        self.resume_sentence = next_sentence
+        return state, next_sentence
+
+    def sync_frame(self, state):
+        if state.layout_version != self.frame_version:
+            self.frame[:] = [None] * len(self.frame)
+            self.frame_version = state.layout_version
+
+    def frame_cell(self, slot, state):
+        var = self.code.variables[slot]
+        cell = state.stack.get(var.name)
+        if cell is None or not cell.can_get_set_values_directly:
+            state.get_variable_value(var)  # raises the error
+        self.frame[slot] = cell
+        return cell
+
+    def run(self, pc, state):
+        instructions = self.code.instructions
+        constants = self.code.constants
+        expressions = self.code.expressions
+        variables = self.code.variables
+        accesses = self.accesses
+        frame = self.frame
+        regs = self.registers
+        intermediate = self.intermediate_evaluated_expressions
+        if state.layout_version != self.frame_version:
+            self.sync_frame(state)
+        # Otherwise, the state logs the writes (or copies cells before writing them)
+        in_place = state.write_log is None and state.writes_in_place
+        while True:
+            ins = instructions[pc]
+            opcode = ins[0]
+            pc += 1
+            if opcode == SENTENCE:
+                return self.code.sentences[ins[1]], pc - 1
+            elif opcode == LOAD_NAME:
+                cell = frame[ins[2]]
+                if cell is None:
+                    cell = self.frame_cell(ins[2], state)
+                regs[ins[1]] = cell.value
+            elif opcode == LOAD_CONST:
+                regs[ins[1]] = constants[ins[2]]
+            elif opcode == BINARY:
+                regs[ins[1]] = BINARY_OPERATORS[ins[2]][1](regs[ins[3]], regs[ins[4]])
+            elif opcode == STORE_NAME:
+                value = regs[ins[2]]
+                if not in_place:
+                    state.set_variable_value(variables[ins[1]], value)
+                    self.sync_frame(state)
+                    continue
+                cell = frame[ins[1]]
+                if cell is None:
+                    cell = self.frame_cell(ins[1], state)
+                if cell.read_only or (
+                    type(value) is not VALUE_TYPES.get(type(cell.var_type))
+                    and not cell.var_type.is_valid_value(value)
+                ):
+                    state.set_variable_value(variables[ins[1]], value)  # raises the error
+                cell.value = value
+            elif opcode == LOAD_VAR:
+                regs[ins[1]] = accesses[ins[2]].read(state)
+            elif opcode == STORE:
+                accesses[ins[1]].write(state, regs[ins[2]])
+                if not in_place:
+                    self.sync_frame(state)
+            elif opcode == RECORD:
+                if self.capture_expressions:
+                    intermediate[expressions[ins[1]]] = regs[ins[2]]
+            elif opcode == JUMP:
+                pc = ins[1]
+            elif opcode == JUMP_IF_FALSE:
+                if not regs[ins[1]]:
+                    pc = ins[2]
+            elif opcode == JUMP_IF_TRUE:
+                if regs[ins[1]]:
+                    pc = ins[2]
+            elif opcode == UNARY:
+                regs[ins[1]] = UNARY_OPERATORS[ins[2]][1](regs[ins[3]])
+            elif opcode == FOR_NEXT:
+                cell = frame[ins[2]]
+                if cell is None:
+                    cell = self.frame_cell(ins[2], state)
+                regs[ins[1]] = cell.value + 1 if ins[3] else cell.value - 1
+            elif opcode == FOR_CHECK:
+                _, value_reg, end_reg, slot, up, exit_target = ins
+                value, end = regs[value_reg], regs[end_reg]
+                if (value <= end) if up else (value >= end):
+                    cell = frame[slot]
+                    if in_place and cell is not None and type(value) is int:
+                        cell.value = value  # the loop variable is a read-only int
+                    else:
+                        var = variables[slot]
+                        state.set_variable_value(var, value, permit_write_on_read_only=True)
+                        self.sync_frame(state)
+                else:
+                    state.undeclare_static_variable(variables[slot].name)
+                    self.sync_frame(state)
+                    pc = exit_target
+            elif opcode == FOR_DECLARE:
+                name = variables[ins[1]].name
+                if name in state.list_declared_variables():
+                    raise RuntimeError(f"Variable {name} is already declared.")
+                state.declare_static_variable(name, IntType(), read_only=True)
+                self.sync_frame(state)
+            elif opcode == DECLARE:
+                var_type = constants[ins[2]]
+                if isinstance(var_type, ArrayOf):
+                    var_type = var_type.with_evaluated_axes(self.expression_evaluator, state)
+                state.declare_static_variable(variables[ins[1]].name, var_type)
+                self.sync_frame(state)
+            elif opcode == ALLOC:
+                state.alloc(variables[ins[1]])
+                self.sync_frame(state)
+            elif opcode == FREE:
+                state.free(variables[ins[1]])
+                self.sync_frame(state)
+            elif opcode == HALT:
+                return None, pc - 1
+            elif opcode == RAISE:
+                raise TomosRuntimeError(constants[ins[1]])
+            else:
+                raise TomosRuntimeError(f"Unknown opcode {opcode}")
+
+
+class RegisterReader:
+    """
+    Expression evaluator of the states run by the VM. The index expressions of variable
+    paths were lowered to registers, so evaluating them is reading the register.
+    Expressions that are not lowered (sizes of arrays, on their types) are compiled.
+    """
+
+    def __init__(self, registers):
+        self.registers = registers
+        self.compiler = ExpressionCompiler()
+
+    def compile(self, expr):
+        # Same interface as ExpressionCompiler, so variable paths can be compiled
+        # (see VariableAccess)
+        if type(expr) is int:
+            registers = self.registers
+            return lambda state: registers[expr]
+        return self.compiler.compile(expr)
+
+    def eval(self, expr, state):
+        if type(expr) is int:
+            return self.registers[expr]
+        return self.compiler.eval(expr, state)
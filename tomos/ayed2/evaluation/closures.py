@@ -0,0 +1,407 @@
+import operator
+
+from tomos.ayed2.ast.types import ArrayOf, BoolType, IntType, RealType, Tuple
+from tomos.ayed2.evaluation.expressions import ExpressionEvaluator
+from tomos.exceptions import ExpressionEvaluationError, TomosRuntimeError
+from tomos.visit import NodeVisitor
+
+
+UNARY_OPERATORS = {
+    "-": operator.neg,
+    "+": operator.pos,
+    "!": operator.not_,
+}
+
+BINARY_OPERATORS = {
+    "+": operator.add,
+    "-": operator.sub,
+    "*": operator.mul,
+    "/": operator.truediv,
+    "%": operator.mod,
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+
+# Values of these python types are always valid for these types (checked before the
+# generic is_valid_value, which is slower)
+VALUE_TYPES = {IntType: int, RealType: float, BoolType: bool}
+
+
+class ExpressionCompiler(NodeVisitor):
+    """
+    Compiles expressions into python closures. Each closure receives the state and
+    returns the value of the expression. Each expression is compiled only once.
+    """
+
+    def __init__(self):
+        self.compiled = {}
+        self.literal_evaluator = ExpressionEvaluator()
+        self.literal_values = {}  # closure of a literal -> its value
+
+    def compile(self, expr):
+        closure = self.compiled.get(expr)
+        if closure is None:
+            closure = self.compiled[expr] = self.visit(expr)
+        return closure
+
+    def eval(self, expr, state):
+        # Same interface as ExpressionEvaluator, so State can use it for array indexing.
+        return self.compile(expr)(state)
+
+    def compile_literal(self, expr):
+        # Literals do not depend on the state. They are evaluated once, when compiling.
+        value = self.literal_evaluator.eval(expr, state=None)
+
+        def literal(state):
+            return value
+
+        self.literal_values[literal] = value
+        return literal
+
+    def visit_enum_literal(self, expr, children):
+        return self.compile_literal(expr)
+
+    visit_boolean_literal = visit_enum_literal
+    visit_null_literal = visit_enum_literal
+    visit_char_literal = visit_enum_literal
+    visit_integer_literal = visit_enum_literal
+    visit_real_literal = visit_enum_literal
+
+    def visit_unary_op(self, expr, children):
+        assert len(children) == 1
+        if expr.op not in UNARY_OPERATORS:
+            raise ExpressionEvaluationError(f"Invalid unary operator {expr.op}")
+        op = UNARY_OPERATORS[expr.op]
+        sub_expr = children[0]
+        return lambda state: op(sub_expr(state))
+
+    def visit_binary_op(self, expr, children):
+        assert len(children) == 2
+        left, right = children
+        if expr.op == "||":
+
+            def _or(state):
+                if left(state):
+                    return True
+                return right(state)
+
+            return _or
+        if expr.op == "&&":
+
+            def _and(state):
+                if not left(state):
+                    return False
+                return right(state)
+
+            return _and
+
+        if expr.op not in BINARY_OPERATORS:
+            raise ExpressionEvaluationError(f"Invalid binary operator {expr.op}")
+        op = BINARY_OPERATORS[expr.op]
+        if right in self.literal_values:  # as in "i + 1". Saves a call on each evaluation
+            right_value = self.literal_values[right]
+            return lambda state: op(left(state), right_value)
+        return lambda state: op(left(state), right(state))
+
+    def visit_lazy_expr(self, expr, children):
+        # Laziness is handled by the closures of && and ||
+        return self.compile(expr.expr)
+
+    def visit_variable(self, var, children):
+        return self.compile_access(var).read
+
+    def compile_access(self, var):
+        access = self.compiled.get(("access", var))
+        if access is None:
+            access = self.compiled[("access", var)] = VariableAccess(var, self)
+        return access
+
+
+class VariableAccess:
+    """
+    Compiled reads and writes of a variable. The leading part of its path that doesn't
+    depend on the state (the name, and the fields accessed right after it) is resolved
+    to a cell and checked once. That cell is kept until the layout of the state changes
+    (see State.layout_version). Array indexes and dereferences are walked on each access.
+    Whenever a check fails, the state walks the whole path again, and raises the error.
+    """
+
+    def __init__(self, var, compiler):
+        self.var = var
+        path = var.traverse_path
+        static_len = 0
+        while static_len < len(path) and path[static_len].kind == var.ACCESSED_FIELD:
+            static_len += 1
+        self.static_fields = [step.argument for step in path[:static_len]]
+        self.steps = [self.compile_step(step, compiler) for step in path[static_len:]]
+        self.read = self.build_reader()
+        self.write = self.build_writer()
+
+    def resolve(self, state):
+        cell = state.stack.get(self.var.name)
+        for field in self.static_fields:
+            if cell is None or not isinstance(cell.var_type, Tuple):
+                cell = None
+                break
+            cell = cell.sub_cells.get(field)
+        if cell is None:
+            state.cell_after_traversal(self.var)  # raises the error
+        return cell
+
+    def compile_step(self, step, compiler):
+        var = self.var
+        if step.kind == var.DEREFERENCE:
+
+            def dereference(cell, state):
+                pointed = state.heap.get(cell.value)
+                if pointed is None:
+                    state.cell_after_traversal(var)  # raises the error
+                return pointed
+
+            return dereference
+        if step.kind == var.ARRAY_INDEXING:
+            return self.compile_indexing([compiler.compile(expr) for expr in step.argument])
+        if step.kind == var.ACCESSED_FIELD:
+            field = step.argument
+
+            def access_field(cell, state):
+                if isinstance(cell.var_type, Tuple) and field in cell.sub_cells:
+                    return cell.sub_cells[field]
+                state.cell_after_traversal(var)  # raises the error
+
+            return access_field
+        raise NotImplementedError(f"Unknown step kind {step.kind}")
+
+    def compile_indexing(self, indexes):
+        var = self.var
+
+        def sub_cell_at(cell, state, evaluated_indexes):
+            try:
+                return cell[evaluated_indexes]
+            except IndexError:
+                state.cell_after_traversal(var)  # raises the error
+
+        if len(indexes) != 1:
+            return lambda cell, state: sub_cell_at(cell, state, [idx(state) for idx in indexes])
+
+        [single] = indexes
+        array_type, start, stop = None, 0, 0
+
+        def index(cell, state):
+            # Indexes within the bounds of one-axis arrays are mapped here. Anything else
+            # (errors included) is left to the array type.
+            nonlocal array_type, start, stop
+            if cell.var_type is not array_type:
+                array_type = cell.var_type
+                start, stop = 0, 0
+                if len(array_type.axes) == 1:
+                    start, stop = array_type.axes[0].from_value, array_type.axes[0].to_value
+            value = single(state)
+            if type(value) is int and start <= value < stop:
+                return cell.sub_cells[value - start]
+            return sub_cell_at(cell, state, [value])
+
+        return index
+
+    def build_reader(self):
+        var, resolve, steps = self.var, self.resolve, self.steps
+        version, resolved = None, None
+
+        if not steps:
+
+            def read(state):
+                nonlocal version, resolved
+                if state.layout_version != version:
+                    resolved, version = resolve(state), state.layout_version
+                    if not resolved.can_get_set_values_directly:
+                        state.get_variable_value(var)  # raises the error
+                return resolved.value
+
+            return read
+
+        def read(state):
+            nonlocal version, resolved
+            if state.layout_version != version:
+                resolved, version = resolve(state), state.layout_version
+            cell = resolved
+            for step in steps:
+                cell = step(cell, state)
+            if not cell.can_get_set_values_directly:
+                state.get_variable_value(var)  # raises the error
+            return cell.value
+
+        return read
+
+    def build_writer(self):
+        var, resolve, steps = self.var, self.resolve, self.steps
+        version, resolved = None, None
+
+        def write(state, value):
+            nonlocal version, resolved
+            if state.write_log is not None or not state.writes_in_place:
+                # the state logs the write (or copies the cell before writing it)
+                state.set_variable_value(var, value)
+                return
+            if state.layout_version != version:
+                resolved, version = resolve(state), state.layout_version
+            cell = resolved
+            for step in steps:
+                cell = step(cell, state)
+            if (
+                not cell.can_get_set_values_directly
+                or cell.read_only
+                or (
+                    type(value) is not VALUE_TYPES.get(type(cell.var_type))
+                    and not cell.var_type.is_valid_value(value)
+                )
+            ):
+                state.set_variable_value(var, value)  # raises the error
+            cell.value = value
+
+        return write
+
+
+class ClosureSentenceEvaluator(NodeVisitor):
+    """
+    Alternative to SentenceEvaluator. Compiles each sentence (the first time it's executed)
+    into a closure that receives the state and returns the next sentence to execute.
+    """
+
+    capture_expressions = True
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.expression_evaluator = ExpressionCompiler()
+        self.intermediate_evaluated_expressions = {}
+        self.compiled = {}  # Maps id(sentence) -> closure
+        self.loops_in_progress = set()  # ids of For sentences. Never stored on the AST.
+
+    def flush_intermediate_evaluated_expressions(self):
+        result = self.intermediate_evaluated_expressions
+        self.intermediate_evaluated_expressions = {}
+        return result
+
+    def eval(self, sentence, state):
+        # Evaluate the sentence in a given state.
+        # Returns (new_state, next_sentence)
+        closure = self.compiled.get(id(sentence))
+        if closure is None:
+            closure = self.compiled[id(sentence)] = self.visit(sentence)
+        return state, closure(state)
+
+    def compile_expr(self, expr):
+        # Compiles an expression whose value is remembered as an intermediate
+        # evaluated expression (usefull for UI and hooks in general).
+        compiled = self.expression_evaluator.compile(expr)
+        if not self.capture_expressions:
+            return compiled
+
+        def evaluate(state):
+            value = compiled(state)
+            self.intermediate_evaluated_expressions[expr] = value
+            return value
+
+        return evaluate
+
+    def visit_if(self, if_sent, **kw):
+        guard = self.compile_expr(if_sent.guard)
+        next_sent = if_sent.next_instruction
+        then_sent = if_sent.then_sentences[0] if if_sent.then_sentences else next_sent
+        else_sent = if_sent.else_sentences[0] if if_sent.else_sentences else next_sent
+
+        def run_if(state):
+            if guard(state):
+                return then_sent
+            return else_sent
+
+        return run_if
+
+    def visit_while(self, sentence, **kw):
+        guard = self.compile_expr(sentence.guard)
+        first_sent = sentence.sentences[0]
+        next_sent = sentence.next_instruction
+
+        def run_while(state):
+            if guard(state):
+                return first_sent
+            return next_sent
+
+        return run_while
+
+    def visit_for(self, for_sent, **kw):
+        var = for_sent.loop_variable
+        start = self.compile_expr(for_sent.start)
+        end = self.compile_expr(for_sent.end)
+        first_sent = for_sent.sentences[0]
+        next_sent = for_sent.next_instruction
+        read_var = self.expression_evaluator.compile_access(var).read
+        loop_id = id(for_sent)
+        loops_in_progress = self.loops_in_progress
+
+        def run_for(state):
+            if loop_id not in loops_in_progress:  # Starting for loop.
+                if var.name in state.list_declared_variables():
+                    raise RuntimeError(f"Variable {var.name} is already declared.")
+                state.declare_static_variable(var.name, IntType(), read_only=True)
+                next_value = start(state)
+            else:
+                next_value = for_sent.next_value(read_var(state))
+            end_value = end(state)
+            if for_sent.has_iterations_left(next_value, end_value):
+                state.set_variable_value(var, next_value, permit_write_on_read_only=True)
+                loops_in_progress.add(loop_id)
+                return first_sent
+            loops_in_progress.discard(loop_id)
+            state.undeclare_static_variable(var.name)
+            return next_sent
+
+        return run_for
+
+    def visit_skip(self, sentence, **kw):
+        next_sent = sentence.next_instruction
+        return lambda state: next_sent
+
+    def visit_var_declaration(self, sentence, **kw):
+        name, var_type = sentence.name, sentence.var_type
+        next_sent = sentence.next_instruction
+        expression_evaluator = self.expression_evaluator
+
+        def run_var_declaration(state):
+            if isinstance(var_type, ArrayOf):
+                state.declare_static_variable(
+                    name, var_type.with_evaluated_axes(expression_evaluator, state)
+                )
+            else:
+                state.declare_static_variable(name, var_type)
+            return next_sent
+
+        return run_var_declaration
+
+    def visit_assignment(self, assignment, **kw):
+        write = self.expression_evaluator.compile_access(assignment.dest_variable).write
+        expr = self.compile_expr(assignment.expr)
+        next_sent = assignment.next_instruction
+
+        def run_assignment(state):
+            write(state, expr(state))
+            return next_sent
+
+        return run_assignment
+
+    def visit_builtin_call(self, sentence, **kw):
+        name = sentence.name
+        if name not in ["alloc", "free"]:
+            raise TomosRuntimeError(f"Unknown builtin call {sentence.name}")
+        variable = sentence.args[0]
+        next_sent = sentence.next_instruction
+
+        def run_builtin_call(state):
+            getattr(state, name)(variable)
+            return next_sent
+
+        return run_builtin_call
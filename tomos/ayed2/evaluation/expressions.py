@@ -1,4 +1,11 @@
-from tomos.ayed2.ast.types import IntType, RealType, BoolType, CharType, PointerOf, type_registry
+from tomos.ayed2.ast.types import (
+    IntType,
+    RealType,
+    BoolType,
+    CharType,
+    PointerOf,
+    get_type_registry,
+)
 from tomos.exceptions import ExpressionEvaluationError
 from tomos.visit import NodeVisitor
 
@@ -9,7 +16,7 @@ class ExpressionEvaluator(NodeVisitor):
         return self.visit(expr, state=state)
 
     def visit_enum_literal(self, expr, children, state):
-        return type_registry.get_enum_constant(expr.value_str)
+        return get_type_registry().get_enum_constant(expr.value_str)
 
     def visit_boolean_literal(self, expr, children, state):
         if expr.value_str in BoolType.NAMED_LITERALS:
@@ -1,7 +1,9 @@
 import logging
 
 from tomos.ayed2.ast.expressions import Expr
-from tomos.ayed2.ast.types import ArrayOf, IntType
+from tomos.ayed2.ast.types import ArrayOf, IntType, use_type_registry
+from tomos.ayed2.evaluation.bytecode import BytecodeVM, compile_program
+from tomos.ayed2.evaluation.closures import ClosureSentenceEvaluator
 from tomos.ayed2.evaluation.expressions import ExpressionEvaluator
 from tomos.ayed2.evaluation.limits import LIMITER
 from tomos.ayed2.evaluation.state import State
@@ -18,32 +20,80 @@ class Interpreter:
     Exposes the public interface of interpreter.
     """
 
-    def __init__(self, ast, pre_hooks=None, post_hooks=None):
+    def __init__(
+        self,
+        ast,
+        pre_hooks=None,
+        post_hooks=None,
+        engine="visitor",
+        type_registry=None,
+        state_class=State,
+    ):
         self.ast = ast
+        self.state_class = state_class  # Example: PersistentState, for cheap snapshots
+        # Registry where the types of the program were registered when parsing.
+        # If None, the one in use when running.
+        self.type_registry = type_registry
         self.pre_hooks = pre_hooks or []
         self.post_hooks = post_hooks or []
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown engine {engine}. Available engines are: {list(ENGINES)}")
+        self.engine = engine
 
     def run(self, initial_state=None):
+        with use_type_registry(self.type_registry):
+            return self._run(initial_state)
+
+    def _run(self, initial_state):
         # Type Definitions are processed at parsing time. No need to run them here now.
         # Section for funcprocdefs are not implemented yet. No need to run them here now.
 
         # So far, we just need to run the body.
         self.execution_counter = 0
-        self.sent_evaluator = SentenceEvaluator()
+        self.sent_evaluator = self.build_sentence_evaluator()
         self.last_executed_sentence = None  # For hooks
         if initial_state:
             state = initial_state
             self._run_post_hooks(state)
         else:
-            state = State()
+            state = self.state_class()
         state.set_expressions_evaluator(self.sent_evaluator.expression_evaluator)
         next_sent = self.get_entry_point()
+        if not self.pre_hooks and not self.post_hooks:
+            return self._run_without_hooks(next_sent, state)
         while next_sent is not None:
             state, next_sent = self._run_sentence(next_sent, state)
             self.execution_counter += 1
             LIMITER.check_execution_counter_limits(self)
         return state
 
+    def _run_without_hooks(self, next_sent, state):
+        # Same loop than run, without the per-step bookkeeping that only hooks need.
+        # The steps limit is read once: reading configs costs as much as a simple step.
+        evaluate = self.sent_evaluator.eval
+        limit = LIMITER.execution_steps_limit()
+        while next_sent is not None:
+            state, next_sent = evaluate(next_sent, state)
+            self.execution_counter += 1
+            if limit is not None and self.execution_counter > limit:
+                LIMITER.check_execution_counter_limits(self)
+        return state
+
+    def build_sentence_evaluator(self):
+        klass = ENGINES[self.engine]
+        if klass is BytecodeVM:
+            # the whole program is lowered before running it
+            evaluator = klass(compile_program(self.ast))
+        else:
+            evaluator = klass()
+        evaluator.capture_expressions = self.needs_expression_values()
+        return evaluator
+
+    def needs_expression_values(self):
+        # Post hooks receive the values of the expressions evaluated on each step, unless
+        # they declare they don't need them.
+        return any(getattr(hook, "needs_expression_values", True) for hook in self.post_hooks)
+
     def get_entry_point(self):
         # just the first instruction of the body. Can be changed in the future
         return next(iter(self.ast.body))
@@ -67,6 +117,7 @@ class Interpreter:
         expr_cache = self.sent_evaluator.flush_intermediate_evaluated_expressions()
         for hook in self.post_hooks:
             hook(self.last_executed_sentence, state, expr_cache)
+        state.clear_write_log()
 
 
 class SentenceEvaluator(NodeVisitor):
@@ -74,10 +125,15 @@ class SentenceEvaluator(NodeVisitor):
     Evaluates sentences
     """
 
+    capture_expressions = True
+
     def __init__(self) -> None:
         super().__init__()
         self.expression_evaluator = ExpressionEvaluator()
         self.intermediate_evaluated_expressions = {}
+        # Execution data lives on the evaluator (one per run), never on the AST, so the same
+        # parsed program can be executed many times, even concurrently.
+        self.loops_in_progress = set()  # ids of For sentences
         # This intermediate-evaluated-expressions is a cache usefull for UI and hooks in general
         # to know what's the value of some evaluated expressions during executing.
         # Example: how was the guard of an if evaluated
@@ -121,38 +177,38 @@ class SentenceEvaluator(NodeVisitor):
 
     def visit_for(self, for_sent, state, **kw):
         var = for_sent.loop_variable
-        if not for_sent.loop_in_progress: # Starting for loop.
+        if id(for_sent) not in self.loops_in_progress:  # Starting for loop.
             if var.name in state.list_declared_variables():
                 raise RuntimeError(f"Variable {var.name} is already declared.")
             state.declare_static_variable(var.name, IntType(), read_only=True)
-            for_sent.remove_loop_variable = True
             next_value = self.visit_expr(for_sent.start, state=state)
         else:
             next_value = for_sent.next_value(state.get_variable_value(var))
         end_value = self.visit_expr(for_sent.end, state=state)
         if for_sent.has_iterations_left(next_value, end_value):
             state.set_variable_value(var, next_value, permit_write_on_read_only=True)
-            for_sent.loop_in_progress = True
+            self.loops_in_progress.add(id(for_sent))
             next_sent = for_sent.sentences[0]
         else:
-            for_sent.loop_in_progress = False
-            if for_sent.remove_loop_variable:
-                state.undeclare_static_variable(var.name)
+            self.loops_in_progress.discard(id(for_sent))
+            state.undeclare_static_variable(var.name)
             next_sent = for_sent.next_instruction
         return state, next_sent
 
     def visit_expr(self, expr, state, **kw):
         value = self.expression_evaluator.eval(expr, state)
-        self.intermediate_evaluated_expressions[expr] = value
+        if self.capture_expressions:
+            self.intermediate_evaluated_expressions[expr] = value
         return value
 
     def visit_skip(self, sentence, state, **kw):
         return state, sentence.next_instruction
 
     def visit_var_declaration(self, sentence, state, **kw):
-        if isinstance(sentence.var_type, ArrayOf):
-            sentence.var_type.eval_axes_expressions(self.expression_evaluator, state)
-        state.declare_static_variable(sentence.name, sentence.var_type)
+        var_type = sentence.var_type
+        if isinstance(var_type, ArrayOf):
+            var_type = var_type.with_evaluated_axes(self.expression_evaluator, state)
+        state.declare_static_variable(sentence.name, var_type)
         return state, sentence.next_instruction
 
     def visit_assignment(self, assignment, state, **kw):
@@ -170,3 +226,11 @@ class SentenceEvaluator(NodeVisitor):
         else:
             raise TomosRuntimeError(f"Unknown builtin call {sentence.name}")
         return state, sentence.next_instruction
+
+
+# Engines are interchangeable sentence evaluators. All of them share the same interface.
+ENGINES = {
+    "visitor": SentenceEvaluator,
+    "closures": ClosureSentenceEvaluator,
+    "bytecode": BytecodeVM,
+}
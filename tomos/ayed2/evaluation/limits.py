@@ -72,19 +72,18 @@ class Limiter:
         # checks that the memory size is not exceeded both in stack and heap
         lim_stack = self._limits.MAXIMUM_STACK_CELLS
         lim_heap = self._limits.MAXIMUM_HEAP_CELLS
-        if lim_stack is not None:
-            count = sum(cell.cell_count for cell in state_object.stack.values())
-            if count > lim_stack:
-                raise MemoryLimitExceededError()
+        # State keeps the cell counts updated, so there's no need to traverse the memory.
+        if lim_stack is not None and state_object.stack_cell_count > lim_stack:
+            raise MemoryLimitExceededError()
 
-        if lim_heap is not None:
-            count = sum(cell.cell_count for cell in state_object.heap.values())
-            if count > lim_heap:
-                raise MemoryLimitExceededError()
-        pass
+        if lim_heap is not None and state_object.heap_cell_count > lim_heap:
+            raise MemoryLimitExceededError()
+
+    def execution_steps_limit(self):
+        return self._limits.EXECUTION_STEPS_LIMIT
 
     def check_execution_counter_limits(self, interpreter):
-        lim_steps = self._limits.EXECUTION_STEPS_LIMIT
+        lim_steps = self.execution_steps_limit()
         if lim_steps is not None and interpreter.execution_counter > lim_steps:
             raise ExecutionStepsLimitExceededError()
 
@@ -1,3 +1,5 @@
+from copy import deepcopy
+
 from tomos.ayed2.ast.types import ArrayOf, Tuple
 from tomos.ayed2.evaluation.unknown_value import UnknownValue
 
@@ -29,12 +31,20 @@ class MemoryAddress:
     STACK = "S"
     HEAP = "H"
     PARTITIONS = [STACK, HEAP]
+    __slots__ = ("partition", "address")
 
     def __init__(self, partition, address):
         assert partition in MemoryAddress.PARTITIONS
         self.partition = partition
         self.address = address
 
+    def __setstate__(self, state):
+        set_slots_from_state(self, state)
+
+    def __deepcopy__(self, memo):
+        # never modified once built, so copies of states can share them
+        return self
+
     def __str__(self):
         return f"{self.partition}{self.address:05x}"
 
@@ -54,16 +64,55 @@ class MemoryAddress:
 
 
 class MetaMemCell:
+    # Cells are slotted: a state holds lots of them, and snapshots copy them all.
     can_get_set_values_directly = False
     read_only = False
+    __slots__ = ("owner",)  # used by copy-on-write states
+    # Types don't change at run time, so copies share them (like they share addresses)
+    type_slots = ("var_type", "array_type", "tuple_type")
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.slot_names = MetaMemCell.__slots__ + cls.__slots__
+        cls.copied_slot_names = tuple(n for n in cls.slot_names if n not in cls.type_slots)
+        cls.shared_slot_names = tuple(n for n in cls.slot_names if n in cls.type_slots)
+
+    def __setstate__(self, state):
+        self.owner = None
+        set_slots_from_state(self, state)
+        if not hasattr(self, "cell_count"):  # clusters pickled before cells were counted
+            self.cell_count = self.count_cells()
+
+    def __copy__(self):
+        return self.copy_slots(lambda value: value)
+
+    def __deepcopy__(self, memo):
+        return self.copy_slots(lambda value: deepcopy(value, memo), memo)
+
+    def copy_slots(self, copy_value, memo=None):
+        # Faster than the generic copy of slotted objects
+        result = object.__new__(type(self))
+        if memo is not None:
+            memo[id(self)] = result
+        for name in self.copied_slot_names:
+            try:
+                value = getattr(self, name)
+            except AttributeError:
+                continue  # not set yet (like the address of a tuple cluster)
+            setattr(result, name, copy_value(value))
+        for name in self.shared_slot_names:
+            setattr(result, name, getattr(self, name))
+        return result
 
 
 class MemoryCell(MetaMemCell):
     can_get_set_values_directly = True
     cell_count = 1
+    __slots__ = ("address", "var_type", "read_only", "value")
 
     def __init__(self, address, var_type, value=None, read_only=False):
         assert isinstance(address, MemoryAddress)
+        self.owner = None
         self.address = address
         self.var_type = var_type
         self.read_only = read_only
@@ -78,10 +127,18 @@ class MemoryCell(MetaMemCell):
 
 
 class ArrayCellCluster(MetaMemCell):
+    __slots__ = ("array_type", "sub_cells", "cell_count")
+
     def __init__(self, array_type, elements):
         assert isinstance(array_type, ArrayOf)
+        self.owner = None
         self.array_type = array_type
         self.sub_cells = elements
+        # the shape of a cluster never changes, so it's counted only once
+        self.cell_count = self.count_cells()
+
+    def count_cells(self):
+        return sum(cell.cell_count for cell in self.sub_cells)
 
     def __repr__(self):
         return f"ArrayCellCluster({self.array_type}, {self.sub_cells})"
@@ -94,10 +151,6 @@ class ArrayCellCluster(MetaMemCell):
     def address(self):
         return self.sub_cells[0].address
 
-    @property
-    def cell_count(self):
-        return sum(cell.cell_count for cell in self.sub_cells)
-
     @property
     def value(self):
         # used by the UIs. Because of that, only importing here
@@ -120,10 +173,17 @@ class ArrayCellCluster(MetaMemCell):
 
 
 class TupleCellCluster(MetaMemCell):
+    __slots__ = ("tuple_type", "sub_cells", "cell_count", "_address")
+
     def __init__(self, tuple_type, sub_cells):
         assert isinstance(tuple_type, Tuple)
+        self.owner = None
         self.tuple_type = tuple_type
         self.sub_cells = sub_cells
+        self.cell_count = self.count_cells()
+
+    def count_cells(self):
+        return sum(cell.cell_count for cell in self.sub_cells.values())
 
     @property
     def var_type(self):
@@ -136,10 +196,6 @@ class TupleCellCluster(MetaMemCell):
             self._address = min(sc.address for sc in self.sub_cells.values())
         return self._address
 
-    @property
-    def cell_count(self):
-        return sum(cell.cell_count for cell in self.sub_cells.values())
-
     @property
     def value(self):
         # used by the UIs & testing
@@ -147,3 +203,18 @@ class TupleCellCluster(MetaMemCell):
 
     def __repr__(self):
         return f"TupleCellCluster({self.tuple_type}, value={self.value})"
+
+
+def cell_at_path(cell, path):
+    # Walks sub-cells of clusters: flattened indexes for arrays, field names for tuples
+    for key in path:
+        cell = cell.sub_cells[key]
+    return cell
+
+
+def set_slots_from_state(obj, state):
+    # Unpickles slotted objects. Older versions pickled them with a __dict__.
+    if isinstance(state, tuple):
+        state = state[1]  # (__dict__, slots)
+    for name, value in state.items():
+        setattr(obj, name, value)
@@ -1,7 +1,7 @@
 from collections import namedtuple
 import pickle
 
-from tomos.ayed2.ast.types import type_registry
+from tomos.ayed2.ast.types import get_type_registry
 
 
 Execution = namedtuple("Execution", ["state", "type_registry"])
@@ -10,14 +10,18 @@ Execution = namedtuple("Execution", ["state", "type_registry"])
 class Persist:
 
     @staticmethod
-    def persist(execution_state, path):
-        to_dump = Execution(execution_state, type_registry)
+    def persist(execution_state, path, type_registry=None):
+        to_dump = Execution(execution_state, type_registry or get_type_registry())
+        data = pickle.dumps(to_dump)  # before opening the file: never leave it half written
         with open(path, "wb") as f:
-            pickle.dump(to_dump, f)
+            f.write(data)
 
     @staticmethod
-    def load_from_file(path):
+    def load_from_file(path, type_registry=None):
+        # Types of the persisted execution are merged into type_registry (or the one in use)
+        import tomos.ayed2.parser  # first, to avoid circular imports while unpickling
+
         with open(path, "rb") as f:
             exec = pickle.load(f)
-        type_registry.merge(exec.type_registry)
+        (type_registry or get_type_registry()).merge(exec.type_registry)
         return exec.state
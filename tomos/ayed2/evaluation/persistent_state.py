@@ -0,0 +1,228 @@
+from collections.abc import MutableMapping
+from copy import copy
+
+from tomos.ayed2.evaluation.state import State
+
+
+BITS = 5
+WIDTH = 1 << BITS
+MASK = WIDTH - 1
+HASH_BITS = 64
+HASH_MASK = (1 << HASH_BITS) - 1
+
+
+class _Entry:
+    __slots__ = ("key", "value", "hash")
+
+    def __init__(self, key, value, _hash):
+        self.key = key
+        self.value = value
+        self.hash = _hash
+
+
+class _Collision:
+    # Entries whose keys have the same hash
+    __slots__ = ("entries",)
+
+    def __init__(self, entries):
+        self.entries = entries
+
+
+def _set(node, entry, shift):
+    # Returns (new_node, added). Nodes are never modified, only copied.
+    idx = (entry.hash >> shift) & MASK
+    new_node = list(node) if node is not None else [None] * WIDTH
+    child = new_node[idx]
+    if child is None:
+        new_node[idx] = entry
+        return new_node, True
+    if type(child) is _Entry:
+        if child.key == entry.key:
+            new_node[idx] = entry
+            return new_node, False
+        if shift + BITS >= HASH_BITS:
+            new_node[idx] = _Collision([child, entry])
+            return new_node, True
+        sub_node, _ = _set(None, child, shift + BITS)
+        new_node[idx], _ = _set(sub_node, entry, shift + BITS)
+        return new_node, True
+    if type(child) is _Collision:
+        entries = [e for e in child.entries if e.key != entry.key]
+        added = len(entries) == len(child.entries)
+        new_node[idx] = _Collision(entries + [entry])
+        return new_node, added
+    new_node[idx], added = _set(child, entry, shift + BITS)
+    return new_node, added
+
+
+def _delete(node, key, _hash, shift):
+    # Returns the new node (None if empty). Raises KeyError if key is not present.
+    if node is None:
+        raise KeyError(key)
+    idx = (_hash >> shift) & MASK
+    child = node[idx]
+    if child is None:
+        raise KeyError(key)
+    if type(child) is _Entry:
+        if child.key != key:
+            raise KeyError(key)
+        new_child = None
+    elif type(child) is _Collision:
+        entries = [e for e in child.entries if e.key != key]
+        if len(entries) == len(child.entries):
+            raise KeyError(key)
+        new_child = _Collision(entries) if entries else None
+    else:
+        new_child = _delete(child, key, _hash, shift + BITS)
+    new_node = list(node)
+    new_node[idx] = new_child
+    if not any(new_node):
+        return None
+    return new_node
+
+
+class PersistentMap(MutableMapping):
+    """
+    Hash array mapped trie with path copying. Copies are O(1) and share all their
+    structure; each update only copies the nodes on the path to the updated key.
+    Iterates in insertion order, like dict.
+    """
+
+    def __init__(self, items=()):
+        self._root = None
+        # Keys in insertion order. Shared with copies until a key is added or deleted (not
+        # when updated), so ordering is kept incrementally.
+        self._keys = []
+        self._shared_keys = False
+        for key, value in dict(items).items():
+            self[key] = value
+
+    def __getitem__(self, key):
+        _hash = hash(key) & HASH_MASK
+        node, shift = self._root, 0
+        while node is not None:
+            child = node[(_hash >> shift) & MASK]
+            if child is None:
+                break
+            if type(child) is _Entry:
+                if child.key == key:
+                    return child.value
+                break
+            if type(child) is _Collision:
+                for entry in child.entries:
+                    if entry.key == key:
+                        return entry.value
+                break
+            node, shift = child, shift + BITS
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        self._root, added = _set(self._root, _Entry(key, value, hash(key) & HASH_MASK), 0)
+        if added:
+            self._own_keys().append(key)
+
+    def __delitem__(self, key):
+        self._root = _delete(self._root, key, hash(key) & HASH_MASK, 0)
+        self._own_keys().remove(key)
+
+    def _own_keys(self):
+        if self._shared_keys:
+            self._keys = list(self._keys)
+            self._shared_keys = False
+        return self._keys
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def items(self):
+        return [(key, self[key]) for key in self._keys]
+
+    def values(self):
+        return [self[key] for key in self._keys]
+
+    def copy(self):
+        result = copy(self)
+        self._shared_keys = result._shared_keys = True
+        return result
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_shared_keys"] = False  # unpickled keys are not shared
+        return state
+
+    def __repr__(self):
+        return f"PersistentMap({dict(self.items())})"
+
+
+class PersistentState(State):
+    """
+    State whose snapshots cost O(1). Memory is kept on persistent maps, and cells are
+    copied on write: before modifying a cell shared with a snapshot, it's copied
+    (together with the clusters containing it).
+    """
+
+    writes_in_place = False
+
+    def __init__(self):
+        super().__init__()
+        self.stack = PersistentMap()
+        self.heap = PersistentMap()
+        # Cells owned by this generation are not shared with any snapshot.
+        self.generation = object()
+
+    @classmethod
+    def from_state(cls, state):
+        result = cls()
+        result.allocator = state.allocator
+        result.stack = PersistentMap(state.stack)
+        result.heap = PersistentMap(state.heap)
+        result.recount_cells()
+        result.share_evaluator_of(state)
+        return result
+
+    def snapshot(self):
+        result = copy(self)
+        result.stack = self.stack.copy()
+        result.heap = self.heap.copy()
+        result.allocator = copy(self.allocator)
+        result.allocator.next_free_address = dict(self.allocator.next_free_address)
+        result.generation = object()
+        result.write_log = None
+        result.layout_changed()
+        result.share_evaluator_of(self)
+        # from now on, every existing cell is shared with the snapshot
+        self.generation = object()
+        return result
+
+    def cell_for_writing(self, var):
+        trail = []
+        self.cell_after_traversal(var, trail=trail)
+        if self.write_log is not None:
+            self.log_trail(trail)
+        cell = None
+        for holder, key in trail:
+            if holder is None:
+                holder = cell.sub_cells
+            cell = holder[key]
+            if cell.owner is not self.generation:
+                cell = self.own(cell)
+                holder[key] = cell
+                self.layout_changed()
+        return cell
+
+    def own(self, cell):
+        cell = copy(cell)
+        if hasattr(cell, "sub_cells"):
+            cell.sub_cells = cell.sub_cells.copy()
+        cell.owner = self.generation
+        return cell
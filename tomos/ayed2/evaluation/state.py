@@ -1,3 +1,6 @@
+from copy import deepcopy
+from itertools import count
+
 from tomos.ayed2.ast.types import ArrayOf, Tuple, Synonym
 from tomos.exceptions import (
     AlreadyDeclaredVariableError,
@@ -10,12 +13,100 @@ from tomos.ayed2.evaluation.memory import MemoryAllocator, MemoryAddress
 from tomos.ayed2.evaluation.unknown_value import UnknownValue
 from tomos.ayed2.evaluation.limits import LIMITER
 
+# Unique among all states, so a version tells both the state and the layout of its cells
+LAYOUT_VERSIONS = count()
+
 
 class State:
+    # When enabled (a dict, used as an ordered set), collects the names and heap addresses
+    # of the top-level cells declared, written, allocated or freed on the last step.
+    # Each one is mapped to the paths of the sub-cells written inside it (an ordered set
+    # too), or to None if the cell was touched as a whole.
+    write_log = None
+    # Whether compiled engines may write straight to the cells they resolved (see
+    # layout_version). Copy-on-write states need every write to go through cell_for_writing.
+    writes_in_place = True
+
     def __init__(self):
         self.allocator = MemoryAllocator()  # creates references to memory cells & clusters
         self.stack = dict()  # stack. Maps names -> cells
         self.heap = dict()  # heap.  Maps mem_address -> cells
+        # Running totals of cells, so memory limits are checked without traversing memory
+        self.stack_cell_count = 0
+        self.heap_cell_count = 0
+        # Changes whenever variables are declared or undeclared (or cells replaced), so
+        # engines know when cells they resolved before can't be used anymore.
+        self.layout_version = next(LAYOUT_VERSIONS)
+
+    def layout_changed(self):
+        self.layout_version = next(LAYOUT_VERSIONS)
+
+    def __getstate__(self):
+        # The evaluator belongs to the run (engines keep compiled closures on it): states
+        # are pickled and copied without it.
+        data = self.__dict__.copy()
+        data.pop("evaluator", None)
+        return data
+
+    def __setstate__(self, data):
+        self.__dict__.update(data)
+        if "stack_cell_count" not in data:  # persisted by older versions
+            self.recount_cells()
+        self.layout_changed()
+
+    def recount_cells(self):
+        self.stack_cell_count = sum(cell.cell_count for cell in self.stack.values())
+        self.heap_cell_count = sum(cell.cell_count for cell in self.heap.values())
+
+    def snapshot(self):
+        # Copy of the state, unaffected by later changes to this one.
+        result = deepcopy(self)
+        result.write_log = None
+        result.layout_changed()
+        result.share_evaluator_of(self)
+        return result
+
+    def share_evaluator_of(self, other):
+        if hasattr(other, "evaluator"):
+            self.set_expressions_evaluator(other.evaluator)
+
+    def enable_write_log(self):
+        self.write_log = {}
+
+    def touched_cells(self):
+        # Names/addresses touched since the log was last cleared, in touching order.
+        return list(self.write_log or ())
+
+    def touched_paths(self):
+        # For the touched cells that were only written partially, the paths of the
+        # written sub-cells (see cell_at_path).
+        return {
+            key: list(paths) for key, paths in (self.write_log or {}).items() if paths is not None
+        }
+
+    def clear_write_log(self):
+        # The interpreter clears the log after each step, once hooks have seen it.
+        if self.write_log:
+            self.write_log = {}
+
+    def log_write(self, name_or_address):
+        if self.write_log is not None:
+            self.write_log[name_or_address] = None
+
+    def log_trail(self, trail):
+        # logs the top-level cell that holds the last cell of the trail, and the path
+        # from it to the last cell
+        for position in range(len(trail) - 1, -1, -1):
+            holder, key = trail[position]
+            if holder is not None:
+                path = tuple(sub_key for _, sub_key in trail[position + 1 :])
+                if not path:
+                    self.write_log[key] = None
+                elif key not in self.write_log:
+                    self.write_log[key] = {path: None}
+                elif self.write_log[key] is not None:
+                    self.write_log[key][path] = None
+                return
 
     def set_expressions_evaluator(self, evaluator):
         self.evaluator = evaluator
@@ -35,6 +126,9 @@ class State:
         if read_only and cell.can_get_set_values_directly:
             cell.read_only = True
         self.stack[name] = cell
+        self.stack_cell_count += cell.cell_count
+        self.layout_changed()
+        self.log_write(name)
         LIMITER.check_type_sizing_limits(var_type)
         LIMITER.check_memory_size_limits(self)
 
@@ -42,13 +136,15 @@ class State:
         # deletes a variable from the stack. Typicall used when for loop ends
         if name not in self.stack:
             raise UndeclaredVariableError(f"Variable {name} was not declared.")
-        del self.stack[name]
+        self.stack_cell_count -= self.stack.pop(name).cell_count
+        self.layout_changed()
+        self.log_write(name)
 
     def alloc(self, var):
         # Argument "var" refers to a variable in the stack. Should be a pointer.
         # After the allocation, the variable will "point" to the allocated memory,
         # where "pointing" means that in the stack it will be saved the address of the allocated memory.
-        stack_cell = self.cell_after_traversal(var)
+        stack_cell = self.cell_for_writing(var)
 
         # We need to get ride of Synonyms twice. One for the type, another for the pointed type.
         var_type = stack_cell.var_type
@@ -64,39 +160,48 @@ class State:
         new_cell = self.allocator.allocate(MemoryAddress.HEAP, new_cell_type)
         stack_cell.value = new_cell.address
         self.heap[new_cell.address] = new_cell
+        self.heap_cell_count += new_cell.cell_count
+        self.log_write(new_cell.address)
         LIMITER.check_memory_size_limits(self)
 
     def free(self, var):
         # Argument "var" refers to a variable in the stack. Should be a pointer.
         # It should "point" to a previously allocated memory (in the heap). After free, the previously
         # allocated memory will be removed from the heap, and the variable will "point" to UnknownValue.
-        stack_cell = self.cell_after_traversal(var)
+        stack_cell = self.cell_for_writing(var)
         if not stack_cell.var_type.is_pointer:
             raise TomosTypeError(f"Cannot free. Variable {var} is not a pointer.")
         if stack_cell.value not in self.heap:
             msg = f"Cannot free. Variable {var} (pointing to {stack_cell.value}) is not pointing to memory cell on the heap."
             raise MemoryInfrigementError(msg)
-        del self.heap[stack_cell.value]
+        self.heap_cell_count -= self.heap.pop(stack_cell.value).cell_count
+        self.log_write(stack_cell.value)
         stack_cell.value = UnknownValue
 
-    def cell_after_traversal(self, var):
+    def cell_after_traversal(self, var, trail=None):
         # AST Variables have a traversal_path attribute which is a list of steps.
         # Example: if the expression is days[i+1].year, a traversal path should start
         # with the "days" variable, first step should be an ArrayIndexing for (i+1),
         # and following step should be an AccessedField step for "year".
 
         # Returns the memory cell resulting of walking each of the mentioned steps.
+        # If a trail list is given, it's filled with the (holder, key) of each visited
+        # cell. A holder of None stands for the sub_cells of the previous cell.
 
         name = var.name
         if name not in self.stack:
             raise UndeclaredVariableError(f'Can\'t access variable "{name}". It was not declared.')
         cell = self.stack[name]
+        if trail is not None:
+            trail.append((self.stack, name))
         for step in var.traverse_path:
             if step.kind == var.DEREFERENCE:
                 assert cell.var_type.is_pointer
                 if cell.value not in self.heap:
                     msg = f"Accessing var {var}. Can't dereference a pointer to address ({cell.value})"
                     raise MemoryInfrigementError(msg)
+                if trail is not None:
+                    trail.append((self.heap, cell.value))
                 cell = self.heap[cell.value]
             elif step.kind == var.ARRAY_INDEXING:
                 assert isinstance(cell.var_type, ArrayOf)
@@ -104,6 +209,8 @@ class State:
                 exp_eval = self.get_expression_evaluator()
                 evaluated_indexing = [exp_eval.eval(expr, self) for expr in indexing]
                 try:
+                    if trail is not None:
+                        trail.append((None, cell.var_type.flatten_index(evaluated_indexing)))
                     cell = cell[evaluated_indexing]
                 except IndexError:
                     msg = f"Accessing var {var}. Can't access array at index {indexing}."
@@ -119,12 +226,23 @@ class State:
                 except KeyError:
                     msg = f"For var {var}. Can't access field {field}."
                     raise MemoryInfrigementError(msg)
+                if trail is not None:
+                    trail.append((None, field))
             else:
                 raise NotImplementedError(f"Unknown step kind {step.kind}")
         return cell
 
+    def cell_for_writing(self, var):
+        # Same as cell_after_traversal, for cells about to be modified.
+        if self.write_log is None:
+            return self.cell_after_traversal(var)
+        trail = []
+        cell = self.cell_after_traversal(var, trail=trail)
+        self.log_trail(trail)
+        return cell
+
     def set_variable_value(self, var, value, permit_write_on_read_only=False):
-        cell = self.cell_after_traversal(var)
+        cell = self.cell_for_writing(var)
         if not cell.can_get_set_values_directly:
             raise MemoryInfrigementError(f"Cell type {type(cell)} can't be modified directly.")
 
@@ -1,5 +1,9 @@
+import hashlib
+import os
+import sys
 from pathlib import Path
 
+import lark
 from lark import Lark
 
 from .parsetree_to_ast import TreeToAST
@@ -12,17 +16,67 @@ def get_grammar_txt():
     return grammar_txt
 
 
+def get_cache_dir():
+    # TOMOS_CACHE_DIR overrides the user cache dir (XDG_CACHE_HOME, or ~/.cache)
+    if os.environ.get("TOMOS_CACHE_DIR"):
+        return Path(os.environ["TOMOS_CACHE_DIR"])
+    cache_home = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(cache_home) / "tomos"
+
+
+def parser_cache_path(grammar_txt):
+    # Returns None if there's no place to cache the parser on.
+    # The name changes with the grammar and lark & python versions, so stale caches are
+    # never loaded (lark also checks the hash it writes inside the file).
+    key = f"{grammar_txt}{lark.__version__}{sys.version_info[:2]}"
+    digest = hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+    cache_dir = get_cache_dir()
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+    except OSError:
+        return None
+    return str(cache_dir / f"lalr-{digest}.cache")
+
+
+def verify_ast_enabled():
+    # Set TOMOS_VERIFY_AST to check the fields of every parsed program (see verify_program)
+    return os.environ.get("TOMOS_VERIFY_AST", "").lower() not in ("", "0", "false", "no")
+
+
 class TomosParser(Lark):
 
-    def parse(self, *args, **kwargs):
-        from tomos.ayed2.ast.types.registry import type_registry  # avoid circular import
-        parse_results = super().parse(*args, **kwargs)
-        type_registry.resolve_deferred_types()
+    def parse(self, *args, type_registry=None, verify=None, **kwargs):
+        # Types declared by the program are registered on type_registry. If not given,
+        # on the registry currently in use (the global one, by default).
+        # If verify (by default, verify_ast_enabled()), the fields of the AST are checked.
+        from tomos.ayed2.ast.program import verify_program  # avoid circular import
+        from tomos.ayed2.ast.types.registry import use_type_registry
+
+        with use_type_registry(type_registry) as registry:
+            parse_results = super().parse(*args, **kwargs)
+            registry.resolve_deferred_types()
+        if verify or (verify is None and verify_ast_enabled()):
+            verify_program(parse_results)
         return parse_results
 
 
-def build_parser():
-    return TomosParser(get_grammar_txt(), start="program", parser="lalr", transformer=TreeToAST())
+def build_parser(cache=True):
+    # With cache, the LALR tables are built once and saved on the user cache dir. Later
+    # processes load them instead of analyzing the grammar again.
+    grammar_txt = get_grammar_txt()
+    cache_path = parser_cache_path(grammar_txt) if cache else None
+    return TomosParser(
+        grammar_txt,
+        start="program",
+        parser="lalr",
+        transformer=TreeToAST(),
+        cache=cache_path or False,
+    )
 
 
-parser = build_parser()
+def __getattr__(name):
+    # The parser is built on first use, not on import: some commands never parse.
+    if name == "parser":
+        globals()["parser"] = build_parser()
+        return globals()["parser"]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,176 @@
+import hashlib
+import os
+import pickle
+import sys
+import tempfile
+from pathlib import Path
+
+import lark
+
+from tomos.ayed2.ast.program import verify_program
+from tomos.ayed2.ast.sentences import Sentence
+from tomos.ayed2.ast.types.registry import use_type_registry
+from tomos.ayed2.parser import get_cache_dir, get_grammar_txt, verify_ast_enabled
+
+MAX_CACHE_BYTES = 32 * 1024 * 1024
+ENTRY_SUFFIX = ".ast"
+# Modules whose changes may invalidate the pickled programs (relative to the tomos package)
+CODE_DIRS = ["ayed2/ast", "ayed2/ast/types", "ayed2/parser", "base_classes"]
+
+
+def parse_program(source, type_registry=None, cache=True, verify=None):
+    """
+    Same as parser.parse(source), but the parsed program is saved on an on-disk cache, and
+    loaded from it when the same source is parsed again (with the same getenv inputs).
+    Types declared by the program are registered as if it was parsed.
+    Nothing is cached if the registry already has user types (as when a state is loaded
+    first): the program may depend on them.
+    Programs loaded from the cache are verified as well, if verify is set.
+    """
+    if verify is None:
+        verify = verify_ast_enabled()
+    with use_type_registry(type_registry) as registry:
+        if not cache or registry.list_user_types():
+            from tomos.ayed2.parser import parser
+
+            return parser.parse(source, verify=verify)
+        ast_cache = ASTCache()
+        entry = ast_cache.load(source)
+        if entry is not None:
+            program, types = entry
+            for name, new_type in types:
+                registry.register_type(name, new_type)
+            if verify:
+                verify_program(program)
+            return program
+        program, getenv_inputs = parse_logging_getenv(source, verify)
+        ast_cache.save(source, program, registry.list_user_types(), getenv_inputs)
+        return program
+
+
+def parse_logging_getenv(source, verify=False):
+    from tomos.ayed2.parser import parser
+
+    tree_to_ast = parser.options.transformer
+    tree_to_ast.getenv_log = {}
+    try:
+        return parser.parse(source, verify=verify), tree_to_ast.getenv_log
+    finally:
+        tree_to_ast.getenv_log = None
+
+
+class ASTCache:
+    """
+    Parsed programs, with the types they declared, pickled on one file per source.
+    Files are named after a hash of the source, the grammar and the parsing code. When the
+    cache exceeds max_bytes, the least recently used files are deleted.
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=MAX_CACHE_BYTES):
+        self.cache_dir = Path(cache_dir or get_cache_dir() / "ast")
+        self.max_bytes = max_bytes
+
+    def path_for(self, source):
+        key = "\0".join([source, get_grammar_txt(), lark.__version__, code_fingerprint()])
+        key += str(sys.version_info[:2])
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return self.cache_dir / f"{digest}{ENTRY_SUFFIX}"
+
+    def load(self, source):
+        # Returns (program, types), or None if not cached
+        path = self.path_for(source)
+        try:
+            with open(path, "rb") as f:
+                unpickler = pickle.Unpickler(f)
+                getenv_inputs = unpickler.load()
+                if any(os.environ.get(name) != value for name, value in getenv_inputs.items()):
+                    return None
+                program, types = unpickler.load()
+                # links among sentences go last (see ASTPickler)
+                while (links := unpickler.load()) is not None:
+                    for sentence, next_instruction in links:
+                        sentence.next_instruction = next_instruction
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # corrupted, or pickled by an incompatible version
+            path.unlink(missing_ok=True)
+            return None
+        os.utime(path)  # most recently used
+        return program, types
+
+    def save(self, source, program, types, getenv_inputs):
+        path = self.path_for(source)
+        tmp_path = None
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            # written aside and renamed, so concurrent processes never read half a file
+            with tempfile.NamedTemporaryFile(dir=self.cache_dir, delete=False) as f:
+                tmp_path = f.name
+                pickler = ASTPickler(f)
+                pickler.dump(getenv_inputs)
+                pickler.dump((program, types))
+                pickler.dump_links()
+            os.replace(tmp_path, path)
+        except Exception:
+            # can't cache this program (or nowhere to cache it). Not a reason to fail.
+            if tmp_path is not None:
+                Path(tmp_path).unlink(missing_ok=True)
+            return
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for path in self.cache_dir.glob(f"*{ENTRY_SUFFIX}"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue  # evicted by another process
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+
+class ASTPickler(pickle.Pickler):
+    # Sentences are chained by next_instruction. Pickling them as they are recurses once
+    # per sentence, which overflows on long programs. So sentences are pickled without
+    # their next_instruction, and the links are pickled afterwards, in flat lists.
+
+    def __init__(self, file, protocol=pickle.HIGHEST_PROTOCOL):
+        super().__init__(file, protocol)
+        self.protocol = protocol
+        self.links = []
+
+    def reducer_override(self, obj):
+        if not isinstance(obj, Sentence) or "_next_instruction" not in vars(obj):
+            return NotImplemented
+        reduced = list(obj.__reduce_ex__(self.protocol))
+        # the state of slotted sentences is a (__dict__, slots) pair
+        state, slots = reduced[2] if isinstance(reduced[2], tuple) else (reduced[2], None)
+        state = dict(state)
+        self.links.append((obj, state.pop("_next_instruction")))
+        reduced[2] = state if slots is None else (state, slots)
+        return tuple(reduced)
+
+    def dump_links(self):
+        # The memo is shared among dumps, so sentences are referenced, not pickled again.
+        # Pickling links may find more sentences, hence the loop.
+        while self.links:
+            links, self.links = self.links, []
+            self.dump(links)
+        self.dump(None)
+
+
+def code_fingerprint():
+    # Changes whenever any module of the AST, the parser, or the base classes changes
+    package_dir = Path(__file__).parent.parent.parent
+    stats = []
+    for code_dir in CODE_DIRS:
+        for path in sorted((package_dir / code_dir).glob("*.py")):
+            stat = path.stat()
+            stats.append(f"{code_dir}/{path.name}:{stat.st_mtime_ns}:{stat.st_size}")
+    return ",".join(stats)
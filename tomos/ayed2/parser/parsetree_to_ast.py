@@ -27,6 +27,7 @@ def chain_instructions(instructions):
 
 class TreeToAST(Transformer):
     do_eval_literals = True
+    getenv_log = None  # if set to a dict, getenv reads are logged on it (name -> value)
 
     def program(self, args):
         tdef, fdef, body = args
@@ -101,8 +102,8 @@ class TreeToAST(Transformer):
         arg0 = args[0]
         if isinstance(arg0, Token):
             # we are in case a) b) or d) described above
-            factory = type_registry.get_type_factory(arg0.value, deferred_if_not_found=True)
-            if isinstance(factory, type_registry.Deferred):
+            factory = get_type_registry().get_type_factory(arg0.value, deferred_if_not_found=True)
+            if isinstance(factory, TypeRegistry.Deferred):
                 return factory  # it's a Deferred object. It's not resolved later, will blow up
             else:
                 return factory()
@@ -120,7 +121,7 @@ class TreeToAST(Transformer):
         # synomym for type
         assert len(args) == 1
         u_type = args[0]
-        if isinstance(u_type, type_registry.Deferred):
+        if isinstance(u_type, TypeRegistry.Deferred):
             u_type = u_type.resolve()
         return Synonym(underlying_type=u_type)
 
@@ -161,7 +162,7 @@ class TreeToAST(Transformer):
         new_name, new_type = args
         if new_name in KEYWORDS:
             raise TomosTypeError(f"Type name {new_name} is reserved")
-        type_registry.register_type(new_name, new_type)
+        get_type_registry().register_type(new_name, new_type)
         return TypeDeclaration(name=new_name, new_type=new_type)
 
     def builtin_name(self, args):
@@ -214,6 +215,8 @@ class TreeToAST(Transformer):
             raise TomosSyntaxError(
                 f"Environment variable {env_variable_name} is not defined", guess_line_nr_from=args
             )
+        if self.getenv_log is not None:
+            self.getenv_log[env_variable_name] = os.environ[env_variable_name]
         made_out_token = Token(expected_type, os.environ[env_variable_name], line=args[0].line)
         literal_parsers = {
             "int": self.INT,
@@ -304,7 +307,7 @@ class TreeToAST(Transformer):
         return self.parse_literal(CharLiteral, token)
 
     def ENUM_LITERAL(self, token):
-        for tname, ttype in type_registry.list_types():
+        for tname, ttype in get_type_registry().list_types():
             if isinstance(ttype, Enum):
                 if ttype.is_valid_value(token.value):
                     return EnumLiteral(token)
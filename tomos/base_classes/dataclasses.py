@@ -1,25 +1,49 @@
-from pydantic import ConfigDict
-from pydantic.dataclasses import dataclass as pydantic_dataclass
+import dataclasses
+import typing
+
+from tomos.exceptions import TomosSyntaxError
+
+# Fields are not validated when instances are built (that's on the parser hot path).
+# Call verify_fields to check them against their annotations.
+slotted_dataclass = dataclasses.dataclass(slots=True)
 
 try:
     from typing import dataclass_transform
+except ImportError:  # python < 3.11. Only used by type checkers, so it's a no-op
+
+    def dataclass_transform():
+        return lambda decorator: decorator
+
+
+@dataclass_transform()
+def dataclass(cls):
+    """
+    A decorator that behaves identically to the stdlib `dataclass` with `slots=True`.
+    """
+    return slotted_dataclass(cls)
+
 
+def verify_fields(obj):
+    """Checks that the fields of a dataclass instance are instances of their annotated types."""
+    for name, expected_type in get_field_types(type(obj)).items():
+        value = getattr(obj, name)
+        if not isinstance(value, expected_type):
+            raise TomosSyntaxError(
+                f"{type(obj).__name__}.{name} must be {expected_type.__name__}, "
+                f"not {type(value).__name__}",
+                guess_line_nr_from=value,
+            )
 
-    @dataclass_transform()
-    def dataclass(cls):
-        """
-        A decorator that behaves identically to applying the Pydantic `dataclass`
-        with `config=ConfigDict(arbitrary_types_allowed=True)`.
-        """
-        # Applying Pydantic dataclass with the specified config
-        return pydantic_dataclass(config=ConfigDict(arbitrary_types_allowed=True))(cls)
-
-except ImportError:
-    def dataclass(cls):
-        """
-        A decorator that behaves identically to applying the Pydantic `dataclass`
-        with `config=ConfigDict(arbitrary_types_allowed=True)`.
-        """
-        # Applying Pydantic dataclass with the specified config
-        return pydantic_dataclass(config=ConfigDict(arbitrary_types_allowed=True))(cls)
 
+def get_field_types(cls):
+    # field name -> type, for the fields annotated with a class (others aren't checked)
+    field_types = cls.__dict__.get("_verified_field_types")
+    if field_types is None:
+        hints = typing.get_type_hints(cls)
+        field_types = {
+            field.name: hints[field.name]
+            for field in dataclasses.fields(cls)
+            if isinstance(hints[field.name], type)
+        }
+        setattr(cls, "_verified_field_types", field_types)
+    return field_types
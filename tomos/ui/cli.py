@@ -10,42 +10,57 @@ Usage:
 Options:
     --movie=<fname>       Generates a movie with the execution (implicitly
                           cancels --no-run if set). Must be a .mp4 file.
+    --html=<fname>        Exports the execution as a self-contained HTML page, that
+                          plays it step by step (implicitly cancels --no-run if set).
     --autoplay            Autoplay the movie. Implicitly sets --movie=movie.mp4
                           if not set.
     --explicit-frames     Only build frames for sentences that are explicitly
                           requested (ending in //checkpoint).
+    --compress-loops=<k>  Only show the first and last k iterations of each loop.
+                          Iterations in between are summarized in a single frame.
+    --workers=<n>         Number of processes rendering movie frames. [default: 1]
+    --keep-frames         Also save movie frames as images (on output_tomos).
+    --stream              Pipe movie frames to the encoder as they are rendered,
+                          instead of saving them as images first. Repeated frames
+                          are encoded one by one. Only with a single worker.
+    --draft               Quick movie: smaller, and encoded faster. Configurable on
+                          the [DRAFT] table of tomos_ui.toml.
+    --trace-file=<fname>  Record the execution on a trace file instead of in
+                          memory. Used to build the movie.
     --no-run              Skips executing the program. Useful for debugging.
+    --no-cache            Parses the program, instead of loading it from the cache
+                          of parsed programs.
+    --verify-ast          Checks the fields of the parsed AST nodes (also enabled
+                          by the TOMOS_VERIFY_AST environment variable).
     --no-final-state      Skips printing the final state.
     --showast             Show the abstract syntax tree.
     --save-state=<fname>  Save the final state to a file.
     --load-state=<fname>  Load the state from a file.
+    --engine=<name>       Execution engine: "visitor", "closures" or "bytecode".
+                          [default: visitor]
     --cfg=<conf>          Overrides configurations one by one.
     --version             Show version and exit.
     --verbose=<V>         Verbose mode. [default: 0]
     -h --help             Show this message and exit.
 """
 
-import importlib.metadata
 from pathlib import Path
 from sys import exit, argv
 
 from docopt import docopt
 
-from tomos.ayed2.parser import parser
-from tomos.ayed2.parser.metadata import DetectExplicitCheckpoints
-from tomos.ayed2.evaluation.interpreter import Interpreter
-from tomos.ayed2.evaluation.persistency import Persist
-from tomos.exceptions import TomosSyntaxError
-from tomos.ui.interpreter_hooks import ASTPrettyFormatter
-from tomos.ui.interpreter_hooks import RememberState
+# Everything else is imported where it's needed: each option only pays for what it uses.
+# Modules that a plain run must not import are listed on tests/ui/test_cli_imports.py
 
 GRAMMAR_LINK = "https://github.com/jmansilla/tomos/blob/main/tomos/ayed2/parser/grammar.lark"
 EXAMPLES_LINK = "https://github.com/jmansilla/tomos/tree/main/demo/ayed2_examples"
 
 
-def cli_parse(source_path, verbose_level):
+def cli_parse(source_path, verbose_level, use_cache=True, verify=None):
+    from tomos.ayed2.parser.ast_cache import parse_program
+
     try:
-        ast = parser.parse(open(source_path).read())
+        ast = parse_program(open(source_path).read(), cache=use_cache, verify=verify)
     except Exception as error:
         print("Parsing error:", type(error), error)
         if verbose_level == 1:
@@ -71,6 +86,8 @@ def main():
 
     verbose_level = int(opts["--verbose"])
     if opts["--version"]:
+        import importlib.metadata
+
         version = importlib.metadata.version("tomos")
         print(f"Tomos version {version}")
         exit(0)
@@ -81,51 +98,118 @@ def main():
     # if loading a state, we may need to load some type-definitions
     # before parsing the program. It's suboptimal, but it works.
     if opts["--load-state"]:
+        from tomos.ayed2.evaluation.persistency import Persist
+
         initial_state = Persist.load_from_file(opts["--load-state"])
     else:
         initial_state = None
-    ast = cli_parse(source_path, verbose_level)
+    ast = cli_parse(
+        source_path,
+        verbose_level,
+        use_cache=not opts["--no-cache"],
+        verify=opts["--verify-ast"] or None,
+    )
+
+    if opts["--draft"]:
+        from tomos.ui.movie import configs
+        from tomos.ui.movie.draft import apply_draft_profile
+
+        apply_draft_profile()
+        if getattr(configs, "EXPLICIT_FRAMES_ONLY", False):
+            opts["--explicit-frames"] = True
 
     if opts["--explicit-frames"]:
+        from tomos.ayed2.parser.metadata import DetectExplicitCheckpoints
+
         DetectExplicitCheckpoints(ast, source_path).detect()
 
     if opts["--showast"]:
+        from tomos.ui.interpreter_hooks import ASTPrettyFormatter
+
         print(ASTPrettyFormatter().format(ast))
 
     if opts["--autoplay"] and not opts["--movie"]:
         opts["--movie"] = "movie.mp4"
-    if opts["--movie"] and not opts["--run"]:
+    if (opts["--movie"] or opts["--html"]) and not opts["--run"]:
         opts["--run"] = True
 
     if opts["--run"]:
+        from tomos.ayed2.evaluation.interpreter import Interpreter
+        from tomos.ayed2.evaluation.state import State
+
         pre_hooks = []
         post_hooks = []
-
-        if opts["--movie"]:
-            if not opts["--movie"].endswith(".mp4"):
-                print("Movie must be a .mp4 file.")
-                exit(1)
-            timeline = RememberState()
+        state_class = State
+        timeline = None
+
+        if opts["--movie"] and not opts["--movie"].endswith(".mp4"):
+            print("Movie must be a .mp4 file.")
+            exit(1)
+        if opts["--movie"] or opts["--html"]:
+            from tomos.ui.interpreter_hooks import KeyframeTimeline, TraceWriter
+
+            if opts["--trace-file"]:
+                from tomos.ayed2.evaluation.persistent_state import PersistentState
+
+                timeline = TraceWriter(opts["--trace-file"], ast)
+                # the trace writer takes a snapshot of the state after each step
+                state_class = PersistentState
+                if initial_state is not None:
+                    initial_state = PersistentState.from_state(initial_state)
+            else:
+                # keeps keyframes and deltas only, copying just the changed cells
+                timeline = KeyframeTimeline()
             post_hooks = [timeline]
 
-        interpreter = Interpreter(ast, pre_hooks=pre_hooks, post_hooks=post_hooks)
+        interpreter = Interpreter(
+            ast,
+            pre_hooks=pre_hooks,
+            post_hooks=post_hooks,
+            engine=opts["--engine"],
+            state_class=state_class,
+        )
         final_state = interpreter.run(initial_state=initial_state)
+        if timeline is not None and opts["--trace-file"]:
+            from tomos.ui.interpreter_hooks import TraceReader
+
+            timeline.close()
+            timeline = TraceReader(opts["--trace-file"], ast)
 
         if opts["--movie"]:
             # slow import. Only needed if --movie is set
             from tomos.ui.movie.builder import build_movie_from_file
 
             movie_path = Path(opts["--movie"])
-            build_movie_from_file(
-                source_path, movie_path, timeline, explicit_frames_only=opts["--explicit-frames"]
+            loop_compression = opts["--compress-loops"]
+            if loop_compression is not None:
+                loop_compression = int(loop_compression)
+            saved_frames = build_movie_from_file(
+                source_path,
+                movie_path,
+                timeline,
+                explicit_frames_only=opts["--explicit-frames"],
+                workers=int(opts["--workers"]),
+                keep_frames=opts["--keep-frames"],
+                dedup=not opts["--stream"],
+                loop_compression=loop_compression,
             )
+            if saved_frames:
+                print(f"Movie built. {saved_frames} repeated frames were encoded only once.")
             if opts["--autoplay"]:
                 if not movie_path.exists():
                     print(f"Unable to find movie {movie_path}")
                     exit(1)
                 play_movie(movie_path)
 
+        if opts["--html"]:
+            from tomos.ui.movie.html_player import build_html_from_file
+
+            steps = build_html_from_file(source_path, opts["--html"], timeline)
+            print(f"HTML player with {steps} steps saved on {opts['--html']}.")
+
         if opts["--save-state"]:
+            from tomos.ayed2.evaluation.persistency import Persist
+
             Persist.persist(final_state, opts["--save-state"])
 
         if not opts["--no-final-state"]:
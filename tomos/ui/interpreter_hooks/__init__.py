@@ -1,5 +1,36 @@
-from .show_ast import *
-from .show_code import *
-from .show_state import *
-from .interactions import *
-from .remember_state import *
+# Hooks are imported on first use. Some of them need dependencies (pygments, prettytable)
+# that most runs never use.
+from importlib import import_module
+
+HOOKS_BY_MODULE = {
+    "show_ast": ["ASTPrettyFormatter"],
+    "show_code": ["ShowSentence"],
+    "show_state": ["ShowState", "MemoryDiffer"],
+    "interactions": ["wait_for_input", "Sleeper"],
+    "remember_state": [
+        "StateDiff",
+        "LoadedFromFile",
+        "Frame",
+        "STATE_LOADED_FROM_FILE",
+        "FrameBuilder",
+        "Timeline",
+        "RememberState",
+    ],
+    "trace_file": ["ProgramIndex", "TraceWriter", "TraceReader"],
+    "keyframes": ["Delta", "KeyframeTimeline"],
+}
+MODULE_BY_NAME = {name: module for module, names in HOOKS_BY_MODULE.items() for name in names}
+
+__all__ = list(MODULE_BY_NAME)
+
+
+def __getattr__(name):
+    if name not in MODULE_BY_NAME:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(f".{MODULE_BY_NAME[name]}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
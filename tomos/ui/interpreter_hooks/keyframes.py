@@ -0,0 +1,157 @@
+from copy import copy, deepcopy
+
+from tomos.ayed2.evaluation.memory import MemoryAddress, cell_at_path
+from tomos.ayed2.evaluation.state import State
+from tomos.ui.interpreter_hooks.remember_state import (
+    STATE_LOADED_FROM_FILE,
+    Frame,
+    StateDiff,
+    Timeline,
+)
+
+
+class Delta:
+    # What a single step changed: the diff, copies of the new & changed cells, and for
+    # cells only written partially, copies of just the changed sub-cells (by path)
+    __slots__ = ("line_number", "just_executed", "expression_values", "diff", "cells", "patches")
+
+    def __init__(self, line_number, just_executed, expression_values, diff, cells, patches):
+        self.line_number = line_number
+        self.just_executed = just_executed
+        self.expression_values = expression_values
+        self.diff = diff
+        self.cells = cells
+        self.patches = patches
+
+    def apply(self, stack, heap):
+        # Updates stack & heap from the ones before this step to the ones after it.
+        # Cells already there are never modified: patched cells are replaced by copies.
+        for key in self.diff.deleted_cells:
+            block_of(key, stack, heap).pop(key)
+        for key, cell in self.cells.items():
+            block_of(key, stack, heap)[key] = cell
+        for key, sub_cells in self.patches.items():
+            block = block_of(key, stack, heap)
+            for path, sub_cell in sub_cells.items():
+                block[key] = replace_at_path(block[key], path, sub_cell)
+
+
+def block_of(key, stack, heap):
+    return heap if isinstance(key, MemoryAddress) else stack
+
+
+def replace_at_path(cell, path, sub_cell):
+    # Returns a copy of cell with sub_cell at path. Only the clusters along the path are
+    # copied, the other sub-cells are shared.
+    if not path:
+        return sub_cell
+    result = copy(cell)
+    result.sub_cells = copy(cell.sub_cells)
+    result.sub_cells[path[0]] = replace_at_path(cell.sub_cells[path[0]], path[1:], sub_cell)
+    return result
+
+
+class KeyframeTimeline(Timeline):
+    """
+    Interpreter post-hook that records the execution as a full keyframe every
+    keyframe_interval steps, and only deltas (diff plus changed cells, or sub-cells) in
+    between.
+    Any frame can be rebuilt with frame_at(n), starting from the nearest keyframe.
+    """
+
+    def __init__(self, keyframe_interval=32):
+        self.keyframe_interval = keyframe_interval
+        self.deltas = []
+        self.keyframes = []  # (stack, heap) for steps 0, K, 2K, ...
+        # Top-level cells as of the last recorded step. Used to compute diffs.
+        self.view = State()
+        self._cursor = None  # (n, stack, heap) of the last rebuilt frame
+
+    def __call__(self, last_sentence, state, expression_values):
+        if not self.deltas:
+            if last_sentence is None:
+                last_sentence = STATE_LOADED_FROM_FILE
+            diff = StateDiff.create_diff(self.view, state)
+            if state.write_log is None:
+                state.enable_write_log()
+        else:
+            diff = StateDiff.create_diff_from_log(
+                self.view, state, state.touched_cells(), state.touched_paths()
+            )
+
+        # Copies of cells share their types with the state (see MetaMemCell.copy_slots)
+        cells, patches = {}, {}
+        for key in diff.new_cells + diff.changed_cells:
+            cell = block_of(key, state.stack, state.heap)[key]
+            if key in diff.changed_paths:
+                patches[key] = {
+                    path: deepcopy(cell_at_path(cell, path)) for path in diff.changed_paths[key]
+                }
+            else:
+                cells[key] = deepcopy(cell)
+        delta = Delta(
+            last_sentence.line_number, last_sentence, expression_values, diff, cells, patches
+        )
+        delta.apply(self.view.stack, self.view.heap)
+
+        if len(self.deltas) % self.keyframe_interval == 0:
+            self.keyframes.append((dict(self.view.stack), dict(self.view.heap)))
+        self.deltas.append(delta)
+
+    def __len__(self):
+        return len(self.deltas)
+
+    def rebuild(self, n):
+        # Returns the (stack, heap) after step n, starting from the nearest point: the
+        # nearest keyframe, or the last rebuilt frame if it's closer.
+        keyframe_idx = n // self.keyframe_interval
+        start = keyframe_idx * self.keyframe_interval
+        if self._cursor is not None and start <= self._cursor[0] <= n:
+            current, stack, heap = self._cursor
+        else:
+            current = start
+            stack, heap = map(dict, self.keyframes[keyframe_idx])
+        for delta in self.deltas[current + 1 : n + 1]:
+            delta.apply(stack, heap)
+        self._cursor = (n, stack, heap)
+        return stack, heap
+
+    def frame_at(self, n):
+        if not 0 <= n < len(self.deltas):
+            raise IndexError(f"Frame {n} out of range. Timeline has {len(self.deltas)} frames.")
+        frame = self.build_frame(n)
+        if n + 1 < len(self.deltas):
+            frame.next = self.build_frame(n + 1)
+        return frame
+
+    def build_frame(self, n):
+        # Frame of step n, with no next frame set
+        stack, heap = self.rebuild(n)
+        state = State()
+        state.stack, state.heap = dict(stack), dict(heap)
+        delta = self.deltas[n]
+        return Frame(
+            delta.line_number, delta.just_executed, state, delta.expression_values, delta.diff, None
+        )
+
+    def iter_frames(self):
+        # One frame is built ahead, so "next" is filled before handing it out
+        previous = None
+        for n in range(len(self.deltas)):
+            frame = self.build_frame(n)
+            if previous is not None:
+                previous.next = frame
+                yield previous
+            previous = frame
+        if previous is not None:
+            yield previous
+
+    def iter_diffs(self):
+        # Deltas are applied one after the other, without building frames
+        stack, heap = {}, {}
+        for delta in self.deltas:
+            delta.apply(stack, heap)
+            keys = delta.diff.new_cells + delta.diff.changed_cells
+            yield delta.line_number, delta.diff, {
+                key: block_of(key, stack, heap)[key] for key in keys
+            }
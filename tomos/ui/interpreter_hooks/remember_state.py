@@ -1,14 +1,15 @@
-from copy import deepcopy
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 from tomos.ayed2.ast.program import TypeDeclaration, VarDeclaration
 
 
-@dataclass
+@dataclass(slots=True)
 class StateDiff:
     new_cells: list
     changed_cells: list
     deleted_cells: list
+    # For changed cells only written partially: paths of the changed sub-cells
+    changed_paths: dict = field(default_factory=dict)
 
     @staticmethod
     def create_diff(state_a, state_b):
@@ -43,12 +44,52 @@ class StateDiff:
 
         return diff
 
+    @staticmethod
+    def create_diff_from_log(state_a, state_b, touched, touched_paths=None):
+        # Same as create_diff, but only looking at the touched names and addresses (as
+        # logged by state_b). Cost is proportional to what changed, not to memory size.
+        # For cells only written partially, just the written sub-cells are compared.
+        from tomos.ayed2.evaluation.memory import MemoryAddress, cell_at_path
+
+        touched_paths = touched_paths or {}
+
+        diff = StateDiff([], [], [])
+        stack_keys = [key for key in touched if not isinstance(key, MemoryAddress)]
+        heap_keys = [key for key in touched if isinstance(key, MemoryAddress)]
+        for keys, block_a, block_b in [
+            (stack_keys, state_a.stack, state_b.stack),
+            (heap_keys, state_a.heap, state_b.heap),
+        ]:
+            for key in keys:
+                if key not in block_b:
+                    if key in block_a:
+                        diff.deleted_cells.append(key)
+                elif key not in block_a:
+                    diff.new_cells.append(key)
+                else:
+                    cell_a, cell_b = block_a[key], block_b[key]
+                    if cell_a is cell_b:
+                        continue
+                    if key not in touched_paths:
+                        if cell_a.value != cell_b.value:
+                            diff.changed_cells.append(key)
+                        continue
+                    changed_paths = [
+                        path
+                        for path in touched_paths[key]
+                        if cell_at_path(cell_a, path).value != cell_at_path(cell_b, path).value
+                    ]
+                    if changed_paths:
+                        diff.changed_cells.append(key)
+                        diff.changed_paths[key] = changed_paths
+        return diff
+
 
 class LoadedFromFile:
     line_number = 0
 
 
-@dataclass
+@dataclass(slots=True)
 class Frame:
     line_number: int
     just_executed: object
@@ -72,46 +113,93 @@ class Frame:
         return self.just_executed.get_parsing_metadata("checkpoint")  # type: ignore
 
 
-class RememberState:
-    STATE_LOADED_FROM_FILE = LoadedFromFile()
+STATE_LOADED_FROM_FILE = LoadedFromFile()
+
+
+class FrameBuilder:
+    """
+    Builds a Frame after each executed sentence. Only remembers the previous state, to
+    compute the diff.
+    """
 
     def __init__(self):
-        self.timeline = []
+        self.previous_state = None
 
     def __call__(self, last_sentence, state, expression_values):
-        if not self.timeline:
+        if self.previous_state is None:
             # only in the case that the first call is with last_sentence==None
             # we will asume that the state was loaded from a file
             if last_sentence is None:
-                last_sentence = self.STATE_LOADED_FROM_FILE
+                last_sentence = STATE_LOADED_FROM_FILE
             diff = StateDiff.create_diff(type(state)(), state)
+        elif state.write_log is None:
+            diff = StateDiff.create_diff(self.previous_state, state)
         else:
-            diff = StateDiff.create_diff(self.timeline[-1].state, state)
-        f = Frame(
-            last_sentence.line_number, last_sentence, deepcopy(state), expression_values, diff, None
+            touched = state.touched_cells()
+            diff = StateDiff.create_diff_from_log(
+                self.previous_state, state, touched, state.touched_paths()
+            )
+        if state.write_log is None:
+            # from now on, the state logs what's touched on each step
+            state.enable_write_log()
+        snapshot = state.snapshot()
+        self.previous_state = snapshot
+        return Frame(
+            last_sentence.line_number, last_sentence, snapshot, expression_values, diff, None
         )
-        if self.timeline:
-            self.timeline[-1].next = f
-        self.timeline.append(f)
+
+
+class Timeline:
+    # Queries over recorded frames. Subclasses implement iter_frames.
+
+    def iter_frames(self):
+        raise NotImplementedError
+
+    def iter_diffs(self):
+        # (line_number, diff, cells) for each frame, where cells maps the new & changed
+        # keys of the diff to their cells. Subclasses may yield them without building frames.
+        for frame in self.iter_frames():
+            keys = frame.diff.new_cells + frame.diff.changed_cells
+            yield frame.line_number, frame.diff, {key: frame.get_cell(key) for key in keys}
 
     def loaded_initial_snapshot(self):
-        if self.timeline and self.timeline[0].just_executed == self.STATE_LOADED_FROM_FILE:
-            return self.timeline[0]
+        first = next(iter(self.iter_frames()), None)
+        if first is not None and first.just_executed == STATE_LOADED_FROM_FILE:
+            return first
         else:
             return None
 
-    def list_declaration_snapshots(self):
-        return [
-            frame
-            for frame in self.timeline
-            if isinstance(frame.just_executed, (TypeDeclaration, VarDeclaration))
-        ]
+    def iter_declaration_snapshots(self):
+        for frame in self.iter_frames():
+            if isinstance(frame.just_executed, (TypeDeclaration, VarDeclaration)):
+                yield frame
 
-    def list_sentence_snapshots(self):
-        return [
-            frame
-            for frame in self.timeline
+    def iter_sentence_snapshots(self):
+        for frame in self.iter_frames():
             if not isinstance(
                 frame.just_executed, (TypeDeclaration, VarDeclaration, LoadedFromFile)
-            )
-        ]
+            ):
+                yield frame
+
+    def list_declaration_snapshots(self):
+        return list(self.iter_declaration_snapshots())
+
+    def list_sentence_snapshots(self):
+        return list(self.iter_sentence_snapshots())
+
+
+class RememberState(Timeline):
+    STATE_LOADED_FROM_FILE = STATE_LOADED_FROM_FILE
+
+    def __init__(self):
+        self.timeline = []
+        self.build_frame = FrameBuilder()
+
+    def __call__(self, last_sentence, state, expression_values):
+        f = self.build_frame(last_sentence, state, expression_values)
+        if self.timeline:
+            self.timeline[-1].next = f
+        self.timeline.append(f)
+
+    def iter_frames(self):
+        return iter(self.timeline)
@@ -7,6 +7,7 @@ from tomos.ui.colors import bcolors
 
 
 class ShowState:
+    needs_expression_values = False
 
     def __init__(self, filename, show_diff=True):
         self.filename = filename
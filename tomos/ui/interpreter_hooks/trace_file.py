@@ -0,0 +1,144 @@
+import pickle
+import struct
+
+from tomos.ayed2.ast.program import iter_program_sentences
+from tomos.ayed2.evaluation.memory import MemoryAddress
+from tomos.ayed2.evaluation.state import State
+from tomos.exceptions import TomosRuntimeError
+from tomos.ui.interpreter_hooks.remember_state import (
+    STATE_LOADED_FROM_FILE,
+    Frame,
+    FrameBuilder,
+    Timeline,
+)
+
+# Trace files are append-only: a header, followed by one record per frame.
+# Each record is a length prefix (unsigned 32 bits, little endian) and a pickle.
+TRACE_HEADER = b"TOMOS-TRACE\x01"
+LENGTH_PREFIX = struct.Struct("<I")
+
+LOADED_FROM_FILE_IDX = -1
+EXPRESSION_ATTRIBUTES = ["guard", "expr", "start", "end"]
+
+
+class ProgramIndex:
+    # Sentences and expressions are not pickled into the trace. They are referenced by
+    # their index on the program instead.
+
+    def __init__(self, program):
+        self.sentences = list(iter_program_sentences(program))
+        self.sentence_idx = {id(sent): idx for idx, sent in enumerate(self.sentences)}
+
+    def sentence_ref(self, sentence):
+        if sentence is STATE_LOADED_FROM_FILE:
+            return LOADED_FROM_FILE_IDX
+        return self.sentence_idx[id(sentence)]
+
+    def resolve_sentence(self, ref):
+        if ref == LOADED_FROM_FILE_IDX:
+            return STATE_LOADED_FROM_FILE
+        return self.sentences[ref]
+
+    def expression_refs(self, sentence, expression_values):
+        refs = {}
+        for attr in EXPRESSION_ATTRIBUTES:
+            expr = getattr(sentence, attr, None)
+            if expr is not None and expr in expression_values:
+                refs[attr] = expression_values[expr]
+        return refs
+
+    def resolve_expressions(self, sentence, refs):
+        return {getattr(sentence, attr): value for attr, value in refs.items()}
+
+
+class TraceWriter:
+    """
+    Interpreter post-hook that appends each frame to a trace file, as execution proceeds.
+    Only the cells on the diff of each frame are written, and nothing is kept in memory
+    but the previous state.
+    """
+
+    def __init__(self, path, program):
+        self.path = path
+        self.index = ProgramIndex(program)
+        self.build_frame = FrameBuilder()
+        self.file = open(path, "wb")
+        self.file.write(TRACE_HEADER)
+        self.frame_count = 0
+
+    def __call__(self, last_sentence, state, expression_values):
+        frame = self.build_frame(last_sentence, state, expression_values)
+        self.write_frame(frame)
+
+    def write_frame(self, frame):
+        cells = {key: frame.get_cell(key) for key in frame.diff.new_cells + frame.diff.changed_cells}
+        record = (
+            frame.line_number,
+            self.index.sentence_ref(frame.just_executed),
+            self.index.expression_refs(frame.just_executed, frame.expression_values),
+            frame.diff,
+            cells,
+        )
+        data = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+        self.file.write(LENGTH_PREFIX.pack(len(data)))
+        self.file.write(data)
+        self.frame_count += 1
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class TraceReader(Timeline):
+    """
+    Reads frames from a trace file lazily. Each time the frames are iterated, the file is
+    read again, so memory stays bounded regardless of the length of the trace.
+    Frame.state only holds the cells on the diff of the frame.
+    """
+
+    def __init__(self, path, program):
+        self.path = path
+        self.index = ProgramIndex(program)
+
+    def iter_records(self):
+        with open(self.path, "rb") as f:
+            if f.read(len(TRACE_HEADER)) != TRACE_HEADER:
+                raise TomosRuntimeError(f"{self.path} is not a trace file.")
+            while True:
+                prefix = f.read(LENGTH_PREFIX.size)
+                if len(prefix) < LENGTH_PREFIX.size:
+                    return  # end of file (or trace interrupted while writing)
+                (length,) = LENGTH_PREFIX.unpack(prefix)
+                data = f.read(length)
+                if len(data) < length:
+                    return
+                yield pickle.loads(data)
+
+    def build_frame(self, record):
+        line_number, sentence_ref, expression_refs, diff, cells = record
+        sentence = self.index.resolve_sentence(sentence_ref)
+        state = State()
+        for key, cell in cells.items():
+            if isinstance(key, MemoryAddress):
+                state.heap[key] = cell
+            else:
+                state.stack[key] = cell
+        expression_values = self.index.resolve_expressions(sentence, expression_refs)
+        return Frame(line_number, sentence, state, expression_values, diff, None)
+
+    def iter_frames(self):
+        # One frame is buffered, so "next" is filled before handing it out
+        previous = None
+        for record in self.iter_records():
+            frame = self.build_frame(record)
+            if previous is not None:
+                previous.next = frame
+                yield previous
+            previous = frame
+        if previous is not None:
+            yield previous
@@ -1,11 +1,13 @@
 from logging import getLogger
 from pathlib import Path
 import shutil
+import subprocess
 
-from moviepy.video.io import ImageSequenceClip
+from moviepy.config import FFMPEG_BINARY
 
 from tomos.ui.movie import configs
 from tomos.ui.movie.scene import TomosScene
+from tomos.ui.movie.sinks import DedupSink, PngFolderSink, VideoSink
 
 logger = getLogger(__name__)
 
@@ -16,39 +18,183 @@ else:
     FRAMES_PARENT_PATH = Path.cwd() / "output_tomos"
 
 
-def build_movie_from_file(source_code_path, movie_path, timeline, explicit_frames_only=False):
+def build_movie_from_file(
+    source_code_path,
+    movie_path,
+    timeline,
+    explicit_frames_only=False,
+    workers=1,
+    keep_frames=False,
+    dedup=True,
+    loop_compression=None,
+):
+    # Returns the number of frames that were not encoded (nor saved), given that they were
+    # identical to the previous one.
     frames_path = FRAMES_PARENT_PATH / Path(source_code_path).name
     source_code = open(source_code_path, "r").read()
-    build_movie_frames(source_code, timeline, frames_path, explicit_frames_only)
-    generate_mp4(frames_path, movie_path)
-    return
+    if workers > 1 or dedup:
+        # Workers can't share the encoder, and a piped encoder needs every frame (it encodes
+        # at constant frame rate). So frames are saved as files (repeated ones only once), and
+        # encoded later with their durations.
+        end_tick_id = build_movie_frames(
+            source_code,
+            timeline,
+            frames_path,
+            explicit_frames_only,
+            workers,
+            dedup,
+            loop_compression,
+        )
+        saved_frames = generate_mp4(frames_path, movie_path, end_tick_id)
+        if not keep_frames:
+            shutil.rmtree(frames_path)
+    else:
+        if not keep_frames:
+            frames_path = None
+        stream_movie(
+            source_code,
+            timeline,
+            movie_path,
+            frames_path,
+            explicit_frames_only,
+            loop_compression,
+        )
+        saved_frames = 0
+    logger.info(f"{saved_frames} repeated frames were deduplicated")
+    return saved_frames
 
 
-def build_movie_frames(code, timeline, frames_path, explicit_frames_only=False):
+def build_movie_frames(
+    code,
+    timeline,
+    frames_path,
+    explicit_frames_only=False,
+    workers=1,
+    dedup=False,
+    loop_compression=None,
+):
     frames_path = Path(frames_path)
     clean_folder(frames_path)
-    scene = TomosScene(code, timeline=timeline, output_path=frames_path)
+    extension = getattr(configs, "FRAME_FILE_FORMAT", "png")
+    sinks = [PngFolderSink(frames_path / "frames", extension)]
+    if dedup:
+        # duplicated frames are not saved. Gaps on the numbering are filled by generate_mp4
+        sinks = [DedupSink(sinks)]
+    scene = TomosScene(code, timeline=timeline, output_path=frames_path, sinks=sinks)
     logger.info(f"Rendering movie frames to {frames_path}")
-    return scene.render(explicit_frames_only=explicit_frames_only)
+    return scene.render(
+        explicit_frames_only=explicit_frames_only,
+        workers=workers,
+        loop_compression=loop_compression,
+    )
+
+
+def stream_movie(
+    code,
+    timeline,
+    movie_path,
+    frames_path=None,
+    explicit_frames_only=False,
+    loop_compression=None,
+):
+    # Frames are piped to the encoder as they are rendered, all of them (repeated ones too).
+    # Only saved as files as well if frames_path is given.
+    size = configs.CANVAS_SIZE
+    sinks = [
+        VideoSink(path, size, fps, **encoder_options()) for path, fps in movie_outputs(movie_path)
+    ]
+    if frames_path is not None:
+        frames_path = Path(frames_path)
+        clean_folder(frames_path)
+        extension = getattr(configs, "FRAME_FILE_FORMAT", "png")
+        sinks.append(PngFolderSink(frames_path / "frames", extension))
+    logger.info(f"Rendering movie to {movie_path}")
+    try:
+        scene = TomosScene(code, timeline=timeline, output_path=frames_path, sinks=sinks)
+        scene.render(
+            explicit_frames_only=explicit_frames_only, loop_compression=loop_compression
+        )
+    finally:
+        for sink in sinks:
+            sink.close()
+
+
+def movie_outputs(movie_path):
+    # Returns pairs (path, fps) of the movies to generate
+    movie_path = Path(movie_path)
+    fps = getattr(configs, "FPS", 1)
+    # hidden feature. fps can be a list, to create a several movie with different fps
+    if isinstance(fps, list):
+        return [(movie_path.with_suffix(f".{sub_fps}fps.mp4"), sub_fps) for sub_fps in fps]
+    return [(movie_path, fps)]
+
 
+def encoder_options():
+    return {
+        "bitrate": getattr(configs, "ENCODER_BITRATE", "5000k"),
+        "preset": getattr(configs, "ENCODER_PRESET", "medium"),
+    }
 
-def generate_mp4(frames_path, movie_path):
+
+def generate_mp4(frames_path, movie_path, end_tick_id=None):
+    # Frames are numbered by tick. A gap on the numbering means that the frame before it
+    # lasts several ticks (the ones not saved were identical). Each frame is encoded once,
+    # with its duration, via an ffmpeg concat list.
+    # Returns the number of ticks that had no frame saved.
     frames_folder = frames_path / "frames"
     extension = getattr(configs, "FRAME_FILE_FORMAT", "png")
-    image_files = [str(f) for f in sorted(frames_folder.glob("*." + extension))]
+    image_files = sorted(frames_folder.glob("*." + extension))
     if not image_files:
         logger.error(f"Unable to find any image in {frames_folder}")
         exit(0)
-    fps = getattr(configs, "FPS", 1)
-    # hidden feature. fps can be a list, to create a several movie with different fps
-    if isinstance(fps, list):
-        for sub_fps in fps:
-            clip = ImageSequenceClip.ImageSequenceClip(image_files, fps=sub_fps)
-            sub_movie_path = movie_path.with_suffix(f".{sub_fps}fps.mp4")
-            clip.write_videofile(sub_movie_path, codec="libx264", bitrate="5000k", audio=False)
-    else:
-        clip = ImageSequenceClip.ImageSequenceClip(image_files, fps=fps)
-        clip.write_videofile(movie_path, codec="libx264", bitrate="5000k", audio=False)
+    tick_ids = [int(f.stem) for f in image_files]
+    if end_tick_id is None:
+        end_tick_id = tick_ids[-1] + 1
+    durations = [b - a for a, b in zip(tick_ids, tick_ids[1:] + [end_tick_id])]
+    for path, fps in movie_outputs(movie_path):
+        concat_path = frames_folder / f"frames.{fps}fps.ffconcat"
+        write_concat_list(concat_path, image_files, [d / fps for d in durations])
+        encode_concat_list(concat_path, path, **encoder_options())
+    return sum(durations) - len(durations)
+
+
+def write_concat_list(concat_path, image_files, durations):
+    lines = ["ffconcat version 1.0"]
+    for image_file, duration in zip(image_files, durations):
+        lines.append(f"file '{image_file.name}'")
+        lines.append(f"duration {duration:.6f}")
+    # the last duration is only honored if the last file is repeated
+    lines.append(f"file '{image_files[-1].name}'")
+    concat_path.write_text("\n".join(lines) + "\n")
+
+
+def encode_concat_list(concat_path, movie_path, codec="libx264", bitrate="5000k", preset="medium"):
+    cmd = [
+        FFMPEG_BINARY,
+        "-y",
+        "-loglevel",
+        "error",
+        "-f",
+        "concat",
+        "-i",
+        str(concat_path),
+        "-vsync",
+        "vfr",
+        "-vcodec",
+        codec,
+        "-preset",
+        preset,
+        "-b:v",
+        bitrate,
+        # with b-frames, mp4 duration misses the last frame duration on variable frame rate
+        "-bf",
+        "0",
+    ]
+    width, height = configs.CANVAS_SIZE
+    if width % 2 == 0 and height % 2 == 0:
+        cmd.extend(["-pix_fmt", "yuv420p"])
+    cmd.append(str(movie_path))
+    subprocess.run(cmd, check=True)
 
 
 def clean_folder(folder_path):
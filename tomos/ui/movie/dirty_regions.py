@@ -0,0 +1,96 @@
+from math import ceil, floor
+
+from skitso.atom import Container
+from skitso.shapes import Arrow, ArrowTip, Line, Rectangle, Text
+
+from tomos.ui.movie import configs
+from tomos.ui.movie.panel.pointer_arrows import RoundChamfer
+
+
+# Extra pixels around computed boxes: outlines, line widths, antialiasing and rounding.
+MARGIN = 4
+
+
+class DirtyRegions:
+    # Collects the canvas areas that changed since the last frame was drawn.
+    # Boxes are (x0, y0, x1, y1) tuples, in canvas coordinates.
+
+    def __init__(self):
+        self.boxes = []
+        self.everything = True  # nothing drawn yet
+
+    def mark(self, sprite):
+        box = pixel_box(sprite)
+        if box is not None:
+            self.boxes.append(box)
+
+    def mark_box(self, box):
+        if box is not None:
+            self.boxes.append(box)
+
+    def mark_everything(self):
+        self.everything = True
+
+    def pop(self):
+        # Returns (everything, boxes), and starts collecting from scratch
+        result = self.everything, self.boxes
+        self.everything, self.boxes = False, []
+        return result
+
+
+def iter_leaves(item):
+    # Non-container elements, in the same order they are drawn
+    if isinstance(item, Container):
+        for child in item.iter_children():
+            yield from iter_leaves(child)
+    else:
+        yield item
+
+
+def union(boxes):
+    boxes = [box for box in boxes if box is not None]
+    if not boxes:
+        return None
+    return (
+        min(box[0] for box in boxes),
+        min(box[1] for box in boxes),
+        max(box[2] for box in boxes),
+        max(box[3] for box in boxes),
+    )
+
+
+def intersects(box, other):
+    return box[0] < other[2] and other[0] < box[2] and box[1] < other[3] and other[1] < box[3]
+
+
+def pixel_box(item):
+    # Box enclosing every pixel the item may paint. None if it paints nothing.
+    if isinstance(item, Container):
+        return union(pixel_box(leaf) for leaf in iter_leaves(item))
+    if isinstance(item, Arrow):
+        return union(pixel_box(part) for part in [item.line, item.tip, item.truncated_line])
+    if isinstance(item, RoundChamfer):
+        x, y = item.arc_center()
+        extra = item.radius + item.thickness
+        return expand((x, y, x, y), extra)
+    if isinstance(item, Line):
+        extra = item.thickness
+    elif isinstance(item, Rectangle):
+        extra = item.stroke_width or 0
+    elif isinstance(item, Text):
+        extra = configs.HIGHLIGHT_OUTLINE_WIDTH
+    elif isinstance(item, ArrowTip):
+        extra = 0
+    elif item is None:
+        return None
+    else:
+        # position & end are expected to enclose any other element (as CodeBox does)
+        extra = 0
+    start, end = item.position, item.end
+    return expand((start.x, start.y, end.x, end.y), extra)
+
+
+def expand(box, extra):
+    extra += MARGIN
+    x0, y0, x1, y1 = box
+    return (floor(x0 - extra), floor(y0 - extra), ceil(x1 + extra) + 1, ceil(y1 + extra) + 1)
@@ -0,0 +1,30 @@
+from tomos.ui.movie import configs
+
+# Configs that are multiplied by the draft SIZE_FACTOR
+SCALED_SIZES = ["CANVAS_SIZE", "MEMORY_BOARD_SIZE", "MEMORY_BOARD_DISPLACEMENT", "PADDING"]
+SCALED_WIDTHS = ["THICKNESS", "HIGHLIGHT_OUTLINE_WIDTH"]  # kept at least 1 pixel wide
+
+
+def apply_draft_profile():
+    # Overrides configs with the [DRAFT] ones. Shall be called before rendering starts.
+    settings = configs._settings
+    draft = dict(configs.DRAFT)
+    factor = draft.pop("SIZE_FACTOR", 1)
+    settings["SCALE"] = configs.SCALE * factor
+    for name in SCALED_SIZES:
+        settings[name] = scale(settings[name], factor)
+    settings["CANVAS_SIZE"] = [even(size) for size in settings["CANVAS_SIZE"]]
+    for name in SCALED_WIDTHS:
+        settings[name] = max(1, round(settings[name] * factor))
+    settings.update(draft)
+
+
+def scale(value, factor):
+    if isinstance(value, list):
+        return [scale(v, factor) for v in value]
+    return round(value * factor)
+
+
+def even(size):
+    # The encoder needs even sizes to use the usual pixel format (yuv420p)
+    return size + size % 2
@@ -0,0 +1,121 @@
+import json
+from math import isfinite
+from pathlib import Path
+
+from tomos.ayed2.ast.types import NullValue
+from tomos.ayed2.ast.types.enum import EnumConstant
+from tomos.ayed2.evaluation.memory import (
+    ArrayCellCluster,
+    MemoryAddress,
+    TupleCellCluster,
+    cell_at_path,
+)
+from tomos.ayed2.evaluation.unknown_value import UnknownValue
+
+here = Path(__file__).parent.resolve()
+TEMPLATE_PATH = here / "html_player.html"
+TRACE_PLACEHOLDER = "__TOMOS_TRACE__"
+
+STACK, HEAP = "s", "h"
+
+
+def build_html_from_file(source_code_path, html_path, timeline):
+    # Returns the number of steps on the exported trace
+    source_code = open(source_code_path, "r").read()
+    trace = build_trace(source_code, timeline, title=Path(source_code_path).name)
+    Path(html_path).write_text(render_html(trace), encoding="utf-8")
+    return len(trace["steps"])
+
+
+def render_html(trace):
+    # "<" is escaped, so nothing on the trace can close the script tag holding it
+    data = json.dumps(trace, separators=(",", ":")).replace("<", "\\u003c")
+    return TEMPLATE_PATH.read_text(encoding="utf-8").replace(TRACE_PLACEHOLDER, data)
+
+
+def build_trace(source_code, timeline, title=""):
+    """
+    The timeline as a stream of steps. Each step is [line_number, new, changed, deleted]:
+        new: [block, key, type, value] for each new cell.
+        changed: [block, key, path, value] for each changed cell, or sub-cell when only
+            some of them were written. Paths hold array indexes (one per axis) and field
+            names, and are empty for whole cells.
+        deleted: [block, key] for each deleted cell.
+    Block is "s" (stack) or "h" (heap). Heap keys are addresses. Values are JSON: arrays
+    are (nested) lists, tuples are objects, and pointers are {"@": address}.
+    """
+    steps = [encode_step(*diff) for diff in timeline.iter_diffs()]
+    return {"title": title, "code": source_code, "steps": steps}
+
+
+def encode_step(line_number, diff, cells):
+    new = [
+        [block_of(key), str(key), str(cells[key].var_type), encode_cell(cells[key])]
+        for key in diff.new_cells
+    ]
+    changed = []
+    for key in diff.changed_cells:
+        for path in diff.changed_paths.get(key, [()]):
+            sub_cell = cell_at_path(cells[key], path)
+            changed.append(
+                [block_of(key), str(key), encode_path(cells[key], path), encode_cell(sub_cell)]
+            )
+    deleted = [[block_of(key), str(key)] for key in diff.deleted_cells]
+    return [line_number, new, changed, deleted]
+
+
+def block_of(key):
+    return HEAP if isinstance(key, MemoryAddress) else STACK
+
+
+def encode_path(cell, path):
+    # Flattened indexes are turned into one index per axis, as arrays are encoded nested
+    encoded = []
+    for key in path:
+        if isinstance(cell, ArrayCellCluster):
+            encoded += unflatten(key, cell.array_type.shape())
+        else:
+            encoded.append(str(key))
+        cell = cell.sub_cells[key]
+    return encoded
+
+
+def unflatten(idx, shape):
+    indexes = []
+    for length in reversed(shape):
+        idx, position = divmod(idx, length)
+        indexes.insert(0, position)
+    return indexes
+
+
+def encode_cell(cell):
+    if isinstance(cell, ArrayCellCluster):
+        values = [encode_cell(sub_cell) for sub_cell in cell.sub_cells]
+        return reshape(values, cell.array_type.shape())
+    if isinstance(cell, TupleCellCluster):
+        return {str(name): encode_cell(sub_cell) for name, sub_cell in cell.sub_cells.items()}
+    return encode_value(cell.value)
+
+
+def reshape(values, shape):
+    if len(shape) == 1:
+        return values
+    n = len(values) // shape[0]
+    return [reshape(values[i * n : (i + 1) * n], shape[1:]) for i in range(shape[0])]
+
+
+def encode_value(value):
+    # Pointers are {"@": address} ("@" can't be a field name), unknown values are null
+    if isinstance(value, MemoryAddress):
+        return {"@": str(value)}
+    if isinstance(value, NullValue):
+        return {"@": None}
+    if value == UnknownValue:  # copied cells may hold copies of the singleton
+        return None
+    if isinstance(value, EnumConstant):
+        return value.name
+    if isinstance(value, float) and not isfinite(value):
+        return str(value)
+    if isinstance(value, (bool, int, float, str)):
+        return value
+    return str(value)
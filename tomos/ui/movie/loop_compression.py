@@ -0,0 +1,73 @@
+from tomos.ayed2.ast.sentences import For, If, While
+
+
+class SkippedIterations:
+    # Marks the frame summarizing the collapsed iterations of a loop
+
+    def __init__(self, loop, count):
+        self.loop = loop
+        self.count = count
+
+    def __str__(self):
+        return f"... {self.count} iterations of loop at line {self.loop.line_number} skipped ..."
+
+
+def nested_sentences(sentence):
+    if isinstance(sentence, If):
+        children = sentence.then_sentences + sentence.else_sentences
+    elif isinstance(sentence, (For, While)):
+        children = sentence.sentences
+    else:
+        children = []
+    for child in children:
+        yield child
+        yield from nested_sentences(child)
+
+
+def find_loop_runs(shots):
+    # Returns (loop, header_indexes) for each time a loop was run, where header_indexes
+    # are the positions on shots where the loop header was executed (once per
+    # iteration, plus the final one exiting the loop).
+    # A run ends when a shot is neither the loop header nor a sentence on its body.
+    bodies = {}
+    runs = []
+    in_progress = {}  # id(loop) -> (loop, header_indexes)
+    for i, shot in enumerate(shots):
+        sentence = shot.just_executed
+        for loop_id in list(in_progress):
+            if id(sentence) != loop_id and id(sentence) not in bodies[loop_id]:
+                runs.append(in_progress.pop(loop_id))
+        if isinstance(sentence, (For, While)):
+            if id(sentence) not in bodies:
+                bodies[id(sentence)] = {id(s) for s in nested_sentences(sentence)}
+            in_progress.setdefault(id(sentence), (sentence, []))[1].append(i)
+    runs.extend(in_progress.values())
+    return sorted(runs, key=lambda run: run[1][0])
+
+
+def compress_loops(shots, ticks, keep):
+    # Returns a copy of ticks where the iterations of each loop run, except the first and
+    # last "keep" ones, produce no frame. A single frame summarizes them instead, showing
+    # the state after the collapsed iterations.
+    # Nested loops are collapsed together with the iterations containing them.
+    candidates = []
+    for loop, headers in find_loop_runs(shots):
+        # iteration i goes from headers[i] until the next header (the last one, exiting
+        # the loop, is not an iteration)
+        iterations = len(headers) - 1
+        if iterations - 2 * keep < 2:
+            continue  # nothing worth collapsing
+        start, end = headers[keep], headers[iterations - keep]
+        candidates.append((start, end, SkippedIterations(loop, iterations - 2 * keep)))
+
+    # Collapsed ranges of nested loops are either disjoint or contained in one another
+    collapsed = []
+    for start, end, skipped in sorted(candidates, key=lambda c: (c[0], -c[1])):
+        if not collapsed or start >= collapsed[-1][1]:
+            collapsed.append((start, end, skipped))
+
+    ticks = list(ticks)
+    for start, end, skipped in collapsed:
+        ticks[start:end] = [False] * (end - start)
+        ticks[end - 1] = skipped
+    return ticks
@@ -10,6 +10,7 @@ from pygments.formatters import ImageFormatter
 from pygments_ayed2.style import Ayed2Style
 
 from tomos.ui.movie import configs
+from tomos.ui.movie.dirty_regions import DirtyRegions
 
 
 logger = getLogger(__name__)
@@ -63,41 +64,118 @@ class NextPrevLineFormatter(ImageFormatter):
 
 class CodeBox(BaseImgElem):
     line_pad = 2
+    # Set explicitly (as pygments defaults), since line geometry is computed from them
+    image_pad = 10
+    line_number_chars = 2
+    line_number_pad = 6
 
-    def __init__(self, source_code, language="ayed2", font_size=18, bg_color=None):
+    def __init__(self, source_code, language="ayed2", font_size=None, bg_color=None):
         self.source_code = source_code
         self.language = language
-        self.font_size = font_size
+        self.font_size = font_size or round(18 * configs.SCALE)
         self.bg_color = bg_color or configs.CODEBOX_BGCOLOR
         self.lexer = get_lexer_by_name(language)
         self.background = None
         self.next_line_nr = None
         self.prev_line_nr = None
+        # Source is highlighted only once: plain, and with every line marked as prev and
+        # as next line. Panels are composed from them, and cached by (prev, next) lines.
+        self.base_images = None
+        self.panels = {}
 
-    def highlight(self, code):
-        return Image.open(BytesIO(highlight(code, self.lexer, self.formatter)))
+    def highlight(self, code, formatter=None):
+        formatter = formatter or self.formatter
+        return Image.open(BytesIO(highlight(code, self.lexer, formatter)))
 
     def update_next_line_nr(self, line_nr):
         self.prev_line_nr = self.next_line_nr
         self.next_line_nr = line_nr
 
-    @property
-    def formatter(self):
+    def formatter_kwargs(self):
         kw = {
             "font_size": self.font_size,
             "line_pad": self.line_pad,
             "line_numbers": True,
-            "next_line_nr": self.next_line_nr,
-            "prev_line_nr": self.prev_line_nr,
+            "image_pad": self.image_pad,
+            "line_number_chars": self.line_number_chars,
+            "line_number_pad": self.line_number_pad,
         }
         if configs.CODEBOX_STYLE in ["ayed2", "ayed"]:
             style = Ayed2Style
             style.background_color = self.bg_color
             kw["style"] = style
-        return NextPrevLineFormatter(**kw)
+        return kw
+
+    @property
+    def formatter(self):
+        return NextPrevLineFormatter(
+            next_line_nr=self.next_line_nr,
+            prev_line_nr=self.prev_line_nr,
+            **self.formatter_kwargs(),
+        )
+
+    def build_base_images(self):
+        kw = self.formatter_kwargs()
+        plain_formatter = ImageFormatter(**kw)
+        plain = self.highlight(self.source_code, plain_formatter)
+        # Geometry of lines and their marks, as pygments draws them (out of the formatter
+        # options and its font metrics)
+        char_width, char_height = plain_formatter.fonts.get_char_size()
+        line_height = char_height + self.line_pad
+        self.lines_count = (plain.height - 2 * self.image_pad) // line_height
+        self.lines_y = [self.image_pad + i * line_height for i in range(self.lines_count)]
+        self.mark_height = line_height + 1
+        line_number_width = char_width * self.line_number_chars + 2 * self.line_number_pad
+        self.mark_x = self.image_pad + line_number_width - self.line_number_pad + 1
+        all_lines = list(range(1, self.lines_count + 1))
+        marked = {}
+        for which, color in [
+            (NextPrevLineFormatter._PREV, configs.CODEBOX_PREV_LINE_BGCOLOR),
+            (NextPrevLineFormatter._NEXT, configs.CODEBOX_NEXT_LINE_BGCOLOR),
+        ]:
+            formatter = ImageFormatter(hl_lines=all_lines, hl_color=color, **kw)
+            marked[which] = self.highlight(self.source_code, formatter)
+        self.base_images = plain, marked
+
+    def build_panel(self, prev_line_nr, next_line_nr):
+        if self.base_images is None:
+            self.build_base_images()
+        plain, marked = self.base_images
+        panel = plain.copy()
+        marks = [
+            (prev_line_nr, 0, NextPrevLineFormatter._PREV),
+            (next_line_nr, 1, NextPrevLineFormatter._NEXT),
+        ]
+        # As NextPrevLineFormatter does, marks are painted by ascending line number. If prev
+        # and next lines are the same, next is painted last (so it wins).
+        for line_nr, _, which in sorted(m for m in marks if m[0] is not None):
+            if not 1 <= line_nr <= self.lines_count:
+                continue
+            y = self.lines_y[line_nr - 1]
+            box = (self.mark_x, y, panel.width, min(y + self.mark_height, panel.height))
+            panel.paste(marked[which].crop(box), box[:2])
+        return panel
+
+    def get_panel(self):
+        key = (self.prev_line_nr, self.next_line_nr)
+        panel = self.panels.get(key)
+        if panel is None:
+            panel = self.panels[key] = self.build_panel(*key)
+        return panel
+
+    def line_box(self, line_nr):
+        # Canvas box where the line mark is painted. None if there's no such line.
+        if self.base_images is None:
+            self.build_base_images()
+        if line_nr is None or not 1 <= line_nr <= self.lines_count:
+            return None
+        x, y = round(self.position.x), round(self.position.y)  # as pasted by draw_me
+        plain, _ = self.base_images
+        line_y = y + self.lines_y[line_nr - 1]
+        return (x, line_y, x + plain.width, line_y + self.mark_height)
 
     def draw_me(self, pencil):
-        img = self.highlight(self.source_code)
+        img = self.get_panel()
         x, y = self.position
         pencil.image.paste(img, (round(x), round(y)))
 
@@ -105,18 +183,19 @@ class CodeBox(BaseImgElem):
     def end(self):
         if not hasattr(self, "position"):
             raise ValueError("Position not set")
-        if not hasattr(self, "relative_end"):
-            pass
-        tmp_img = self.highlight(self.source_code)
-        self.relative_end = Point(tmp_img.size[0], tmp_img.size[1])
+        if self.base_images is None:
+            self.build_base_images()
+        plain, _ = self.base_images
+        self.relative_end = Point(plain.size[0], plain.size[1])
         return self.position + self.relative_end
 
 
 class TomosCode(Container):
 
-    def __init__(self, source_code, language="ayed2"):
+    def __init__(self, source_code, language="ayed2", dirty_regions=None):
         position = Point(0, 0)
         super().__init__(position)
+        self.dirty_regions = dirty_regions or DirtyRegions()
         self.language = language
         self.source_code = source_code
         self.code_generator = CodeBox(source_code, language=language)
@@ -124,7 +203,11 @@ class TomosCode(Container):
         self.add(self.code_generator)
 
     def mark_next_line(self, line_number):
-        self.code_generator.update_next_line_nr(line_number)
+        # Marks of the previous lines are repainted, as well as the new one
+        box = self.code_generator
+        for line_nr in {box.prev_line_nr, box.next_line_nr, line_number}:
+            self.dirty_regions.mark_box(box.line_box(line_nr))
+        box.update_next_line_nr(line_number)
 
     def build_hint(self, msg):
         pass
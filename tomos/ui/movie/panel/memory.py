@@ -4,9 +4,11 @@ from skitso.atom import Container, Point
 from skitso import movement
 from skitso.shapes import Rectangle
 
+from tomos.ayed2.evaluation.memory import cell_at_path
 from tomos.ayed2.evaluation.state import MemoryAddress
 
 from tomos.ui.movie import configs
+from tomos.ui.movie.dirty_regions import DirtyRegions
 from tomos.ui.movie.texts import build_text
 from tomos.ui.movie.panel.vars import create_variable_sprite, HIGHLIGHTING_SWITCH, PointerVarSprite
 
@@ -14,12 +16,9 @@ from tomos.ui.movie.panel.vars import create_variable_sprite, HIGHLIGHTING_SWITC
 logger = getLogger(__name__)
 
 
-board_width, board_height = configs.MEMORY_BOARD_SIZE
-padding = configs.PADDING
-
-
 class Blackboard(Container):
     def __init__(self, name, x, y, fill_color, adjust_width=1.0):
+        board_width, board_height = configs.MEMORY_BOARD_SIZE
         self.name = name
         position = Point(x, y)
         super().__init__(position)
@@ -32,10 +31,12 @@ class Blackboard(Container):
             stroke_color="gray",
             stroke_width=3,
         )
+        self.rect.is_background = True
         self.add(self.rect)
         self.last_block = []
 
     def add_var(self, var):
+        padding = configs.PADDING
         var.to_edge(self, movement.LEFT_EDGE)
         if self.name == "heap":
             var.shift(movement.RIGHT * padding * 3)
@@ -58,8 +59,10 @@ class Blackboard(Container):
 
 class MemoryBlock(Container):
 
-    def __init__(self, uses_heap, pointers_heap_to_heap):
+    def __init__(self, uses_heap, pointers_heap_to_heap, dirty_regions=None):
         super().__init__(Point(0, 0))  # placed at origin. Will be shifted later.
+        # vars added, changed or deleted are marked as regions to redraw
+        self.dirty_regions = dirty_regions or DirtyRegions()
 
         self.uses_heap = uses_heap
         self.pointers_heap_to_heap = pointers_heap_to_heap
@@ -73,13 +76,17 @@ class MemoryBlock(Container):
             stack_adj = 1
             heap_adj = 1
 
-        title_size = configs.BASE_FONT_SIZE * 1.5
+        board_width = configs.MEMORY_BOARD_SIZE[0]
+        padding = configs.PADDING
+        title_size = configs.BASE_FONT_SIZE * configs.SCALE * 1.5
         font_color = configs.MEMORY_TITLE_FONT_COLOR
         stack_title = build_text("STACK", font_size=title_size, color=font_color)
+        stack_title.is_background = True
         self.add(stack_title)
         if self.uses_heap:
             heap_title = build_text("HEAP", font_size=title_size, color=font_color)
             heap_title.shift(movement.RIGHT * (board_width * stack_adj + padding))
+            heap_title.is_background = True
             self.add(heap_title)
 
         boards_y = stack_title.box_height + padding
@@ -110,7 +117,13 @@ class MemoryBlock(Container):
         for name_or_addr in snapshot.diff.changed_cells:
             logger.debug("Changing", name_or_addr)
             cell = snapshot.get_cell(name_or_addr)
-            self.set_value(name_or_addr, cell.value)
+            paths = snapshot.diff.changed_paths.get(name_or_addr)
+            if paths is None:
+                self.set_value(name_or_addr, cell.value)
+                continue
+            # only the changed elements are updated
+            for path in paths:
+                self.set_value(name_or_addr, cell_at_path(cell, path).value, path=path)
         for name_or_addr in snapshot.diff.deleted_cells:
             logger.debug("Deleting", name_or_addr)
             in_heap = isinstance(name_or_addr, MemoryAddress)
@@ -128,18 +141,24 @@ class MemoryBlock(Container):
             blackboard = self.stack_blackboard
         blackboard.add_var(var)
         self.vars_by_name[name] = var
+        self.dirty_regions.mark(var)
 
     def delete_var(self, name, in_heap):
         var = self.vars_by_name[name]
         self.vars_by_name.pop(name)
+        self.dirty_regions.mark(var)
         if in_heap:
             self.heap_blackboard.del_var(var)
         else:
             self.stack_blackboard.del_var(var)
 
-    def set_value(self, name, value):
-        var = self.vars_by_name[name]
-        var.set_value(value)
+    def set_value(self, name, value, path=()):
+        # path: of the sub-cell being set, if not setting the whole var
+        sprite = self.vars_by_name[name].sprite_at(path)
+        # new value may be smaller than the old one (or arrows may point elsewhere)
+        self.dirty_regions.mark(sprite)
+        sprite.set_value(value)
+        self.dirty_regions.mark(sprite)
 
     def load_initial_snapshot(self, snapshot):
         HIGHLIGHTING_SWITCH.turn_off()
@@ -148,8 +167,6 @@ class MemoryBlock(Container):
         PointerVarSprite.heap_arrow_manager.clear()
         for name_or_addr in snapshot.diff.new_cells:
             var = self.vars_by_name[name_or_addr]
-            # make sure ComposedSprite is refreshed
-            var.need_to_initialize_sub_sprites = True
             cell = snapshot.get_cell(name_or_addr)
-            var.set_value(cell.value)
+            var.refresh(cell.value)
         HIGHLIGHTING_SWITCH.turn_on()
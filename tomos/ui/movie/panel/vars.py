@@ -13,8 +13,6 @@ from tomos.ui.movie import configs
 from tomos.ui.movie.texts import build_text
 from tomos.ui.movie.panel.pointer_arrows import DeadArrow, NullArrow, HeapToHeapArrowManager
 
-thickness = configs.THICKNESS
-
 
 class Switch:
     def __init__(self):
@@ -35,6 +33,8 @@ class Switch:
 
 
 HIGHLIGHTING_SWITCH = Switch()
+# ColorAssigner consumes configs.UNNAMED_COLORS. Original list is kept to be able to reset it.
+INITIAL_UNNAMED_COLORS = list(configs.UNNAMED_COLORS)
 
 
 class ColorAssigner:
@@ -111,6 +111,23 @@ def create_variable_sprite(name, _type, value, vars_index, in_heap=False, mixin_
     return klass(name, _type, value, vars_index, in_heap)  # type: ignore
 
 
+def shown_value(value):
+    # Enum constants are shown (and compared) by their names
+    if isinstance(value, EnumConstant):
+        return value.name
+    return value
+
+
+def reset_sprites_globals():
+    # Sprites share some state at module & class level (colors consumed by types, the
+    # highlighting switch, arrows among heap vars). Resetting it allows to render a new
+    # scene from scratch on the same process.
+    ColorAssigner.cache = deepcopy(configs.COLOR_BY_TYPE)
+    configs.UNNAMED_COLORS[:] = INITIAL_UNNAMED_COLORS
+    HIGHLIGHTING_SWITCH.turn_on()
+    PointerVarSprite.heap_arrow_manager.clear()
+
+
 class SubVarMixin:
 
     def add_name_sprite(self, name):
@@ -189,8 +206,8 @@ class VariableSprite(Container):
         return rect
 
     def set_value(self, value):
-        if isinstance(value, EnumConstant):
-            value = value.name
+        value = shown_value(value)
+        self.value = value
         new_value_sprite = self.build_value_sprite(value)
         old_value_sprite = getattr(
             self, "value_sprite", None
@@ -202,6 +219,17 @@ class VariableSprite(Container):
             self.value_sprite.is_highlighted = True  # type: ignore
         self.add(self.value_sprite)
 
+    def refresh(self, value):
+        # Sets the value again, even if it's not changed
+        self.set_value(value)
+
+    def sprite_at(self, path):
+        # The sprite showing the sub-cell at path (as in cell_at_path)
+        sprite = self
+        for key in path:
+            sprite = sprite.subsprites[key]  # type: ignore
+        return sprite
+
     def build_value_sprite(self, value):
         value_sprite = build_text(str(value), highlightable=True)
         value_sprite.center_respect_to(self.rect)
@@ -240,22 +268,28 @@ class PointerVarSprite(VariableSprite):
     def tip_height(self):
         return 10 * configs.SCALE
 
+    @property
+    def thickness(self):
+        return configs.THICKNESS
+
     def build_dead_arrow(self):
         sp = self.arrow_start_point
         length = self.rect.box_height
-        return DeadArrow(sp.x, sp.y, length, self.tip_height, configs.DEAD_ARROW_COLOR, thickness)
+        return DeadArrow(sp.x, sp.y, length, self.tip_height, configs.DEAD_ARROW_COLOR, self.thickness)
 
     def build_null_arrow(self):
         sp = self.arrow_start_point
         half_height = self.rect.box_height / 2
-        return NullArrow(sp.x, sp.y, half_height, self.tip_height, self.arrow_color, thickness)
+        return NullArrow(
+            sp.x, sp.y, half_height, self.tip_height, self.arrow_color, self.thickness
+        )
 
     def build_arrow_to_var(self, var):
         x, y = self.arrow_start_point
         to_x, to_y = var.point_to_receive_arrow(heap_to_heap=self.in_heap)
         if self.in_heap:
             arrow = self.heap_arrow_manager.add_arrow(
-                x, y, to_x, to_y, self.arrow_color, thickness, self.tip_height
+                x, y, to_x, to_y, self.arrow_color, self.thickness, self.tip_height
             )
         else:
             arrow = Arrow(
@@ -264,7 +298,7 @@ class PointerVarSprite(VariableSprite):
                 to_x,
                 to_y,
                 color=self.arrow_color,
-                thickness=thickness,
+                thickness=self.thickness,
                 tip_height=self.tip_height,
             )
         return arrow
@@ -291,9 +325,10 @@ class ComposedSprite(VariableSprite):
     def __init__(self, name, _type, value, vars_index, in_heap=False):
         self.check_is_drawable(_type, value)
         self.length = len(value)
-        self.cached_value = deepcopy(value)
-        self.need_to_initialize_sub_sprites = True
+        self.initial_value = value  # sub-sprites are built with it
         super().__init__(name, _type, value, vars_index, in_heap=in_heap)
+        # sub-sprites were aligned after being built. Pointers arrows need to be redone.
+        self.refresh(value)
 
     def check_is_drawable(self, _type, value):
         raise NotImplementedError
@@ -332,14 +367,21 @@ class ComposedSprite(VariableSprite):
     def iterate_fields(self):
         raise NotImplementedError
 
+    def iterate_values(self, value):
+        # (field, sub-value) pairs of a value of this sprite
+        raise NotImplementedError
+
     def set_value(self, value):
-        # asumes that value is a dict
-        first_time = self.need_to_initialize_sub_sprites
-        for k, val in value.items():
-            if first_time or val != self.cached_value[k]:
-                self.subsprites[k].set_value(val)  # type: ignore
-                self.cached_value[k] = val
-        self.need_to_initialize_sub_sprites = False
+        # Only sub-sprites showing a different value are updated (and highlighted).
+        # When the changed sub-cells are known, prefer updating them with sprite_at.
+        for k, val in self.iterate_values(value):
+            sub_var = self.subsprites[k]
+            if isinstance(sub_var, ComposedSprite) or shown_value(val) != sub_var.value:
+                sub_var.set_value(val)
+
+    def refresh(self, value):
+        for k, val in self.iterate_values(value):
+            self.subsprites[k].refresh(val)
 
     def build_subsprites(self, x, y, vertical):
         self.subsprites = {}
@@ -348,7 +390,7 @@ class ComposedSprite(VariableSprite):
         max_start_x = 0
         next_x, next_y = x + self.margin, y + self.margin
         for i, (fname, ftype) in enumerate(self.iterate_fields()):
-            sub_value = self.cached_value[fname]
+            sub_value = self.initial_value[fname]
             sub_var = create_variable_sprite(
                 fname, ftype, sub_value, self.vars_index, in_heap=self.in_heap, mixin_to_use=SubVarMixin
             )
@@ -399,10 +441,6 @@ class ArraySprite(ComposedSprite):
         if shape[0] != len(value):
             raise CantDrawError(f"Cannot draw an array with shape '{shape}' and value '{value}'.")
 
-    def set_value(self, value):
-        as_dict = {i: v for i, v in enumerate(value)}
-        super().set_value(as_dict)
-
     def vertical_orientation(self):
         return configs.ARRAY_ORIENTATION == "vertical"
 
@@ -410,6 +448,9 @@ class ArraySprite(ComposedSprite):
         for i in range(self.length):
             yield i, self._type.of
 
+    def iterate_values(self, value):
+        return enumerate(value)
+
 
 class TupleSprite(ComposedSprite):
     # Assumptions:
@@ -438,3 +479,6 @@ class TupleSprite(ComposedSprite):
     def iterate_fields(self):
         for fname, ftype in self._type.fields_mapping.items():
             yield fname, ftype
+
+    def iterate_values(self, value):
+        return value.items()
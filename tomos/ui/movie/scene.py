@@ -1,13 +1,22 @@
+from itertools import chain
 from logging import getLogger
+import multiprocessing
 from os import getenv
+from pathlib import Path
 
+from PIL import Image, ImageDraw
 from skitso.scene import Scene
 from skitso import movement
 
 from tomos.ayed2.evaluation.state import MemoryAddress
 from tomos.ui.movie import configs
+from tomos.ui.movie.dirty_regions import DirtyRegions, intersects, iter_leaves, pixel_box
+from tomos.ui.movie.loop_compression import SkippedIterations, compress_loops
 from tomos.ui.movie.panel.code import TomosCode
 from tomos.ui.movie.panel.memory import MemoryBlock
+from tomos.ui.movie.panel.vars import HIGHLIGHTING_SWITCH, reset_sprites_globals
+from tomos.ui.movie.sinks import PngFolderSink
+from tomos.ui.movie.texts import HighlightableText, build_text
 
 logger = getLogger(__name__)
 STOP_AT = getenv("STOP_AT", "")
@@ -15,15 +24,22 @@ STOP_AT = getenv("STOP_AT", "")
 
 class TomosScene(Scene):
 
-    def __init__(self, source_code, timeline, output_path):
+    def __init__(self, source_code, timeline, output_path=None, sinks=None):
+        # Rendered frames are handed to sinks. By default, saved on output_path/frames
         self.source_code = source_code
         self.timeline = timeline
         self.uses_heap = False
         self.pointers_heap_to_heap = False
         self.extract_configs_from_timeline()
+        self.dirty_regions = DirtyRegions()
+        self.background = None  # canvas with the sprites that never change
+        self.highlighted_boxes = []
         super().__init__(configs.CANVAS_SIZE, output_path,
                          color=configs.CANVAS_COLOR,
                          file_extension=configs.FRAME_FILE_FORMAT)
+        if sinks is None:
+            sinks = [PngFolderSink(self.folder_path, self.file_extension)]
+        self.sinks = sinks
 
     def extract_configs_from_timeline(self):
         def check_cell_is_or_contains_pointer(cell):
@@ -35,7 +51,7 @@ class TomosScene(Scene):
                     scs = list(scs.values())
                 return any(check_cell_is_or_contains_pointer(sc) for sc in scs)
 
-        for snapshot in self.timeline.timeline:
+        for snapshot in self.timeline.iter_frames():
             for name_or_addr in snapshot.diff.new_cells:
                 if isinstance(name_or_addr, MemoryAddress):
                     self.uses_heap = True
@@ -45,21 +61,106 @@ class TomosScene(Scene):
                         return  # no need to continue
 
     def build_folder(self, base_folder_path):
-        # Removing "NameOfSceneClass" from folder path, which is added by skitso
-        from pathlib import Path
+        # Removing "NameOfSceneClass" from folder path, which is added by skitso.
+        # Folder is created by the sink saving frames there, if any.
+        if base_folder_path is None:
+            self.folder_path = None
+        else:
+            self.folder_path = Path(base_folder_path) / "frames"
 
-        self.folder_path = Path(base_folder_path) / "frames"
-        self.folder_path.mkdir(parents=True, exist_ok=True)
+    def tick(self):
+        # Same as skitso's tick, but frames are handed to sinks instead of saved to disk
+        everything, boxes = self.dirty_regions.pop()
+        leaves = list(iter_leaves(self))
+        # Highlighted texts fade on the next frame, so they'll need to be redrawn then
+        highlighted_boxes = [
+            pixel_box(leaf) for leaf in leaves if getattr(leaf, "is_highlighted", False)
+        ]
+        if everything or not configs.DIRTY_REGION_RENDERING:
+            self.draw_everything(leaves)
+        else:
+            self.draw_regions(leaves, boxes + self.highlighted_boxes + highlighted_boxes)
+        self.highlighted_boxes = highlighted_boxes
+        image = self.image
+        if self.antialias:
+            size = (self.width * 2, self.height * 2)
+            image = image.resize(size, resample=Image.Resampling.LANCZOS)
+            image = image.resize((self.width, self.height), resample=Image.Resampling.LANCZOS)
+        for sink in self.sinks:
+            sink.write(image, self.next_tick_id)
+        self.next_tick_id += 1
 
-    def render(self, explicit_frames_only):
-        memory_block = MemoryBlock(self.uses_heap, self.pointers_heap_to_heap)
+    def draw_everything(self, leaves):
+        self.create_canvas()
+        for item in self.iter_children():
+            item.draw_me(self.draw)
+        if configs.DIRTY_REGION_RENDERING:
+            self.background = self.new_image()
+            pencil = self.new_pencil(self.background)
+            for leaf in leaves:
+                if getattr(leaf, "is_background", False):
+                    leaf.draw_me(pencil)
+
+    def draw_regions(self, leaves, boxes):
+        # The canvas of the previous frame is kept, and only the given boxes are redrawn:
+        # sprites overlapping them are drawn on a scratch canvas, and the boxes are copied
+        # from it. If background sprites are the first ones drawn on every box, the
+        # scratch canvas starts as the cached background and they are not drawn again.
+        leaves_boxes = [pixel_box(leaf) for leaf in leaves]
+        in_background = [getattr(leaf, "is_background", False) for leaf in leaves]
+        clipped_boxes = []
+        to_draw = set()
+        reuse_background = True
+        for x0, y0, x1, y1 in boxes:
+            box = (max(x0, 0), max(y0, 0), min(x1, self.width), min(y1, self.height))
+            if box[0] >= box[2] or box[1] >= box[3]:
+                continue
+            overlapping = [
+                i
+                for i, leaf_box in enumerate(leaves_boxes)
+                if leaf_box is not None and intersects(box, leaf_box)
+            ]
+            flags = [in_background[i] for i in overlapping]
+            reuse_background = reuse_background and flags == sorted(flags, reverse=True)
+            clipped_boxes.append(box)
+            to_draw.update(overlapping)
+        if not clipped_boxes:
+            return
+
+        if reuse_background:
+            scratch = self.background.copy()
+            to_draw = {i for i in to_draw if not in_background[i]}
+        else:
+            scratch = self.new_image()
+        pencil = self.new_pencil(scratch)
+        for i in sorted(to_draw):
+            leaves[i].draw_me(pencil)
+        for box in clipped_boxes:
+            self.image.paste(scratch.crop(box), box[:2])
+
+    def new_image(self):
+        return Image.new("RGB", (self.width, self.height), self.color)
+
+    def new_pencil(self, image):
+        # Set up as skitso does for the canvas
+        pencil = ImageDraw.Draw(image)
+        pencil.image = image  # type: ignore
+        pencil.fontmode = "L"
+        return pencil
+
+    def build_panels(self):
+        # Adds memory & code panels, with the loaded state and declarations already processed
+        self.dirty_regions = DirtyRegions()
+        memory_block = MemoryBlock(
+            self.uses_heap, self.pointers_heap_to_heap, dirty_regions=self.dirty_regions
+        )
         memory_block.z_index = 1
         self.add(memory_block)
         memory_block.shift(movement.RIGHT * (self.width / 2))
         if configs.MEMORY_BOARD_DISPLACEMENT:
             memory_block.shift(movement.RIGHT * configs.MEMORY_BOARD_DISPLACEMENT)
 
-        code_block = TomosCode(self.source_code)
+        code_block = TomosCode(self.source_code, dirty_regions=self.dirty_regions)
         code_block.center_respect_to(self)
         code_block.to_edge(self, movement.LEFT_EDGE)
         code_block.shift(movement.RIGHT * (configs.PADDING))
@@ -69,12 +170,34 @@ class TomosScene(Scene):
         if loaded:
             memory_block.load_initial_snapshot(loaded)
 
-        shots_declarations = self.timeline.list_declaration_snapshots()
-        for shot in shots_declarations:
+        for shot in self.timeline.iter_declaration_snapshots():
             memory_block.process_snapshot(shot)
-        shots_sentences = self.timeline.list_sentence_snapshots()
-        if shots_sentences:
-            code_block.mark_next_line(shots_sentences[0].line_number)
+        return memory_block, code_block
+
+    def render(self, explicit_frames_only, workers=1, loop_compression=None):
+        # loop_compression: if set, only the first and last loop_compression iterations of
+        # each loop are shown. A single frame summarizes the ones in between.
+        if workers > 1:
+            if "fork" not in multiprocessing.get_all_start_methods():
+                logger.warning("Parallel rendering is not supported on this platform.")
+            elif not all(sink.forkable for sink in self.sinks):
+                logger.warning("Parallel rendering needs frames to be saved as files.")
+            else:
+                return self.render_in_parallel(explicit_frames_only, workers, loop_compression)
+        if loop_compression is not None:
+            # loops are detected looking ahead, so shots can't be consumed one at a time
+            shots = self.list_shots()
+            ticks = self.plan_ticks(shots, explicit_frames_only, loop_compression)
+            self.render_chunk(shots, ticks, 0, len(shots))
+            return self.next_tick_id
+
+        memory_block, code_block = self.build_panels()
+        # Timelines may be read from disk. Frames are consumed one at a time.
+        shots_sentences = self.timeline.iter_sentence_snapshots()
+        first_shot = next(shots_sentences, None)
+        if first_shot is not None:
+            code_block.mark_next_line(first_shot.line_number)
+            shots_sentences = chain([first_shot], shots_sentences)
         # Initial tick. Empty canvas (or with imported state if loaded from file).
         self.tick()
 
@@ -96,3 +219,134 @@ class TomosScene(Scene):
 
         number_of_generated_frames = self.next_tick_id
         return number_of_generated_frames
+
+    def list_shots(self):
+        shots = self.timeline.list_sentence_snapshots()
+        if STOP_AT.isdigit():
+            shots = shots[: int(STOP_AT) + 1]
+        return shots
+
+    def plan_ticks(self, shots, explicit_frames_only, loop_compression=None):
+        # For each shot, whether a frame is drawn after processing it (a SkippedIterations
+        # if it's the frame summarizing collapsed loop iterations)
+        ticks = [not explicit_frames_only or bool(shot.explicit_checkpoint) for shot in shots]
+        if loop_compression is not None:
+            ticks = compress_loops(shots, ticks, loop_compression)
+        return ticks
+
+    def render_in_parallel(self, explicit_frames_only, workers, loop_compression=None):
+        # Shots are split in chunks, rendered by worker processes. Each worker replays
+        # (without drawing) the shots previous to its chunk, so sprites are the same as
+        # when rendering serially. Frames are numbered as if rendered serially.
+        global PARALLEL_JOB
+        shots = self.list_shots()
+        ticks = self.plan_ticks(shots, explicit_frames_only, loop_compression)
+        chunks = plan_chunks(ticks, workers * CHUNKS_PER_WORKER)
+        PARALLEL_JOB = (self, shots, ticks)
+        try:
+            # fork: workers inherit the scene and the shots, nothing is pickled
+            with multiprocessing.get_context("fork").Pool(workers) as pool:
+                for first, last in pool.imap_unordered(render_chunk, chunks):
+                    logger.info(f"Rendered snapshots {first} to {last - 1}")
+        finally:
+            PARALLEL_JOB = None
+        # initial and final ticks, plus one per ticked shot
+        self.next_tick_id = 1 + 2 + count_ticks(ticks)
+        return self.next_tick_id
+
+    def render_chunk(self, shots, ticks, first, last):
+        # Renders shots[first:last] (and the initial/final ticks, if it's the first/last chunk)
+        reset_sprites_globals()
+        self.children = []
+        memory_block, code_block = self.build_panels()
+        if shots:
+            code_block.mark_next_line(shots[0].line_number)
+        if first == 0:
+            self.next_tick_id = 1
+            self.tick()
+        else:
+            # Shots up to the last ticked one (before the chunk) are replayed with no
+            # highlighting. The ones after it are replayed highlighting, given that their
+            # changes are accumulated to be seen on the first frame of the chunk.
+            resume = first
+            while resume > 0 and not ticks[resume - 1]:
+                resume -= 1
+            HIGHLIGHTING_SWITCH.turn_off()
+            self.replay(shots[:resume], memory_block, code_block)
+            HIGHLIGHTING_SWITCH.turn_on()
+            self.discard_highlights()  # declarations were shown on the initial tick
+            self.replay(shots[resume:first], memory_block, code_block)
+            self.next_tick_id = 2 + count_ticks(ticks[:first])
+
+        for shot, tick in zip(shots[first:last], ticks[first:last]):
+            memory_block.process_snapshot(shot)
+            code_block.mark_next_line(getattr(shot.next, "line_number", None))
+            if isinstance(tick, SkippedIterations):
+                self.summary_tick(tick)
+            elif tick:
+                self.tick()
+        if last == len(shots):
+            self.tick()
+
+    def summary_tick(self, skipped):
+        # Frame with a caption telling how many iterations were collapsed
+        caption = build_text(str(skipped), color=configs.HIGHLIGHT_COLOR)
+        caption.to_edge(self, movement.BOTTOM_EDGE)
+        caption.to_edge(self, movement.LEFT_EDGE)
+        caption.shift(movement.RIGHT * configs.PADDING)
+        caption.shift(movement.UP * configs.PADDING)
+        self.add(caption)
+        self.dirty_regions.mark(caption)
+        self.tick()
+        self.remove(caption)
+        self.dirty_regions.mark(caption)
+
+    def replay(self, shots, memory_block, code_block):
+        for shot in shots:
+            memory_block.process_snapshot(shot)
+            code_block.mark_next_line(getattr(shot.next, "line_number", None))
+
+    def discard_highlights(self):
+        # Same effect on highlighted texts as drawing them
+        if not configs.AUTO_DE_HIGHLIGHT:
+            return
+        pending = list(self.children)
+        while pending:
+            item = pending.pop()
+            if isinstance(item, HighlightableText):
+                item.is_highlighted = False
+            pending.extend(getattr(item, "children", []))
+
+
+PARALLEL_JOB = None
+CHUNKS_PER_WORKER = 2
+
+
+def render_chunk(chunk):
+    # Runs on a worker process (forked, so PARALLEL_JOB is inherited)
+    scene, shots, ticks = PARALLEL_JOB  # type: ignore
+    first, last = chunk
+    scene.render_chunk(shots, ticks, first, last)
+    return first, last
+
+
+def count_ticks(ticks):
+    return sum(1 for tick in ticks if tick)
+
+
+def plan_chunks(ticks, n_chunks):
+    # Splits shots in up to n_chunks contiguous (first, last) ranges, with similar amounts
+    # of frames to draw. The first chunk is always there, given that it draws the
+    # initial tick (and the final one too, if it's the only chunk).
+    total = count_ticks(ticks)
+    n_chunks = max(1, min(n_chunks, total))
+    chunks = []
+    first = 0
+    drawn = 0
+    for i, tick in enumerate(ticks):
+        drawn += bool(tick)
+        if len(chunks) < n_chunks - 1 and drawn * n_chunks >= total * (len(chunks) + 1):
+            chunks.append((first, i + 1))
+            first = i + 1
+    chunks.append((first, len(ticks)))
+    return chunks
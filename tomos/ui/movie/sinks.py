@@ -0,0 +1,86 @@
+from hashlib import blake2b
+from pathlib import Path
+
+from moviepy.video.io.ffmpeg_writer import FFMPEG_VideoWriter
+
+
+class PngFolderSink:
+    # Saves each frame as a numbered image file. Several processes can write to the
+    # same folder, given that each one writes its own frames.
+    forkable = True
+
+    def __init__(self, folder_path, file_extension="png"):
+        self.folder_path = Path(folder_path)
+        self.folder_path.mkdir(parents=True, exist_ok=True)
+        self.file_extension = file_extension
+
+    def write(self, image, tick_id):
+        path = self.folder_path / f"{tick_id:08}.{self.file_extension}"
+        image.save(path, subsampling=0, quality=95)
+
+    def repeat(self, tick_id):
+        # Nothing to save. The gap on the numbering tells how long the previous frame lasts.
+        pass
+
+    def close(self):
+        pass
+
+
+class VideoSink:
+    # Pipes raw RGB frames to an ffmpeg process, which encodes them on the fly.
+    # Frames must be written in order.
+    forkable = False
+
+    def __init__(self, movie_path, size, fps, codec="libx264", bitrate="5000k", preset="medium"):
+        self.movie_path = Path(movie_path)
+        self.writer = FFMPEG_VideoWriter(
+            str(movie_path), size, fps, codec=codec, preset=preset, bitrate=bitrate
+        )
+        self.frame_count = 0
+
+    def write(self, image, tick_id):
+        # PIL images in RGB mode dump their raw pixels with tobytes, as ffmpeg expects
+        self.writer.write_frame(image)
+        self.last_image = image.copy()  # the scene keeps drawing on its canvas
+        self.frame_count += 1
+
+    def repeat(self, tick_id):
+        # Encoding at constant frame rate, so the previous frame is piped again
+        self.writer.write_frame(self.last_image)
+        self.frame_count += 1
+
+    def close(self):
+        self.writer.close()
+
+
+class DedupSink:
+    # Passes frames to sinks, except when a frame is identical to the previous one.
+    # In such case, sinks are asked to repeat their previous frame instead.
+
+    def __init__(self, sinks):
+        self.sinks = sinks
+        self.forkable = all(sink.forkable for sink in sinks)
+        self.last_tick_id = None
+        self.last_digest = None
+        self.duplicates = 0
+
+    def write(self, image, tick_id):
+        digest = blake2b(image.tobytes(), digest_size=16).digest()
+        # When rendering in parallel, ticks may come in chunks. Only consecutive ones are
+        # compared.
+        is_duplicate = digest == self.last_digest and tick_id == self.last_tick_id + 1
+        self.last_tick_id, self.last_digest = tick_id, digest
+        if is_duplicate:
+            self.repeat(tick_id)
+            return
+        for sink in self.sinks:
+            sink.write(image, tick_id)
+
+    def repeat(self, tick_id):
+        self.duplicates += 1
+        for sink in self.sinks:
+            sink.repeat(tick_id)
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
@@ -1,17 +1,46 @@
 import re
 
 
+CAMEL_TO_SNAKE = re.compile(r"(?<=[a-z])(?=[A-Z])|(?<=[A-Z])(?=[A-Z][a-z])")
+
+
 class VisitError(Exception):
     pass
 
 
 class NodeVisitor:
+    # Dispatching is cached at two levels, both built lazily:
+    #  - per visitor class, node type -> visit method name (see get_visit_name)
+    #  - per visitor instance, node type -> bound handler (see get_handler)
 
     def get_visit_name_from_type(self, _type):
         # Transforms CammelCase to snake_case, and preppends "visit_"
         name = _type.__name__
-        pattern = re.compile(r"(?<=[a-z])(?=[A-Z])|(?<=[A-Z])(?=[A-Z][a-z])")
-        return "visit_" + pattern.sub("_", name).lower()
+        return "visit_" + CAMEL_TO_SNAKE.sub("_", name).lower()
+
+    def get_visit_name(self, _type):
+        klass = type(self)
+        names = klass.__dict__.get("_visit_names")
+        if names is None:
+            # Each visitor class owns its cache, given that subclasses may override
+            # get_visit_name_from_type
+            names = {}
+            setattr(klass, "_visit_names", names)
+        name = names.get(_type)
+        if name is None:
+            name = names[_type] = self.get_visit_name_from_type(_type)
+        return name
+
+    def get_handler(self, _type):
+        try:
+            return self._handlers[_type]
+        except AttributeError:
+            self._handlers = {}
+        except KeyError:
+            pass
+        handler = getattr(self, self.get_visit_name(_type), self.generic_visit)
+        self._handlers[_type] = handler
+        return handler
 
     def visit(self, node, *args, **kwargs):
         if hasattr(node, "children"):
@@ -20,9 +49,7 @@ class NodeVisitor:
             children = []
         kwargs["children"] = children
 
-        custom_visit_method = self.get_visit_name_from_type(type(node))
-        method = getattr(self, custom_visit_method, self.generic_visit)
-        return method(node, *args, **kwargs)
+        return self.get_handler(type(node))(node, *args, **kwargs)
 
     def generic_visit(self, node, *args, **kwargs):
         raise VisitError(f"No behaviour defined for {node} ({type(node)})")